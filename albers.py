@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+# Ellipsoidal Albers equal-area conic (Snyder, Map Projections: A Working
+# Manual, pp. 101-102) over whole coordinate arrays at once. conus_albers is
+# EPSG:5070, NAD83 / Conus Albers; the 860M coordinates are NAD83, so no
+# datum shift is needed.
+
+
+@dataclass(frozen=True)
+class AlbersEqualArea:
+    # Degrees and metres; the ellipsoid defaults to GRS 1980
+    standard_parallel_1: float
+    standard_parallel_2: float
+    latitude_of_origin: float
+    central_meridian: float
+    false_easting: float = 0.0
+    false_northing: float = 0.0
+    semi_major_axis: float = 6378137.0
+    inverse_flattening: float = 298.257222101
+
+    def __post_init__(self):
+        flattening = 1 / self.inverse_flattening
+        e2 = flattening * (2 - flattening)
+        object.__setattr__(self, "_e2", e2)
+        object.__setattr__(self, "_e", np.sqrt(e2))
+        phi1, phi2, phi0 = np.radians(
+            [
+                self.standard_parallel_1,
+                self.standard_parallel_2,
+                self.latitude_of_origin,
+            ]
+        )
+        m1, m2 = self._m(phi1), self._m(phi2)
+        q1, q2, q0 = self._q(phi1), self._q(phi2), self._q(phi0)
+        n = (m1**2 - m2**2) / (q2 - q1) if phi1 != phi2 else np.sin(phi1)
+        c = m1**2 + n * q1
+        object.__setattr__(self, "_n", n)
+        object.__setattr__(self, "_c", c)
+        object.__setattr__(
+            self, "_rho0", self.semi_major_axis * np.sqrt(c - n * q0) / n
+        )
+
+    def _m(self, phi):
+        return np.cos(phi) / np.sqrt(1 - self._e2 * np.sin(phi) ** 2)
+
+    def _q(self, phi):
+        e, sin_phi = self._e, np.sin(phi)
+        return (1 - self._e2) * (
+            sin_phi / (1 - self._e2 * sin_phi**2)
+            - np.log((1 - e * sin_phi) / (1 + e * sin_phi)) / (2 * e)
+        )
+
+    def forward(self, longitude, latitude):
+        # Projected x and y of every longitude/latitude pair, NaN in, NaN out
+        longitude = np.asarray(longitude, dtype=np.float64)
+        latitude = np.asarray(latitude, dtype=np.float64)
+        rho = (
+            self.semi_major_axis
+            * np.sqrt(self._c - self._n * self._q(np.radians(latitude)))
+            / self._n
+        )
+        theta = self._n * np.radians(
+            (longitude - self.central_meridian + 180) % 360 - 180
+        )
+        return (
+            self.false_easting + rho * np.sin(theta),
+            self.false_northing + self._rho0 - rho * np.cos(theta),
+        )
+
+
+conus_albers = AlbersEqualArea(29.5, 45.5, 23.0, -96.0)
+
+
+def projection_error(x, y, longitude, latitude, transform) -> float:
+    # Largest distance, in metres, between projected coordinates and
+    # transform's (longitude arrays, latitude arrays) -> (x, y) of the same
+    # points, ignoring rows with no coordinates
+    expected_x, expected_y = transform(
+        np.asarray(longitude, dtype=np.float64), np.asarray(latitude, dtype=np.float64)
+    )
+    distance = np.hypot(np.asarray(x) - expected_x, np.asarray(y) - expected_y)
+    distance = distance[~np.isnan(distance)]
+    return float(distance.max()) if len(distance) else 0.0
@@ -0,0 +1,498 @@
+import argparse
+import json
+import math
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from builds import (
+    CENTROID_YEARS,
+    TEMPORAL_YEARS,
+    bivariate_capacity_fields,
+    bivariate_layer_name,
+    bivariate_pairs,
+    build_centroids,
+    build_grid,
+    build_hex_layers,
+    build_subregions,
+    build_temporal,
+    region_tables,
+)
+from eia860m import CACHE_DIR
+from generator_table import SUMS_GROUP, GeneratorPoints, hex_layer_names
+from generator_types import energy_source_code, statuses
+from gpkg_reader import FeatureTable, GpkgReader
+from hex_grid import conus_grid
+from hex_layers import capacity_field
+from instrumentation import run_report
+from parallel import WORKERS
+from subregion_metrics import capacity_metrics, included_points, metric_masks
+from synthetic_860m import REAL_ROWS, synthetic_generators, synthetic_regions
+from timeline import (
+    coalesce,
+    generator_months,
+    out_of_service_status,
+    out_of_service_year,
+    temporal_layer_name,
+)
+
+# Times every build at several multiples of the real 860M row count, on
+# synthetic generators (see synthetic_860m.py), and checks what each build
+# wrote against a plain recomputation from the same points. Those checks
+# share the engines in timeline.py and hex_grid.py with the builds; the
+# engines themselves are pinned by test_timeline.py and test_hex_grid.py.
+# Compared with a saved run, it flags the stages that got slower.
+# `python benchmark.py` runs 1x, 10x and 100x; 100x needs a few GB of memory.
+
+BENCHMARK_DIR = os.path.join(CACHE_DIR, "benchmarks")
+SCALES = [1, 10, 100]
+# How much slower than the baseline a stage may run before it's flagged,
+# and the least slowdown worth flagging at all
+TOLERANCE = 0.25
+MIN_SLOWDOWN = 0.1
+# The temporal layer is checked at every CHECK_EVERY'th month
+CHECK_EVERY = 6
+
+stage_names = ["grid", "hex", "temporal", "centroids", "subregions"]
+
+
+@contextmanager
+def working_directory(path: str):
+    # The builds write legends beside their outputs, relative to here
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def build_all(
+    points: GeneratorPoints,
+    regions: Dict[str, FeatureTable],
+    directory: str,
+    workers: int = WORKERS,
+) -> Dict[str, float]:
+    # Runs each build into directory, one after another, and returns how
+    # many seconds each took
+    paths = output_paths(directory)
+    builds: Dict[str, Callable[[], object]] = {
+        "grid": lambda: build_grid(points.x, points.y, paths["grid"]),
+        "hex": lambda: build_hex_layers(points, paths["hex"], workers),
+        "temporal": lambda: build_temporal(
+            points, paths["hex"], cube_path=paths["cube"]
+        ),
+        "centroids": lambda: build_centroids(points, paths["hex"], workers=workers),
+        "subregions": lambda: build_subregions(points, regions, paths["sums"]),
+    }
+    seconds = {}
+    with working_directory(directory):
+        for name in stage_names:
+            start = time.perf_counter()
+            builds[name]()
+            seconds[name] = time.perf_counter() - start
+    return seconds
+
+
+def output_paths(directory: str) -> Dict[str, str]:
+    return {
+        "grid": os.path.join(directory, "Grid.gpkg"),
+        "hex": os.path.join(directory, "hex.gpkg"),
+        "cube": os.path.join(directory, "capacity_cube.bin"),
+        "sums": os.path.join(directory, "sums.gpkg"),
+    }
+
+
+# Each check recomputes an output the obvious way, straight from the points,
+# and returns what differs from what the build wrote
+
+
+def _group_totals(keys, weights):
+    # Distinct keys, and the count and weight total of each
+    keys, index = np.unique(keys, return_inverse=True)
+    index = index.reshape(-1)
+    return (
+        keys,
+        np.bincount(index, minlength=len(keys)),
+        np.bincount(index, weights=weights, minlength=len(keys)),
+    )
+
+
+def check_grid(points: GeneratorPoints, path: str) -> List[str]:
+    cell_ids = conus_grid.cell_ids(points.x, points.y)
+    with GpkgReader(path) as reader:
+        written = reader.columns("Grid", ["id"])["id"]
+    if not np.array_equal(np.sort(written), np.unique(cell_ids[cell_ids >= 0])):
+        return ["Grid: occupied cells differ"]
+    return []
+
+
+def check_hex(points: GeneratorPoints, path: str) -> List[str]:
+    failures = []
+    cell_ids = conus_grid.cell_ids(points.x, points.y)
+    inside = cell_ids >= 0
+    status = points.status.decode()
+    count_field, sum_field = f"{capacity_field}_count", f"{capacity_field}_sum"
+    with GpkgReader(path) as reader:
+        layers = set(reader.layers())
+        for group, name in hex_layer_names().items():
+            keep = inside
+            if group != SUMS_GROUP:
+                generator_index, status_index = divmod(group - 1, len(statuses))
+                keep = (
+                    inside
+                    & (points.generator == generator_index)
+                    & (status == statuses[status_index])
+                )
+            cells, count, total = _group_totals(cell_ids[keep], points.capacity[keep])
+            if name not in layers:
+                if len(cells):
+                    failures.append(f"{name}: layer missing")
+                continue
+            written = reader.columns(name, ["id", count_field, sum_field])
+            if not np.array_equal(written["id"], cells):
+                failures.append(f"{name}: cells differ")
+            elif not np.array_equal(written[count_field], count):
+                failures.append(f"{name}: counts differ")
+            elif not np.allclose(written[sum_field], total, rtol=1e-9, atol=1e-6):
+                failures.append(f"{name}: capacities differ")
+
+        generator_names = [generator.name for generator in energy_source_code]
+        for x_name, y_name in bivariate_pairs:
+            name = bivariate_layer_name(x_name, y_name)
+            x_field, y_field = bivariate_capacity_fields(x_name, y_name)
+            x_type, y_type = generator_names.index(x_name), generator_names.index(
+                y_name
+            )
+            keep = inside & np.isin(points.generator, [x_type, y_type])
+            cells, _, x_total = _group_totals(
+                cell_ids[keep],
+                np.where(points.generator[keep] == x_type, points.capacity[keep], 0),
+            )
+            _, _, y_total = _group_totals(
+                cell_ids[keep],
+                np.where(points.generator[keep] == y_type, points.capacity[keep], 0),
+            )
+            if name not in layers:
+                if len(cells):
+                    failures.append(f"{name}: layer missing")
+                continue
+            written = reader.columns(name, ["id", x_field, y_field])
+            if not np.array_equal(written["id"], cells):
+                failures.append(f"{name}: cells differ")
+            elif not (
+                np.allclose(written[x_field], x_total, rtol=1e-9, atol=1e-6)
+                and np.allclose(written[y_field], y_total, rtol=1e-9, atol=1e-6)
+            ):
+                failures.append(f"{name}: capacities differ")
+    return failures
+
+
+def check_temporal(points: GeneratorPoints, path: str, years=TEMPORAL_YEARS):
+    # Every cell and energy source's capacity at a sample of months, from the
+    # generators active then, against the intervals covering those months
+    min_year, max_year = years
+    n_months = (max_year - min_year + 1) * 12
+    included, _, start, end = generator_months(points, min_year, n_months)
+    cell_ids = conus_grid.cell_ids(points.x, points.y)
+    rows = np.flatnonzero(included & (cell_ids >= 0))
+    n_sources = len(energy_source_code)
+
+    with GpkgReader(path) as reader:
+        intervals = f"{temporal_layer_name}_intervals"
+        if intervals not in reader.layers():
+            intervals = temporal_layer_name
+        written = reader.columns(
+            intervals,
+            ["cell_id", "start_date", "end_date", "energy_source", "capacity_mw"],
+        )
+    source_index = {generator.name: i for i, generator in enumerate(energy_source_code)}
+    written_key = written["cell_id"].astype(np.int64) * n_sources + np.array(
+        [source_index[name] for name in written["energy_source"]], dtype=np.int64
+    )
+    written_start, written_end = (
+        np.array(
+            [(int(date[:4]) - min_year) * 12 + int(date[5:7]) - 1 for date in dates],
+            dtype=np.int64,
+        )
+        for dates in (written["start_date"], written["end_date"])
+    )
+
+    failures = []
+    for month in range(0, n_months, CHECK_EVERY):
+        active = rows[(start[rows] <= month) & (end[rows] > month)]
+        keys, _, expected = _group_totals(
+            cell_ids[active] * n_sources + points.generator[active],
+            points.capacity[active],
+        )
+        covering = (written_start <= month) & (written_end >= month)
+        got_keys, got_count, got = _group_totals(
+            written_key[covering], written["capacity_mw"][covering]
+        )
+        # Rounding in the running sums can leave dust where a step emptied
+        kept = got > 1e-6
+        date = f"{min_year + month // 12}-{month % 12 + 1:02d}"
+        if (got_count > 1).any():
+            failures.append(f"{temporal_layer_name}: overlapping intervals in {date}")
+        elif not np.array_equal(got_keys[kept], keys):
+            failures.append(f"{temporal_layer_name}: cells differ in {date}")
+        elif not np.allclose(got[kept], expected, rtol=1e-9, atol=1e-6):
+            failures.append(f"{temporal_layer_name}: capacities differ in {date}")
+    return failures
+
+
+def check_centroids(points: GeneratorPoints, path: str, years=CENTROID_YEARS):
+    # Each energy type's national capacity and weighted centroid by year
+    min_year, max_year = years
+    start_year = coalesce(
+        points.numeric("Operating Year"),
+        points.numeric("Planned Operation Year"),
+        np.full(len(points), max_year),
+    )
+    retirement_year = coalesce(
+        points.numeric("Retirement Year"), points.numeric("Planned Retirement Year")
+    )
+    out_of_service = points.status.decode() == out_of_service_status
+
+    with GpkgReader(path) as reader:
+        written = reader.columns(
+            "weighted_centroids",
+            ["energy_type", "year", "total_capacity", "avg_x", "avg_y"],
+            where="WHERE group_type = 'total'",
+        )
+    rows = {
+        (energy, int(year)): (capacity, x, y)
+        for energy, year, capacity, x, y in zip(
+            written["energy_type"],
+            written["year"],
+            written["total_capacity"],
+            written["avg_x"],
+            written["avg_y"],
+        )
+    }
+
+    failures = []
+    for year in range(min_year, max_year + 1):
+        with np.errstate(invalid="ignore"):
+            active = (start_year <= year) & ~(retirement_year <= year)
+        if year == out_of_service_year:
+            active &= ~out_of_service
+        for i, generator in enumerate(energy_source_code):
+            keep = active & (points.generator == i)
+            capacity = points.capacity[keep].sum()
+            found = rows.pop((generator.name, year), None)
+            if capacity <= 0:
+                if found is not None:
+                    failures.append(
+                        f"weighted_centroids: extra {generator.name} {year}"
+                    )
+                continue
+            expected = (
+                capacity,
+                (points.capacity[keep] * points.x[keep]).sum() / capacity,
+                (points.capacity[keep] * points.y[keep]).sum() / capacity,
+            )
+            if found is None:
+                failures.append(f"weighted_centroids: no {generator.name} {year}")
+            elif not (
+                math.isclose(found[0], expected[0], rel_tol=1e-9, abs_tol=1e-6)
+                # Within a metre
+                and np.allclose(found[1:], expected[1:], rtol=0, atol=1.0)
+            ):
+                failures.append(f"weighted_centroids: {generator.name} {year} differs")
+    failures += [f"weighted_centroids: extra {energy} {year}" for energy, year in rows]
+    return failures
+
+
+def check_subregions(
+    points: GeneratorPoints, regions: Dict[str, FeatureTable], path: str
+) -> List[str]:
+    # Every capacity metric of every region
+    included = included_points(points)
+    masks = metric_masks(points)
+    failures = []
+    with GpkgReader(path) as reader:
+        for region, table in region_tables.items():
+            codes = points.categorical(table["generator_field"])
+            labels = [str(label or "").strip() for label in codes.labels]
+            written = reader.columns(table["name"], [table["key"]] + capacity_metrics)
+            if len(written[table["key"]]) != len(regions[region].rows):
+                failures.append(f"{table['name']}: regions differ")
+                continue
+            for name in capacity_metrics:
+                keep = included & masks[name]
+                totals = np.bincount(
+                    codes.codes[keep],
+                    weights=points.capacity[keep],
+                    minlength=len(labels),
+                )
+                by_label = {}
+                for label, total in zip(labels, totals):
+                    by_label[label] = by_label.get(label, 0.0) + total
+                expected = [
+                    by_label.get(str(key or "").strip(), 0.0)
+                    for key in written[table["key"]]
+                ]
+                if not np.allclose(written[name], expected, rtol=1e-9, atol=1e-6):
+                    failures.append(f"{table['name']}: {name} differs")
+    return failures
+
+
+def check_all(
+    points: GeneratorPoints, regions: Dict[str, FeatureTable], directory: str
+) -> Dict[str, List[str]]:
+    paths = output_paths(directory)
+    return {
+        "grid": check_grid(points, paths["grid"]),
+        "hex": check_hex(points, paths["hex"]),
+        "temporal": check_temporal(points, paths["hex"]),
+        "centroids": check_centroids(points, paths["hex"]),
+        "subregions": check_subregions(points, regions, paths["sums"]),
+    }
+
+
+def run_scale(
+    scale: int,
+    rows: int = REAL_ROWS,
+    seed: int = 0,
+    workers: int = WORKERS,
+    repeat: int = 1,
+    check: bool = True,
+) -> dict:
+    # Best time of each build over repeat runs at scale times rows, and what
+    # the checks found
+    start = time.perf_counter()
+    points = synthetic_generators(rows * scale, seed)
+    regions = synthetic_regions()
+    generated = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory(prefix="grid-batteries-benchmark-") as scratch:
+        directory = os.path.join(scratch, "out")
+        os.makedirs(directory)
+        # Where the time inside each build went, beside the results
+        with run_report(f"benchmark-{scale}x", BENCHMARK_DIR, summary=False):
+            runs = [
+                build_all(points, regions, directory, workers) for _ in range(repeat)
+            ]
+        failures = check_all(points, regions, directory) if check else {}
+    return {
+        "rows": len(points),
+        "generate": generated,
+        "seconds": {name: min(run[name] for run in runs) for name in stage_names},
+        "failures": failures,
+    }
+
+
+def regressions(results: dict, baseline: dict, tolerance: float = TOLERANCE):
+    # Stages slower than in the baseline run at the same scale
+    slower = []
+    for scale, result in results["scales"].items():
+        before = baseline.get("scales", {}).get(scale)
+        if before is None or before["rows"] != result["rows"]:
+            continue
+        for name, seconds in result["seconds"].items():
+            previous = before["seconds"].get(name)
+            if (
+                previous
+                and seconds > previous * (1 + tolerance)
+                and seconds - previous > MIN_SLOWDOWN
+            ):
+                slower.append(
+                    f"{name} at {scale}x: {seconds:.2f}s, was {previous:.2f}s"
+                )
+    return slower
+
+
+def print_report(results: dict):
+    scales = results["scales"]
+    print(
+        f"{'scale':>6} {'rows':>10} "
+        + " ".join(f"{name:>11}" for name in stage_names)
+        + "  checks"
+    )
+    for scale, result in scales.items():
+        failed = sum(len(found) for found in result["failures"].values())
+        print(
+            f"{scale + 'x':>6} {result['rows']:>10} "
+            + " ".join(f"{result['seconds'][name]:>10.2f}s" for name in stage_names)
+            + ("  failed" if failed else "  ok" if result["failures"] else "  -")
+        )
+    # How time grows with rows from each scale to the next: 1 is linear
+    ordered = sorted(scales, key=int)
+    for low, high in zip(ordered, ordered[1:]):
+        growth = math.log(scales[high]["rows"] / scales[low]["rows"])
+        print(
+            f"{low}x to {high}x, time ~ rows^k, k = "
+            + ", ".join(
+                f"{name} {math.log(scales[high]['seconds'][name] / scales[low]['seconds'][name]) / growth:.2f}"
+                for name in stage_names
+            )
+        )
+    for scale, result in scales.items():
+        for name, found in result["failures"].items():
+            for failure in found:
+                print(f"check failed at {scale}x, {name}: {failure}")
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(
+        description="Time every build on synthetic 860M-shaped generators at "
+        "several scales and check the outputs"
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES)
+    parser.add_argument(
+        "--rows", type=int, default=REAL_ROWS, help="rows at 1x, the real count"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="runs per scale, keeping the best"
+    )
+    parser.add_argument("--no-check", action="store_true")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--output", help="where to save these results")
+    args = parser.parse_args(argv)
+
+    results = {
+        "rows": args.rows,
+        "seed": args.seed,
+        "workers": args.workers,
+        "scales": {},
+    }
+    for scale in sorted(args.scales):
+        print(f"{scale}x: {args.rows * scale} generators")
+        results["scales"][str(scale)] = run_scale(
+            scale, args.rows, args.seed, args.workers, args.repeat, not args.no_check
+        )
+    print_report(results)
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    slower = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"slower than {args.baseline}: {line}")
+    failed = any(
+        found
+        for result in results["scales"].values()
+        for found in result["failures"].values()
+    )
+    if failed or slower:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
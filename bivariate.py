@@ -0,0 +1,288 @@
+from html import escape
+from typing import List, Sequence
+
+import numpy as np
+
+from classify import ckmeans_breaks
+
+# Bivariate choropleth classes: each variable cut into classes, and every
+# feature coded y_class * x_classes + x_class. The 3 x 3 palette is the one
+# the hand-made legends used; other sizes blend its four corners.
+
+# Rows from low to high y, columns from low to high x
+palette_3x3 = [
+    ["#e8e8e8", "#ace4e4", "#5ac8c8"],
+    ["#dfb0d6", "#a5add3", "#5698b9"],
+    ["#be64ac", "#8c62aa", "#3b4994"],
+]
+class_names = {2: ["Low", "High"], 3: ["Low", "Medium", "High"]}
+
+
+def bivariate_palette(y_classes: int, x_classes: int) -> List[List[str]]:
+    if (y_classes, x_classes) == (3, 3):
+        return [list(row) for row in palette_3x3]
+    corners = np.array(
+        [
+            [_rgb(palette_3x3[0][0]), _rgb(palette_3x3[0][2])],
+            [_rgb(palette_3x3[2][0]), _rgb(palette_3x3[2][2])],
+        ]
+    )
+    palette = []
+    for row in range(y_classes):
+        v = row / max(y_classes - 1, 1)
+        low, high = corners[0] * (1 - v) + corners[1] * v
+        palette.append(
+            [
+                "#%02x%02x%02x"
+                % tuple(np.rint(low * (1 - u) + high * u).astype(int).tolist())
+                for u in np.linspace(0, 1, x_classes)
+            ]
+        )
+    return palette
+
+
+def _rgb(color: str) -> np.ndarray:
+    return np.array([int(color[i : i + 2], 16) for i in (1, 3, 5)], dtype=float)
+
+
+def class_breaks(
+    values, classes: int, method: str = "quantile", zero_floor: bool = False
+) -> np.ndarray:
+    # classes + 1 edges, smallest value first. "quantile" puts about the same
+    # number of features in each class, "jenks" uses the optimal 1-D breaks.
+    # With zero_floor the breaks come from the positive values only and zeros
+    # join the lowest class, so features lacking one variable don't swamp it.
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if zero_floor and (values > 0).any():
+        breaks = class_breaks(values[values > 0], classes, method)
+        breaks[0] = min(breaks[0], values.min())
+        return breaks
+    if method == "jenks":
+        return ckmeans_breaks(values, classes)
+    if method != "quantile":
+        raise ValueError(f"Unknown classification method {method!r}")
+    if len(values) == 0:
+        return np.empty(0)
+    breaks = np.unique(np.quantile(values, np.linspace(0, 1, classes + 1)))
+    # Tied quantiles merge classes, but there's always at least one
+    return breaks if len(breaks) > 1 else np.repeat(breaks, 2)
+
+
+def classify(values, breaks) -> np.ndarray:
+    # Class of each value, upper edges inclusive as in QGIS' graduated
+    # ranges; -1 for NaN
+    values = np.asarray(values, dtype=np.float64)
+    classes = np.searchsorted(np.asarray(breaks)[1:-1], values, side="left")
+    return np.where(np.isnan(values), -1, classes)
+
+
+def bivariate_classes(
+    x, y, x_classes=3, y_classes=3, method="quantile", zero_floor=False
+):
+    # Bivariate code of every feature (-1 where either value is missing),
+    # and the x and y breaks behind them
+    x_breaks = class_breaks(x, x_classes, method, zero_floor)
+    y_breaks = class_breaks(y, y_classes, method, zero_floor)
+    x_class, y_class = classify(x, x_breaks), classify(y, y_breaks)
+    codes = np.where(
+        (x_class >= 0) & (y_class >= 0),
+        y_class * (len(x_breaks) - 1) + x_class,
+        -1,
+    )
+    return codes, x_breaks, y_breaks
+
+
+def cell_pair_values(cell_ids, generator, capacity, x_type: int, y_type: int):
+    # Cells holding either generator type, and each type's capacity in them
+    keep = (cell_ids >= 0) & np.isin(generator, [x_type, y_type])
+    cells, index = np.unique(cell_ids[keep], return_inverse=True)
+    index, kept_generator = index.reshape(-1), generator[keep]
+    return (
+        cells,
+        np.bincount(
+            index,
+            weights=np.where(kept_generator == x_type, capacity[keep], 0),
+            minlength=len(cells),
+        ),
+        np.bincount(
+            index,
+            weights=np.where(kept_generator == y_type, capacity[keep], 0),
+            minlength=len(cells),
+        ),
+    )
+
+
+def _class_labels(breaks, value_format: str) -> List[str]:
+    names = class_names.get(len(breaks) - 1)
+    ranges = [
+        f"{value_format.format(lower)}–{value_format.format(upper)}"
+        for lower, upper in zip(breaks[:-1], breaks[1:])
+    ]
+    if names is None:
+        return ranges
+    return [f"{name} ({span})" for name, span in zip(names, ranges)]
+
+
+def category_labels(
+    x_breaks, y_breaks, x_title: str, y_title: str, value_format: str = "{:.3g}"
+) -> List[str]:
+    # Legend text of every bivariate code, in code order
+    x_labels = _class_labels(x_breaks, value_format)
+    y_labels = _class_labels(y_breaks, value_format)
+    return [
+        f"{y_title} {y_label} / {x_title} {x_label}"
+        for y_label in y_labels
+        for x_label in x_labels
+    ]
+
+
+_legend_style = """\
+      body {
+        font-family: 'Open Sans', sans-serif;
+        margin: 0;
+        padding: %(padding)s;%(font)s
+      }
+      table {
+        border-collapse: collapse;
+        margin: %(margin)s;
+        table-layout: %(layout)s;
+      }
+      .legend-cell {
+        width: %(cell)s;
+        height: %(cell)s;
+        text-align: center;
+        color: white;
+        text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.7);
+        font-weight: 400;
+        border: 1px dashed %(border)s;
+      }
+      .axis-label {
+        text-align: center;
+        padding: 2px;
+      }
+      td.vertical-text {
+        width: 1em;
+        position: relative;
+        vertical-align: middle;
+      }
+      .vertical-text div {
+        position: absolute;
+        top: 50%%;
+        left: 50%%;
+        transform: translate(-50%%, -50%%) rotate(-90deg);
+        white-space: nowrap;
+        width: max-content;
+        text-align: center;
+      }"""
+
+
+def legend_html(
+    palette: Sequence[Sequence[str]],
+    x_breaks,
+    y_breaks,
+    x_title: str,
+    y_title: str,
+    compact: bool = False,
+    value_format: str = "{:.3g}",
+) -> str:
+    # The full legend (x along the top, y down the side, low first, every
+    # cell named) or the compact one (high y at the top, x along the bottom,
+    # like little-bivariate.html), with each class's value range
+    x_labels = [escape(label) for label in _class_labels(x_breaks, value_format)]
+    y_labels = [escape(label) for label in _class_labels(y_breaks, value_format)]
+    x_title, y_title = escape(x_title), escape(y_title)
+    n_x = len(x_labels)
+
+    def cell(row, col):
+        return (
+            f'<td class="legend-cell" style="background-color: {palette[row][col]}">'
+            "</td>"
+        )
+
+    rows = []
+    if compact:
+        style = _legend_style % dict(
+            padding="4px",
+            font="\n        font-size: 8pt;",
+            margin="0",
+            layout="fixed",
+            cell="30px",
+            border="#666",
+        )
+        rows.append(
+            "<tr>"
+            + "<td></td>" * (n_x + 1)
+            + f'<td rowspan="{len(y_labels) + 2}" class="vertical-text">'
+            f"<div>{y_title}</div></td></tr>"
+        )
+        for row in reversed(range(len(y_labels))):
+            rows.append(
+                "<tr>"
+                + "".join(cell(row, col) for col in range(n_x))
+                + f'<td class="axis-label">{y_labels[row]}</td></tr>'
+            )
+        rows.append(
+            "<tr>"
+            + "".join(f'<td class="axis-label">{label}</td>' for label in x_labels)
+            + "<td></td></tr>"
+        )
+        rows.append(
+            f'<tr><td colspan="{n_x}" class="axis-label">{x_title} →</td>'
+            "<td></td></tr>"
+        )
+    else:
+        style = _legend_style % dict(
+            padding="10px",
+            font="\n        font-size: 12px;",
+            margin="10px",
+            layout="auto",
+            cell="60px",
+            border="black",
+        )
+        rows.append(
+            f'<tr><td></td><td></td><td colspan="{n_x}" class="axis-label">'
+            f"{x_title} →</td></tr>"
+        )
+        rows.append(
+            "<tr><td></td><td></td>"
+            + "".join(f'<td class="axis-label">{label}</td>' for label in x_labels)
+            + "</tr>"
+        )
+        rows.append(
+            f'<tr><td rowspan="{len(y_labels) + 1}" class="vertical-text">'
+            f"<div>← {y_title}</div></td></tr>"
+        )
+        for row in range(len(y_labels)):
+            rows.append(
+                f'<tr><td class="axis-label">{y_labels[row]}</td>'
+                + "".join(cell(row, col) for col in range(n_x))
+                + "</tr>"
+            )
+
+    body = "\n".join(f"      {row}" for row in rows)
+    return (
+        "<!DOCTYPE html>\n<html>\n  <head>\n    <style>\n"
+        f"{style}\n    </style>\n  </head>\n  <body>\n    <table>\n"
+        f"{body}\n    </table>\n  </body>\n</html>\n"
+    )
+
+
+def write_legends(
+    path: str,
+    compact_path: str,
+    palette,
+    x_breaks,
+    y_breaks,
+    x_title,
+    y_title,
+    **kwargs,
+):
+    for legend_path, compact in ((path, False), (compact_path, True)):
+        if legend_path:
+            with open(legend_path, "w", encoding="utf-8") as f:
+                f.write(
+                    legend_html(
+                        palette, x_breaks, y_breaks, x_title, y_title, compact, **kwargs
+                    )
+                )
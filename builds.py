@@ -0,0 +1,861 @@
+import argparse
+import os
+import threading
+from dataclasses import asdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bivariate import (
+    bivariate_classes,
+    bivariate_palette,
+    cell_pair_values,
+    write_legends,
+)
+from capacity_cube import write_step_cube
+from centroid_groups import centroid_layers
+from eia860m import CACHE_DIR, WORKBOOK_PATH, cache_path, file_digest, projected_points
+from generator_table import (
+    SUMS_GROUP,
+    GeneratorPoints,
+    hex_layer_group,
+    hex_layer_groups,
+    hex_layer_names,
+)
+from generator_types import energy_source_code, statuses
+from gpkg_reader import FeatureTable, GpkgReader, polygon_rings
+from gpkg_writer import GpkgWriter, polygon_wkb, ring_envelopes
+from hex_binning import summarize_by_cell_partitioned
+from hex_grid import CONUS_EXTENT, HexGrid, conus_grid
+from hex_layers import write_cell_layer
+from hex_pyramid import summarize_pyramid
+from incremental import release_digest, save_snapshot, snapshot_fields
+from instrumentation import run_report, span, traced
+from parallel import WORKERS
+from pipeline import (
+    Pipeline,
+    Stage,
+    classification_fields,
+    generator_values,
+)
+from progress import report_progress
+from subregion_metrics import capacity_metrics, fraction_metrics, subregion_metrics
+from timeline import (
+    cell_source_steps,
+    generator_months,
+    interval_rows,
+    temporal_fields,
+    temporal_layer_name,
+)
+from validation import QUARANTINE_GPKG, PolygonIndex, quarantine_points
+
+# Every output of the pipeline as a function of the generator points (and,
+# for the subregions, the region polygons), with no QGIS involved. The
+# console scripts call these and then only style and register the layers;
+# `python builds.py` runs them headless, straight from the 860M workbook.
+
+GRID_GPKG = "../Grid.gpkg"
+HEX_GPKG = "../hex.gpkg"
+SUMS_GPKG = "../sums.gpkg"
+# Dense month x cell x energy source capacity alongside the temporal layer,
+# None to skip it
+CUBE_PATH = "../capacity_cube.bin"
+LEGEND_DIR = "../legends"
+# The generator release the outputs were built from, for incremental_update.py
+SNAPSHOT_PATH = "../generators_snapshot.npz"
+
+# Years the animation covers, January of the first through December of the
+# last
+TEMPORAL_YEARS = (2017, 2028)
+# Store each cell's hexagon once and join it to the intervals through a view,
+# rather than repeating the hexagon on every interval
+NORMALIZED = True
+CENTROID_YEARS = (2018, 2028)
+# Also write a month-by-month centroid layer alongside the yearly one
+MONTHLY_CENTROIDS = True
+# Grid sizes the MAUP sweep compares, in metres (EPSG:5070)
+SWEEP_SPACINGS = [10000, 20000, 40000, 80000, 160000]
+
+# Generator types mapped against each other cell by cell, as (x, y) names,
+# each cut into classes ("quantile" or "jenks")
+bivariate_pairs = [("Solar", "BESS"), ("Wind", "BESS")]
+bivariate_classes_per_axis = 3
+bivariate_method = "quantile"
+
+region_tables = {
+    "state": {
+        "key": "STUSPS",
+        "generator_field": "Plant State",
+        "name": "subregion_metrics_by_state",
+    },
+    "ba": {
+        "key": "EIACode",
+        "generator_field": "Balancing Authority Code",
+        "name": "subregion_metrics_by_ba",
+    },
+}
+# Generator fields the subregion metrics need
+subregion_point_fields = [
+    "Balancing Authority Code",
+    "Plant State",
+    "Retirement Year",
+]
+
+# Bivariate maps of one metric against another. Each region's features are
+# cut into classes of both and coded in the wide table, and the renderer and
+# legends are built from those same breaks.
+subregion_bivariates = {
+    "ba": {
+        "field": "bivariate_battery_renewables",
+        "x": "renewables_fraction",
+        "y": "battery_fraction",
+        "x_title": "Intermittent Resources",
+        "y_title": "Battery Capacity",
+        "classes": 3,
+        # "quantile" or "jenks"
+        "method": "quantile",
+        "display": "Battery and Intermittent Resources by Balancing Authority",
+    },
+    "state": {
+        "field": "bivariate_battery_renewables",
+        "x": "renewables_fraction",
+        "y": "battery_fraction",
+        "x_title": "Intermittent Resources",
+        "y_title": "Battery Capacity",
+        "classes": 3,
+        "method": "quantile",
+        "display": "Battery and Intermittent Resources by State",
+    },
+}
+
+
+@traced
+def build_grid(x, y, path: str = GRID_GPKG, grid: HexGrid = conus_grid) -> str:
+    # Polygons only for the cells that hold a generator, straight from the
+    # projected coordinates, instead of gridding the whole extent and then
+    # extracting the cells that contain a point
+    cell_ids = grid.cell_ids(x, y)
+    occupied = np.unique(cell_ids[cell_ids >= 0])
+    if os.path.exists(path):
+        os.remove(path)
+    # The writer builds the spatial index as it closes
+    with GpkgWriter(path) as writer:
+        uri = write_cell_layer(writer, "Grid", grid, occupied)
+    return uri
+
+
+def bivariate_layer_name(x_name: str, y_name: str) -> str:
+    return f"bivariate_{x_name}_{y_name}".lower().replace(" ", "_")
+
+
+def bivariate_capacity_fields(x_name: str, y_name: str) -> Tuple[str, str]:
+    return f"{x_name} capacity (MW)", f"{y_name} capacity (MW)"
+
+
+def hex_bivariate_classes(x_capacity, y_capacity):
+    return bivariate_classes(
+        x_capacity,
+        y_capacity,
+        bivariate_classes_per_axis,
+        bivariate_classes_per_axis,
+        bivariate_method,
+        # Most cells hold only one of the two types
+        zero_floor=True,
+    )
+
+
+def bivariate_legend_paths(name: str) -> Tuple[str, str]:
+    return (
+        os.path.join(LEGEND_DIR, f"{name}-bivariate-legend.html"),
+        os.path.join(LEGEND_DIR, f"{name}-little-bivariate.html"),
+    )
+
+
+@traced
+def build_hex_layers(
+    points: GeneratorPoints,
+    path: str = HEX_GPKG,
+    workers: int = WORKERS,
+    grid: HexGrid = conus_grid,
+) -> Dict:
+    # Every (Generator, Status) hex layer, the sums layer and the bivariate
+    # pair layers, over one connection. Returns the uris of the hex layers by
+    # group and of the bivariate layers by (x, y) pair.
+
+    # Assign every point to its cell once, and summarize every group in the
+    # same pass: the sums layer, then each generator type's block of status
+    # layers, as independent partitions
+    cell_ids = grid.cell_ids(points.x, points.y)
+    rows, groups = hex_layer_groups(points)
+    group_ranges = [(SUMS_GROUP, SUMS_GROUP + 1)] + [
+        (
+            hex_layer_group(generator_index, 0),
+            hex_layer_group(generator_index, len(statuses)),
+        )
+        for generator_index in range(len(energy_source_code))
+    ]
+    with span("summarize", rows=len(rows)):
+        summaries = summarize_by_cell_partitioned(
+            cell_ids[rows], groups, points.capacity[rows], group_ranges, workers
+        )
+
+    # Progress (in a background task) is reported layer by layer
+    layer_names = hex_layer_names()
+    n_layers = len(layer_names) + len(bivariate_pairs)
+    uris, bivariates = {}, {}
+    with GpkgWriter(path) as writer:
+        writer.set_release("hex", release_digest(points))
+        for i, (group, layer_name) in enumerate(layer_names.items()):
+            report_progress(i / n_layers)
+            summary = summaries.get(group)
+            if summary is None or len(summary) == 0:
+                continue
+            with span("write_layer", layer=layer_name):
+                uris[group] = write_cell_layer(
+                    writer, layer_name, grid, summary.cell_ids, summary
+                )
+
+        for i, (x_name, y_name) in enumerate(bivariate_pairs, len(layer_names)):
+            report_progress(i / n_layers)
+            uri = write_hex_bivariate(writer, points, cell_ids, x_name, y_name, grid)
+            if uri is not None:
+                bivariates[x_name, y_name] = uri
+    return {"layers": uris, "bivariate": bivariates}
+
+
+def write_hex_bivariate(
+    writer: GpkgWriter,
+    points: GeneratorPoints,
+    cell_ids: np.ndarray,
+    x_name: str,
+    y_name: str,
+    grid: HexGrid = conus_grid,
+) -> Optional[str]:
+    # A bivariate pair's layer: every cell with either type, its capacity of
+    # each and its class, with the pair's legends. The breaks are over every
+    # cell, so the layer is always written whole. Returns its uri, or None
+    # (dropping any earlier layer) when no cell has either type.
+    generator_names = [generator.name for generator in energy_source_code]
+    cells, x_capacity, y_capacity = cell_pair_values(
+        cell_ids,
+        points.generator,
+        points.capacity,
+        generator_names.index(x_name),
+        generator_names.index(y_name),
+    )
+    layer_name = bivariate_layer_name(x_name, y_name)
+    if len(cells) == 0:
+        writer.drop_layer(layer_name)
+        return None
+    codes, x_breaks, y_breaks = hex_bivariate_classes(x_capacity, y_capacity)
+    x_field, y_field = bivariate_capacity_fields(x_name, y_name)
+    with span("write_layer", layer=layer_name):
+        uri = write_cell_layer(
+            writer,
+            layer_name,
+            grid,
+            cells,
+            extra_columns=[
+                (x_field, "REAL", x_capacity),
+                (y_field, "REAL", y_capacity),
+                ("bivariate_class", "INTEGER", codes),
+            ],
+        )
+    os.makedirs(LEGEND_DIR, exist_ok=True)
+    write_legends(
+        *bivariate_legend_paths(f"{x_name}-{y_name}".lower().replace(" ", "-")),
+        bivariate_palette(len(y_breaks) - 1, len(x_breaks) - 1),
+        x_breaks,
+        y_breaks,
+        f"{x_name} capacity",
+        f"{y_name} capacity",
+        value_format="{:.3g} MW",
+    )
+    return uri
+
+
+def hex_bivariate_breaks(path: str, x_name: str, y_name: str):
+    # The x and y breaks of a bivariate layer, recomputed from its columns
+    x_field, y_field = bivariate_capacity_fields(x_name, y_name)
+    with GpkgReader(path) as reader:
+        columns = reader.columns(
+            bivariate_layer_name(x_name, y_name), [x_field, y_field]
+        )
+    _, x_breaks, y_breaks = hex_bivariate_classes(columns[x_field], columns[y_field])
+    return x_breaks, y_breaks
+
+
+@traced
+def build_temporal(
+    points: GeneratorPoints,
+    path: str = HEX_GPKG,
+    years: Tuple[int, int] = TEMPORAL_YEARS,
+    cube_path: Optional[str] = CUBE_PATH,
+    normalized: bool = NORMALIZED,
+    grid: HexGrid = conus_grid,
+) -> str:
+    # The monthly capacity intervals of every cell and energy source, as one
+    # temporal layer. Returns its uri.
+    min_year, max_year = years
+    layer_name = temporal_layer_name
+    fields = temporal_fields
+    n_months = (max_year - min_year + 1) * 12
+
+    included, missing, start, end = generator_months(points, min_year, n_months)
+    if missing.any():
+        print(f"{missing.sum()} generators are missing an operating year or month")
+
+    # Assign every generator to its hex in one vectorized call
+    cell_ids = grid.cell_ids(points.x, points.y)
+    unassigned = included & (cell_ids < 0)
+    if unassigned.any():
+        print(f"{unassigned.sum()} generators fall outside the grid and were skipped")
+    rows = np.flatnonzero(included & ~unassigned)
+    start, end = start[rows], end[rows]
+
+    with span("steps", rows=len(rows)):
+        step_cells, step_source_index, step_start, step_end, capacity = (
+            cell_source_steps(
+                cell_ids[rows],
+                points.generator[rows],
+                start,
+                end,
+                points.capacity[rows],
+                n_months,
+            )
+        )
+    step_sources = [energy_source_code[i].name for i in step_source_index.tolist()]
+    report_progress(0.2)
+
+    if cube_path:
+        # The same steps, expanded back out to every month of every cell
+        with span("cube", steps=len(step_cells)):
+            write_step_cube(
+                cube_path,
+                step_cells,
+                step_source_index,
+                step_start,
+                step_end,
+                capacity,
+                [energy_code.name for energy_code in energy_source_code],
+                n_months,
+                min_year,
+            )
+
+    report_progress(0.4)
+    rows = interval_rows(
+        step_cells, step_sources, step_start, step_end, capacity, min_year
+    )
+
+    with span("write_layer", layer=layer_name), GpkgWriter(path) as writer:
+        writer.set_release("temporal", release_digest(points))
+        if normalized:
+            # Each hexagon stored once, the intervals as a plain table keyed
+            # by cell, and a view joining them back into one temporal layer
+            cells = np.unique(step_cells)
+            cells_table = f"{layer_name}_cells"
+            intervals_table = f"{layer_name}_intervals"
+            rings = grid.cell_rings(cells)
+            writer.write_layer(
+                cells_table,
+                [("cell_id", "INTEGER")],
+                zip(cells.tolist()),
+                (polygon_wkb(ring) for ring in rings),
+                geometry_type="POLYGON",
+                fids=cells.tolist(),
+                envelopes=ring_envelopes(rings),
+            )
+            writer.write_layer(intervals_table, fields, rows)
+            writer.create_index(intervals_table, ["cell_id"])
+            # Date filters (the temporal controller's included) use these
+            writer.create_index(intervals_table, ["start_date"])
+            writer.create_index(intervals_table, ["end_date"])
+            uri = writer.write_view(
+                layer_name,
+                f"""SELECT i.fid AS fid, c.geom AS geom, i.cell_id AS cell_id,
+                    i.start_date AS start_date, i.end_date AS end_date,
+                    i.energy_source AS energy_source, i.capacity_mw AS capacity_mw
+                FROM "{intervals_table}" i JOIN "{cells_table}" c ON c.fid = i.cell_id""",
+                geometry_type="POLYGON",
+                extent_of=cells_table,
+            )
+        else:
+            # Cell polygons straight from the grid layout, no copy out of the
+            # Grid layer
+            writer.drop_layer(f"{layer_name}_cells")
+            writer.drop_layer(f"{layer_name}_intervals")
+            rings = grid.cell_rings(step_cells)
+            uri = writer.write_layer(
+                layer_name,
+                fields,
+                rows,
+                (polygon_wkb(ring) for ring in rings),
+                geometry_type="POLYGON",
+                envelopes=ring_envelopes(rings),
+            )
+            writer.create_index(layer_name, ["start_date"])
+            writer.create_index(layer_name, ["end_date"])
+    return uri
+
+
+@traced
+def build_centroids(
+    points: GeneratorPoints,
+    path: str = HEX_GPKG,
+    years: Tuple[int, int] = CENTROID_YEARS,
+    monthly: bool = MONTHLY_CENTROIDS,
+    workers: int = WORKERS,
+) -> str:
+    # Capacity-weighted centroids of every energy type, balancing authority
+    # and state, by year (and month). Returns the yearly layer's uri.
+    n_layers = 2 if monthly else 1
+    with GpkgWriter(path) as writer:
+        writer.set_release("centroids", release_digest(points))
+        for i, (layer_name, fields, (rows, geometries, envelopes)) in enumerate(
+            centroid_layers(points, *years, monthly, workers)
+        ):
+            report_progress(i / n_layers)
+            with span("write_layer", layer=layer_name):
+                writer.write_layer(
+                    layer_name,
+                    fields,
+                    rows,
+                    geometries,
+                    geometry_type="POINT",
+                    envelopes=envelopes,
+                )
+        uri = writer.uri("weighted_centroids")
+    return uri
+
+
+def write_wide_layer(
+    writer: GpkgWriter,
+    layer_name: str,
+    regions: FeatureTable,
+    key_field: str,
+    points: GeneratorPoints,
+    generator_field: str,
+    bivariate=None,
+):
+    # The region polygons with every metric joined on, 0 where a region has
+    # no generators, and the bivariate code when there's a bivariate map.
+    # Returns each metric's column as written, and the bivariate (x, y)
+    # breaks, if any.
+    metric_names = capacity_metrics + list(fraction_metrics)
+    fields = list(regions.fields) + [(name, "REAL") for name in metric_names]
+    metric_columns = region_metric_columns(
+        regions.column(key_field), points, generator_field
+    )
+    columns = [metric_columns[name].tolist() for name in metric_names]
+
+    breaks = None
+    if bivariate is not None:
+        # Classified over the features as written, so the breaks describe
+        # exactly what's on the map
+        bivariate_codes, x_breaks, y_breaks = subregion_bivariate_classes(
+            metric_columns, bivariate
+        )
+        fields.append((bivariate["field"], "INTEGER"))
+        columns.append(bivariate_codes.tolist())
+        breaks = x_breaks, y_breaks
+
+    srs_id = regions.srs[0]
+    writer.add_srs(*regions.srs)
+    writer.write_layer(
+        layer_name,
+        fields,
+        (list(row) + list(values) for row, values in zip(regions.rows, zip(*columns))),
+        regions.geometries,
+        geometry_type=regions.geometry_type,
+        srs_id=srs_id,
+    )
+    return metric_columns, breaks
+
+
+def region_metric_columns(
+    keys: Sequence, points: GeneratorPoints, generator_field: str
+) -> Dict[str, np.ndarray]:
+    # Each metric for the regions with these keys, in order, 0 where a
+    # region has no generators
+    codes, metrics = subregion_metrics(points, generator_field)
+    row_for_code = {code: i for i, code in enumerate(codes.tolist())}
+    metric_rows = [row_for_code.get(str(key or "").strip()) for key in keys]
+    return {
+        name: np.array(
+            [
+                float(metrics[name][row]) if row is not None else 0.0
+                for row in metric_rows
+            ],
+            dtype=np.float64,
+        )
+        for name in capacity_metrics + list(fraction_metrics)
+    }
+
+
+def subregion_bivariate_classes(metric_columns: Dict[str, np.ndarray], bivariate):
+    # Bivariate codes and (x, y) breaks of a region type's metric columns
+    return bivariate_classes(
+        metric_columns[bivariate["x"]],
+        metric_columns[bivariate["y"]],
+        bivariate["classes"],
+        bivariate["classes"],
+        bivariate["method"],
+    )
+
+
+def write_subregion_legends(region: str, breaks):
+    x_breaks, y_breaks = breaks
+    bivariate = subregion_bivariates[region]
+    os.makedirs(LEGEND_DIR, exist_ok=True)
+    write_legends(
+        *bivariate_legend_paths(region),
+        bivariate_palette(len(y_breaks) - 1, len(x_breaks) - 1),
+        x_breaks,
+        y_breaks,
+        bivariate["x_title"],
+        bivariate["y_title"],
+        value_format="{:.1f}%",
+    )
+
+
+@traced
+def build_subregions(
+    points: GeneratorPoints,
+    regions: Dict[str, FeatureTable],
+    path: str = SUMS_GPKG,
+) -> Dict[str, str]:
+    # One wide metrics table per region type, with the bivariate legends.
+    # regions holds each region type's polygons. Returns the tables' uris.
+    uris = {}
+    with GpkgWriter(path) as writer:
+        writer.set_release("subregions", release_digest(points))
+        for i, (region, table) in enumerate(region_tables.items()):
+            report_progress(i / len(region_tables))
+            bivariate = subregion_bivariates.get(region)
+            with span("write_layer", layer=table["name"]):
+                _, breaks = write_wide_layer(
+                    writer,
+                    table["name"],
+                    regions[region],
+                    table["key"],
+                    points,
+                    table["generator_field"],
+                    bivariate,
+                )
+            uris[region] = writer.uri(table["name"])
+            if breaks is not None:
+                write_subregion_legends(region, breaks)
+            print(f"{table['name']} written")
+    return uris
+
+
+def subregion_values(path: str, region: str):
+    # Each metric column of a region's wide table and its bivariate breaks
+    # (None without a bivariate map), read back from the GeoPackage
+    metric_names = capacity_metrics + list(fraction_metrics)
+    with GpkgReader(path) as reader:
+        metric_columns = reader.columns(region_tables[region]["name"], metric_names)
+    bivariate = subregion_bivariates.get(region)
+    if bivariate is None:
+        return metric_columns, None
+    _, x_breaks, y_breaks = subregion_bivariate_classes(metric_columns, bivariate)
+    return metric_columns, (x_breaks, y_breaks)
+
+
+def sweep_path(spacing: float) -> str:
+    return f"../hex_{spacing / 1000:g}km.gpkg"
+
+
+@traced
+def build_sweep(
+    points: GeneratorPoints, spacings: Sequence[float] = SWEEP_SPACINGS
+) -> Dict[float, str]:
+    # Every hex layer at every grid size, binned from the same points, one
+    # GeoPackage per size. Returns each size's sums layer uri.
+    rows, groups = hex_layer_groups(points)
+    with span("summarize", rows=len(rows)):
+        pyramid = summarize_pyramid(
+            points.x[rows], points.y[rows], groups, points.capacity[rows], spacings
+        )
+    layer_names = hex_layer_names()
+    uris = {}
+    for i, (spacing, summaries) in enumerate(pyramid.items()):
+        report_progress(i / len(pyramid))
+        grid = HexGrid(*CONUS_EXTENT, spacing=spacing)
+        sums = summaries.get(SUMS_GROUP)
+        if sums is None:
+            continue
+        # Every layer of this resolution over one connection
+        path = sweep_path(spacing)
+        with span("write_spacing", spacing=spacing), GpkgWriter(path) as writer:
+            write_cell_layer(writer, "grid", grid, sums.cell_ids)
+            for group, layer_name in layer_names.items():
+                summary = summaries.get(group)
+                if summary is None or len(summary) == 0:
+                    continue
+                uri = write_cell_layer(
+                    writer, layer_name, grid, summary.cell_ids, summary
+                )
+                if group == SUMS_GROUP:
+                    uris[spacing] = uri
+        print(f"{spacing / 1000:g} km grid written to {path}")
+    return uris
+
+
+@traced
+def gpkg_state_index(
+    path: str, layer: str, key_field: str = "STUSPS", cache_dir: str = CACHE_DIR
+) -> PolygonIndex:
+    # Every state's rings in EPSG:5070 from a GeoPackage layer, cached under
+    # the file's hash
+    cached = os.path.join(
+        cache_dir, f"states-{file_digest(path)[:16]}-{layer}-{key_field}.npz"
+    )
+    if os.path.exists(cached):
+        return PolygonIndex.load(cached)
+    with GpkgReader(path) as reader:
+        index = PolygonIndex.from_rings(*polygon_rings(reader.table(layer), key_field))
+    os.makedirs(cache_dir, exist_ok=True)
+    index.save(cached)
+    return index
+
+
+@traced
+def workbook_generator_points(
+    workbook_path: str = WORKBOOK_PATH,
+    states: Optional[Tuple[str, str]] = None,
+    cache_dir: str = CACHE_DIR,
+    quarantine_path: str = QUARANTINE_GPKG,
+) -> GeneratorPoints:
+    # The workbook's points in EPSG:5070 with the invalid ones quarantined;
+    # states is a (GeoPackage, layer) of state polygons for the state check
+    state_index = gpkg_state_index(*states, cache_dir=cache_dir) if states else None
+    return quarantine_points(
+        projected_points(workbook_path, cache_dir), state_index, quarantine_path
+    )
+
+
+def memoized(load: Callable[[], object]) -> Callable[[], object]:
+    # load, run at most once however many stages ask at the same time
+    lock, loaded = threading.Lock(), []
+
+    def memoized_load():
+        with lock:
+            if not loaded:
+                loaded.append(load())
+        return loaded[0]
+
+    return memoized_load
+
+
+def build_stages(
+    load_points: Callable[[], GeneratorPoints],
+    load_regions: Optional[Callable[[], Dict[str, FeatureTable]]] = None,
+    workbook_path: Optional[str] = None,
+    input_files: Sequence[str] = (),
+    region_files: Sequence[str] = (),
+    workers: int = WORKERS,
+) -> List[Stage]:
+    # The pipeline's stages (see pipeline.py) over these builds. The hex,
+    # temporal and centroid stages share hex.gpkg and so take turns; the
+    # grid and subregion stages run alongside them. Points are loaded once,
+    # by whichever stage needs them first, and the quarantine written then;
+    # it's the grid stage's output only, since every stage writing it would
+    # keep them all from overlapping. The snapshot stage saves the release
+    # the points came from beside the outputs, for incremental_update.py.
+    # input_files are what the points are read and validated from,
+    # region_files the subregion polygons.
+    load_points = memoized(load_points)
+    grid = asdict(conus_grid)
+    classification = generator_values(classification_fields)
+    # Each stage's code is its build function and the engines behind it;
+    # the modules every stage shares are in all of them
+    shared = ["generator_table.py", "validation.py", "gpkg_writer.py"]
+    stages = [
+        Stage(
+            "grid",
+            lambda: build_grid(load_points().x, load_points().y),
+            files=input_files,
+            values={"grid": grid},
+            code=[build_grid, "hex_layers.py"] + shared,
+            outputs=[GRID_GPKG, QUARANTINE_GPKG],
+        ),
+        Stage(
+            "hex",
+            lambda: build_hex_layers(load_points(), workers=workers),
+            files=input_files,
+            values={
+                "grid": grid,
+                "classification": classification,
+                "statuses": statuses,
+                "bivariate": [
+                    bivariate_pairs,
+                    bivariate_classes_per_axis,
+                    bivariate_method,
+                ],
+            },
+            code=[
+                build_hex_layers,
+                write_hex_bivariate,
+                hex_bivariate_classes,
+                bivariate_layer_name,
+                bivariate_capacity_fields,
+                bivariate_legend_paths,
+                "hex_binning.py",
+                "hex_layers.py",
+                "bivariate.py",
+            ]
+            + shared,
+            outputs=[HEX_GPKG],
+            style={"ramps": generator_values(["name", "color_ramp"])},
+        ),
+        Stage(
+            "temporal",
+            lambda: build_temporal(load_points()),
+            files=input_files,
+            values={
+                "grid": grid,
+                "classification": classification,
+                "years": TEMPORAL_YEARS,
+                "cube": CUBE_PATH,
+                "normalized": NORMALIZED,
+            },
+            code=[build_temporal, "timeline.py", "capacity_cube.py"] + shared,
+            outputs=[HEX_GPKG] + ([CUBE_PATH] if CUBE_PATH else []),
+        ),
+        Stage(
+            "centroids",
+            lambda: build_centroids(load_points(), workers=workers),
+            files=input_files,
+            values={
+                "classification": classification,
+                "years": CENTROID_YEARS,
+                "monthly": MONTHLY_CENTROIDS,
+            },
+            code=[build_centroids, "centroid_groups.py", "timeline.py"] + shared,
+            outputs=[HEX_GPKG],
+            style={"colors": generator_values(["name", "single_color"])},
+        ),
+    ]
+    if load_regions is not None:
+        stages.append(
+            Stage(
+                "subregions",
+                lambda: build_subregions(load_points(), load_regions()),
+                files=list(input_files) + list(region_files),
+                values={
+                    "regions": region_tables,
+                    "bivariates": subregion_bivariates,
+                },
+                code=[
+                    build_subregions,
+                    write_wide_layer,
+                    region_metric_columns,
+                    subregion_bivariate_classes,
+                    write_subregion_legends,
+                    bivariate_legend_paths,
+                    "subregion_metrics.py",
+                    "bivariate.py",
+                ]
+                + shared,
+                outputs=[SUMS_GPKG],
+            )
+        )
+    stages.append(
+        Stage(
+            "snapshot",
+            lambda: save_snapshot(SNAPSHOT_PATH, load_points()),
+            files=input_files,
+            values={"fields": snapshot_fields},
+            code=["incremental.py"] + shared,
+            outputs=[SNAPSHOT_PATH],
+        )
+    )
+    if workbook_path and os.path.exists(workbook_path):
+        # Fill the workbook cache first; every stage reads it
+        stages.append(
+            Stage(
+                "workbook",
+                lambda: projected_points(workbook_path),
+                files=[workbook_path],
+                values={"classification": classification},
+                code=["eia860m.py"],
+                outputs=[cache_path(workbook_path)],
+            )
+        )
+        for stage in stages[:-1]:
+            stage.after = ["workbook"]
+    return stages
+
+
+def gpkg_layer(source: str) -> Tuple[str, str]:
+    # "path.gpkg:layer" (or just "path.gpkg" for its only layer) as a
+    # (path, layer) pair
+    path, _, layer = source.partition(":")
+    if not layer:
+        with GpkgReader(path) as reader:
+            layers = reader.layers()
+        if len(layers) != 1:
+            raise ValueError(f"{path} has layers {layers}; name one as {path}:layer")
+        layer = layers[0]
+    return path, layer
+
+
+@traced
+def read_regions(sources: Dict[str, Tuple[str, str]]) -> Dict[str, FeatureTable]:
+    # Each region type's polygons from its (GeoPackage, layer)
+    regions = {}
+    for region, (path, layer) in sources.items():
+        with GpkgReader(path) as reader:
+            regions[region] = reader.table(layer)
+    return regions
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(
+        description="Build the pipeline's outputs from the 860M workbook, "
+        "without QGIS. Up-to-date stages are skipped."
+    )
+    parser.add_argument("--workbook", default=WORKBOOK_PATH)
+    parser.add_argument(
+        "--states", help="GeoPackage[:layer] of state polygons, keyed on STUSPS"
+    )
+    parser.add_argument(
+        "--balancing-authorities",
+        help="GeoPackage[:layer] of balancing authority polygons, keyed on "
+        "EIACode; with --states, adds the subregion stage",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="processes (and concurrent stages) to use; 1 by default, or "
+        "GRID_BATTERIES_WORKERS",
+    )
+    parser.add_argument("--force", nargs="*", default=[], help="stages to rebuild")
+    args = parser.parse_args(argv)
+
+    states = gpkg_layer(args.states) if args.states else None
+    authorities = (
+        gpkg_layer(args.balancing_authorities) if args.balancing_authorities else None
+    )
+    load_regions = None
+    if states and authorities:
+        load_regions = lambda: read_regions({"state": states, "ba": authorities})
+
+    # The headless build reads the cache the workbook stage fills
+    stages = build_stages(
+        lambda: workbook_generator_points(args.workbook, states),
+        load_regions,
+        workbook_path=args.workbook,
+        input_files=[args.workbook] + ([states[0]] if states else []),
+        region_files=[authorities[0]] if authorities else [],
+        workers=args.workers,
+    )
+    with run_report("builds"):
+        ran = Pipeline(stages).run(args.workers, args.force)
+    print(f"Build complete: {', '.join(ran) or 'nothing'} rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import json
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from timeline import active_totals
+
+# Capacity by month x cell x energy source, stored as a dense float32 array
+# behind a small JSON header so frames, cell time series and regional slices
+# can be read straight off disk through a memory map.
+#
+# Layout: MAGIC, the header length as a little-endian uint32, the JSON header,
+# padding up to a 64-byte boundary, then the array in month-major order so
+# every frame is one contiguous block.
+
+MAGIC = b"CAPCUBE1"
+ALIGNMENT = 64
+DTYPE = "<f4"
+
+
+def write_capacity_cube(
+    path: str,
+    levels: np.ndarray,
+    cell_ids: Sequence[int],
+    sources: Sequence[str],
+    origin_year: int,
+):
+    # levels is shaped (months, cells, sources), cells in cell_ids order
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    order = np.argsort(cell_ids)
+    n_months = levels.shape[0]
+    header = {
+        "origin_year": int(origin_year),
+        "months": int(n_months),
+        "cell_ids": cell_ids[order].tolist(),
+        "sources": list(sources),
+        "dtype": DTYPE,
+    }
+
+    encoded = json.dumps(header).encode("utf-8")
+    data_offset = len(MAGIC) + 4 + len(encoded)
+    data_offset += -data_offset % ALIGNMENT
+    encoded = encoded.ljust(data_offset - len(MAGIC) - 4, b" ")
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(encoded)).astype("<u4").tobytes())
+        f.write(encoded)
+        for month in range(n_months):
+            f.write(np.ascontiguousarray(levels[month][order], dtype=DTYPE).tobytes())
+
+
+def write_step_cube(
+    path: str,
+    cells,
+    source_index,
+    start,
+    end,
+    capacity,
+    sources: Sequence[str],
+    n_months: int,
+    origin_year: int,
+):
+    # Expand steps from timeline.cell_source_steps back out to every month of
+    # every cell they touch, and write those
+    cube_cells, cell_index = np.unique(cells, return_inverse=True)
+    n_sources = len(sources)
+    (levels,) = active_totals(
+        cell_index.reshape(-1) * n_sources + np.asarray(source_index),
+        start,
+        end,
+        len(cube_cells) * n_sources,
+        n_months,
+        [capacity],
+    )
+    write_capacity_cube(
+        path,
+        levels.reshape(len(cube_cells), n_sources, n_months).transpose(2, 0, 1),
+        cube_cells,
+        sources,
+        origin_year,
+    )
+
+
+class CapacityCube:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a capacity cube")
+            header_length = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+            header = json.loads(f.read(header_length))
+
+        self.origin_year = header["origin_year"]
+        self.cell_ids = np.asarray(header["cell_ids"], dtype=np.int64)
+        self.sources = list(header["sources"])
+        self.data = np.memmap(
+            path,
+            dtype=header["dtype"],
+            mode="r",
+            offset=len(MAGIC) + 4 + header_length,
+            shape=(header["months"], len(self.cell_ids), len(self.sources)),
+        )
+
+    @property
+    def months(self) -> int:
+        return self.data.shape[0]
+
+    def month_index(self, year: int, month: int) -> int:
+        return (year - self.origin_year) * 12 + month - 1
+
+    def month_of(self, index: int):
+        year, month = divmod(index, 12)
+        return self.origin_year + year, month + 1
+
+    def cell_positions(self, cell_ids) -> np.ndarray:
+        # Row of each cell in the cube, -1 for cells that never held capacity
+        cell_ids = np.asarray(cell_ids, dtype=np.int64)
+        if len(self.cell_ids) == 0:
+            return np.full(len(cell_ids), -1)
+        positions = np.searchsorted(self.cell_ids, cell_ids)
+        positions = np.minimum(positions, len(self.cell_ids) - 1)
+        return np.where(self.cell_ids[positions] == cell_ids, positions, -1)
+
+    def source_positions(self, sources: Sequence[str]) -> np.ndarray:
+        return np.array([self.sources.index(source) for source in sources])
+
+    def frame(self, month: int) -> np.ndarray:
+        # (cells, sources) capacity in one month
+        return self.data[month]
+
+    def series(self, cell_id: int) -> np.ndarray:
+        # (months, sources) capacity of one cell
+        position = self.cell_positions([cell_id])[0]
+        if position < 0:
+            return np.zeros((self.months, len(self.sources)), dtype=self.data.dtype)
+        return self.data[:, position, :]
+
+    def slice(
+        self,
+        cell_ids: Optional[Sequence[int]] = None,
+        months: Union[slice, Sequence[int], None] = None,
+        sources: Optional[Sequence[str]] = None,
+    ) -> np.ndarray:
+        # (months, cells, sources) block, cells and sources in the order
+        # asked for. Cells that never held capacity come back as zeros.
+        months = slice(None) if months is None else months
+        block = self.data[months]
+        if cell_ids is not None:
+            positions = self.cell_positions(cell_ids)
+            block = block[:, np.maximum(positions, 0), :]
+        if sources is not None:
+            block = block[:, :, self.source_positions(sources)]
+        result = np.array(block)
+        if cell_ids is not None:
+            result[:, positions < 0, :] = 0
+        return result
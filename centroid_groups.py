@@ -0,0 +1,264 @@
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from generator_types import energy_source_code
+from gpkg_writer import point_wkb
+from parallel import WORKERS
+from timeline import (
+    active_totals_partitioned,
+    coalesce,
+    exclude_period,
+    month_index,
+    out_of_service_status,
+    out_of_service_year,
+    retirement_end,
+)
+
+ba_code_field = "Balancing Authority Code"
+state_field = "Plant State"
+# Fields the centroids need loaded on the generator points
+centroid_point_fields = [
+    ba_code_field,
+    state_field,
+    "Operating Year",
+    "Operating Month",
+    "Planned Operation Year",
+    "Planned Operation Month",
+    "Retirement Year",
+    "Retirement Month",
+    "Planned Retirement Year",
+    "Planned Retirement Month",
+]
+
+# (energy type, group type, group name), what a centroid group is known by
+GroupKey = Tuple[str, str, str]
+
+
+@dataclass
+class CentroidGroups:
+    # Every energy type gets a block of groups: the total, then one per
+    # balancing authority, then one per state. A point counts toward the first
+    # energy type it matches.
+    levels: List[Tuple[str, str]]
+    # Point behind each (point, group) membership, and the group
+    rows: np.ndarray
+    group_ids: np.ndarray
+
+    @property
+    def n_groups(self) -> int:
+        return len(energy_source_code) * len(self.levels)
+
+    def key(self, group_id: int) -> GroupKey:
+        energy, level = divmod(int(group_id), len(self.levels))
+        return (energy_source_code[energy].name, *self.levels[level])
+
+
+def centroid_groups(points) -> CentroidGroups:
+    balancing_authorities = points.categorical(ba_code_field)
+    states = points.categorical(state_field)
+    ba_codes, ba_index = balancing_authorities.labels, balancing_authorities.codes
+    state_names, state_index = states.labels, states.codes
+    levels = (
+        [("total", "total")]
+        + [("balancing_authority", ba_code) for ba_code in ba_codes]
+        + [("state", state) for state in state_names]
+    )
+
+    rows = np.flatnonzero(points.generator >= 0)
+    block = points.generator[rows] * len(levels)
+    group_ids = np.concatenate(
+        (
+            block,
+            np.where(ba_codes[ba_index[rows]] != "", block + 1 + ba_index[rows], -1),
+            np.where(
+                state_names[state_index[rows]] != "",
+                block + 1 + len(ba_codes) + state_index[rows],
+                -1,
+            ),
+        )
+    )
+    return CentroidGroups(
+        levels=levels, rows=np.concatenate((rows, rows, rows)), group_ids=group_ids
+    )
+
+
+def group_keys(points, rows) -> Set[GroupKey]:
+    # Every centroid group the given points belong to
+    groups = centroid_groups(points)
+    member = np.isin(groups.rows, rows) & (groups.group_ids >= 0)
+    return {groups.key(group_id) for group_id in np.unique(groups.group_ids[member])}
+
+
+def centroid_totals(
+    points, groups: CentroidGroups, start, end, n_periods, excluded, workers
+):
+    # Active count, capacity and capacity-weighted x/y for every group and
+    # period from one pass over the points. Missing ends stay active through
+    # the last period; out of service generators are cut out of the excluded
+    # periods.
+    end = np.where(np.isnan(end), n_periods, end)
+    group_rows = groups.rows
+    pieces, piece_start, piece_end = exclude_period(
+        start[group_rows],
+        end[group_rows],
+        points.status.codes[group_rows] == points.status.code_of(out_of_service_status),
+        *excluded,
+    )
+    piece_rows = group_rows[pieces]
+    capacity = points.capacity[piece_rows]
+    # Each energy type's block of groups is independent of the others
+    return active_totals_partitioned(
+        groups.group_ids[pieces],
+        piece_start,
+        piece_end,
+        groups.n_groups,
+        n_periods,
+        [
+            np.ones(len(pieces)),
+            capacity,
+            capacity * points.x[piece_rows],
+            capacity * points.y[piece_rows],
+        ],
+        len(groups.levels),
+        workers,
+    )
+
+
+def centroid_rows(
+    groups: CentroidGroups,
+    totals,
+    period_attributes: Callable,
+    only: Optional[Set[GroupKey]] = None,
+):
+    # Attributes, point geometry and its envelope of one feature per (energy
+    # type, period, group) that has capacity, in that order. only, if given, limits them to
+    # those groups.
+    count, capacity, weighted_x, weighted_y = (
+        total.reshape(len(energy_source_code), len(groups.levels), -1)
+        for total in totals
+    )
+    # Rounding in the running sums can leave dust where a group has emptied
+    present = (np.rint(count) > 0) & (capacity > 0)
+
+    rows, geometries, envelopes = [], [], []
+    for energy, period, level in zip(*np.nonzero(present.transpose(0, 2, 1))):
+        group_type, group_name = groups.levels[level]
+        energy_name = energy_source_code[energy].name
+        if only is not None and (energy_name, group_type, group_name) not in only:
+            continue
+        group_cap = float(capacity[energy, level, period])
+        avg_x = float(weighted_x[energy, level, period]) / group_cap
+        avg_y = float(weighted_y[energy, level, period]) / group_cap
+
+        rows.append(
+            [energy_name]
+            + period_attributes(period)
+            + [group_cap, avg_x, avg_y, group_type, group_name]
+        )
+        geometries.append(point_wkb(avg_x, avg_y))
+        envelopes.append((avg_x, avg_x, avg_y, avg_y))
+    return rows, geometries, envelopes
+
+
+def centroid_fields(period_fields):
+    return (
+        [("energy_type", "TEXT")]
+        + period_fields
+        + [
+            ("total_capacity", "REAL"),
+            ("avg_x", "REAL"),
+            ("avg_y", "REAL"),
+            ("group_type", "TEXT"),
+            ("group_name", "TEXT"),
+        ]
+    )
+
+
+def centroid_layers(
+    points,
+    min_year: int,
+    max_year: int,
+    monthly: bool = True,
+    workers: int = WORKERS,
+    only: Optional[Set[GroupKey]] = None,
+):
+    # (layer name, fields, (rows, geometries, envelopes)) of the yearly centroid layer
+    # and, if monthly, the monthly one
+    groups = centroid_groups(points)
+    start_year = coalesce(
+        points.numeric("Operating Year"),
+        points.numeric("Planned Operation Year"),
+        np.full(len(points), max_year),
+    )
+    retirement_year = coalesce(
+        points.numeric("Retirement Year"), points.numeric("Planned Retirement Year")
+    )
+
+    # Yearly centroids. A generator counts from its (planned) operating year
+    # up to but not including its (planned) retirement year.
+    n_years = max_year - min_year + 1
+    layers = [
+        (
+            "weighted_centroids",
+            centroid_fields([("year", "INTEGER")]),
+            centroid_rows(
+                groups,
+                centroid_totals(
+                    points,
+                    groups,
+                    start_year - min_year,
+                    retirement_year - min_year,
+                    n_years,
+                    (
+                        out_of_service_year - min_year,
+                        out_of_service_year - min_year + 1,
+                    ),
+                    workers,
+                ),
+                lambda period: [min_year + int(period)],
+                only,
+            ),
+        )
+    ]
+
+    if monthly:
+        # Same thing by month, from the month fields where they're filled in.
+        # Retirement ends the month after it, as on the timeline.
+        n_months = n_years * 12
+        layers.append(
+            (
+                "weighted_centroids_monthly",
+                centroid_fields([("year", "INTEGER"), ("month", "INTEGER")]),
+                centroid_rows(
+                    groups,
+                    centroid_totals(
+                        points,
+                        groups,
+                        month_index(
+                            start_year,
+                            coalesce(
+                                points.numeric("Operating Month"),
+                                points.numeric("Planned Operation Month"),
+                                np.ones(len(points)),
+                            ),
+                            min_year,
+                        ),
+                        retirement_end(points, min_year),
+                        n_months,
+                        (
+                            (out_of_service_year - min_year) * 12,
+                            (out_of_service_year - min_year + 1) * 12,
+                        ),
+                        workers,
+                    ),
+                    lambda period: [
+                        min_year + int(period) // 12,
+                        int(period) % 12 + 1,
+                    ],
+                    only,
+                ),
+            )
+        )
+    return layers
@@ -0,0 +1,111 @@
+import numpy as np
+
+# Optimal 1-D k-means (Ckmeans.1d.dp, Wang & Song 2011): classes of sorted
+# values that minimize the total within-class sum of squares, the quantity
+# Jenks natural breaks approximates. Exact and deterministic, so the breaks
+# only change when the data does.
+#
+# Row m of the dynamic program is cost[m][i] = min over j of
+# cost[m - 1][j - 1] + sse(j, i), and the best j never decreases as i grows,
+# so each row is filled by divide and conquer. Every level of that recursion
+# is done as one vectorized pass over all its subproblems: O(k n log n).
+
+
+def _sse(prefix, prefix_squares, start, end):
+    # Sum of squared deviations of sorted values start..end, inclusive
+    count = end - start + 1
+    total = prefix[end + 1] - prefix[start]
+    return np.maximum(
+        prefix_squares[end + 1] - prefix_squares[start] - total * total / count, 0
+    )
+
+
+def _first_minimum(values, segment, starts):
+    # Minimum of each run of values (segment numbers them, starts is where
+    # each begins) and the offset of its first occurrence
+    minimum = np.minimum.reduceat(values, starts)
+    hits = np.flatnonzero(values == minimum[segment])
+    first = np.flatnonzero(np.diff(segment[hits], prepend=-1))
+    return minimum, hits[first]
+
+
+def ckmeans(values, k: int) -> np.ndarray:
+    # Class (0 .. k - 1, in increasing order of value) of every value. k is
+    # capped at the number of distinct values; NaNs get -1.
+    values = np.asarray(values, dtype=np.float64)
+    classes = np.full(len(values), -1, dtype=np.int64)
+    present = np.flatnonzero(~np.isnan(values))
+    if len(present) == 0:
+        return classes
+    order = present[np.argsort(values[present], kind="stable")]
+    x = values[order]
+    n = len(x)
+    k = max(1, min(k, len(np.unique(x))))
+
+    # Centred on the median to keep the prefix sums' cancellation small
+    x_centred = x - x[n // 2]
+    prefix = np.concatenate(([0.0], np.cumsum(x_centred)))
+    prefix_squares = np.concatenate(([0.0], np.cumsum(x_centred * x_centred)))
+
+    # starts[m][i]: first index of the last of m + 1 classes covering 0 .. i
+    cost = _sse(prefix, prefix_squares, np.zeros(n, dtype=np.int64), np.arange(n))
+    starts = [np.zeros(n, dtype=np.int64)]
+    for m in range(1, k):
+        previous = cost
+        cost = np.full(n, np.inf)
+        start = np.zeros(n, dtype=np.int64)
+        # Open subproblems: fill i in lo .. hi, with the best j known to lie
+        # in best_lo .. best_hi
+        lo, hi = np.array([m]), np.array([n - 1])
+        best_lo, best_hi = np.array([m]), np.array([n - 1])
+        while len(lo):
+            mid = (lo + hi) // 2
+            last = np.minimum(mid, best_hi)
+            counts = last - best_lo + 1
+            starts_at = np.cumsum(counts) - counts
+            segment = np.repeat(np.arange(len(counts)), counts)
+            j = (best_lo - starts_at)[segment] + np.arange(len(segment))
+            # Sums up to i are per subproblem; only those from j vary
+            count = mid[segment] - j + 1
+            total = prefix[mid + 1][segment] - prefix[j]
+            candidate = previous[j - 1] + np.maximum(
+                prefix_squares[mid + 1][segment]
+                - prefix_squares[j]
+                - total * total / count,
+                0,
+            )
+            best, at = _first_minimum(candidate, segment, starts_at)
+            best_j = j[at]
+            cost[mid] = best
+            start[mid] = best_j
+
+            left, right = lo <= mid - 1, mid + 1 <= hi
+            lo, hi, best_lo, best_hi = (
+                np.concatenate((lo[left], mid[right] + 1)),
+                np.concatenate((mid[left] - 1, hi[right])),
+                np.concatenate((best_lo[left], best_j[right])),
+                np.concatenate((best_j[left], best_hi[right])),
+            )
+        starts.append(start)
+
+    end = n - 1
+    sorted_classes = np.empty(n, dtype=np.int64)
+    for m in range(k - 1, -1, -1):
+        first = starts[m][end] if m else 0
+        sorted_classes[first : end + 1] = m
+        end = first - 1
+    classes[order] = sorted_classes
+    return classes
+
+
+def ckmeans_breaks(values, k: int) -> np.ndarray:
+    # Class edges: the smallest value, then the largest value of each class,
+    # the same shape of breaks QgsClassificationJenks produces
+    values = np.asarray(values, dtype=np.float64)
+    classes = ckmeans(values, k)
+    valid = classes >= 0
+    if not valid.any():
+        return np.empty(0)
+    upper = np.full(classes.max() + 1, -np.inf)
+    np.maximum.at(upper, classes[valid], values[valid])
+    return np.concatenate(([values[valid].min()], upper))
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import sys
+from typing import Optional
+
+import numpy as np
+
+from albers import conus_albers
+from generator_table import GeneratorPoints, load_points, save_points
+from generator_types import GeneratorClassifier, classifier
+from group_by import CategoricalBuilder, NumericBuilder
+from instrumentation import count, traced
+
+# Reads the generator sheets of an EIA 860M workbook straight into a
+# GeneratorPoints table, keeping the same rows and columns tidy-data.Rmd
+# does, except the rows it drops for a bad latitude or longitude or a
+# missing capacity: those are kept for validation to quarantine with their
+# reasons. The table is cached under the workbook's content hash so later
+# runs load it in milliseconds. It keeps longitude and latitude as x and y;
+# projected_points swaps in EPSG:5070 coordinates, cached beside it.
+
+WORKBOOK_PATH = "../february_generator2025.xlsx"
+CACHE_DIR = "../cache"
+# Bumped whenever the columns or the parsing change, so older caches of the
+# same workbook are left alone
+CACHE_VERSION = 3
+
+# Column names are on the third row of every sheet
+header_row = 3
+# (sheet name, earliest retirement year kept); None is the first sheet,
+# "Operating" in current releases
+sheets = [(None, None), ("Planned", None), ("Retired", 2010)]
+excluded_states = {"AK", "HI", "PR"}
+
+capacity_field = "Nameplate Capacity (MW)"
+numeric_fields = [
+    "Entity ID",
+    "Plant ID",
+    "Latitude",
+    "Longitude",
+    "Operating Year",
+    "Operating Month",
+    "Planned Operation Year",
+    "Planned Operation Month",
+    "Retirement Year",
+    "Retirement Month",
+    "Planned Retirement Year",
+    "Planned Retirement Month",
+]
+text_fields = [
+    "Entity Name",
+    "Plant Name",
+    "Generator ID",
+    "Plant State",
+    "County",
+    "Balancing Authority Code",
+    "Technology",
+    "Energy Source Code",
+    "Prime Mover Code",
+]
+
+
+def number(value) -> float:
+    # Cell value as a float, NaN when blank or not a number. Capacities stay
+    # fractional: a 0.4 MW generator must not become 0.
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(",", "").strip())
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+# Content hashes by (path, size, mtime), so the workbook is read through once
+# per run however many cache paths and fingerprints ask for it
+file_digests = {}
+
+
+def file_digest(path: str) -> str:
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in file_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        file_digests[key] = digest.hexdigest()
+    return file_digests[key]
+
+
+def cache_path(
+    path: str,
+    cache_dir: str = CACHE_DIR,
+    generator_classifier: GeneratorClassifier = classifier,
+) -> str:
+    # Keyed on the generator definitions too, since the cached table holds
+    # each row's generator type
+    definitions = hashlib.sha256(
+        repr(generator_classifier.definitions()).encode()
+    ).hexdigest()
+    return os.path.join(
+        cache_dir,
+        f"860m-{file_digest(path)[:16]}-{definitions[:8]}-v{CACHE_VERSION}.npz",
+    )
+
+
+@traced
+def read_workbook(
+    path: str, generator_classifier: GeneratorClassifier = classifier
+) -> GeneratorPoints:
+    # One pass over each sheet in openpyxl's read-only mode, so only the
+    # current row is held alongside the typed column buffers
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    xs, ys, capacities = NumericBuilder(), NumericBuilder(), NumericBuilder()
+    status_column = CategoricalBuilder()
+    columns = {name: NumericBuilder() for name in numeric_fields}
+    columns.update({name: CategoricalBuilder() for name in text_fields})
+    try:
+        for sheet_name, retired_since in sheets:
+            sheet = (
+                workbook.worksheets[0] if sheet_name is None else workbook[sheet_name]
+            )
+            rows = sheet.iter_rows(min_row=header_row, values_only=True)
+            header = [str(name or "").strip() for name in next(rows, ())]
+            index = {name: i for i, name in enumerate(header) if name}
+            # Columns a sheet doesn't have (Planned has no retirement dates)
+            # are left blank
+            positions = [(index.get(name), column) for name, column in columns.items()]
+            latitude, longitude = index["Latitude"], index["Longitude"]
+            capacity, status = index[capacity_field], index["Status"]
+            state = index["Plant State"]
+            retirement_year = index.get("Retirement Year")
+
+            for row in rows:
+                if len(row) < len(header):
+                    row = tuple(row) + (None,) * (len(header) - len(row))
+                lat, lon = number(row[latitude]), number(row[longitude])
+                mw = number(row[capacity])
+                if str(row[state] or "").strip() in excluded_states:
+                    continue
+                if retired_since is not None and not (
+                    number(row[retirement_year]) >= retired_since
+                ):
+                    continue
+
+                xs.append(lon)
+                ys.append(lat)
+                capacities.append(mw)
+                status_column.append(row[status])
+                for position, column in positions:
+                    value = None if position is None else row[position]
+                    column.append(
+                        number(value) if isinstance(column, NumericBuilder) else value
+                    )
+    finally:
+        workbook.close()
+
+    columns = {name: column.build() for name, column in columns.items()}
+    x = xs.build()
+    count("features_read", len(x))
+    return GeneratorPoints(
+        x=x,
+        y=ys.build(),
+        capacity=capacities.build(),
+        status=status_column.build(),
+        generator=generator_classifier.classify(
+            columns["Energy Source Code"],
+            columns["Prime Mover Code"],
+            columns["Technology"],
+        ),
+        columns=columns,
+    )
+
+
+def _cached_points(path: str, cached: str) -> GeneratorPoints:
+    if os.path.exists(cached):
+        return load_points(cached)
+
+    points = read_workbook(path)
+    os.makedirs(os.path.dirname(cached) or ".", exist_ok=True)
+    # Written aside and moved into place so a half-written cache is never read
+    partial = f"{cached}.partial"
+    save_points(partial, points)
+    os.replace(partial, cached)
+    return points
+
+
+def workbook_points(
+    path: str = WORKBOOK_PATH, cache_dir: str = CACHE_DIR
+) -> GeneratorPoints:
+    # From the cache when this exact workbook has been read before
+    return _cached_points(path, cache_path(path, cache_dir))
+
+
+def projected_points(
+    path: str = WORKBOOK_PATH, cache_dir: str = CACHE_DIR
+) -> GeneratorPoints:
+    # workbook_points with x and y in EPSG:5070
+    cached = cache_path(path, cache_dir)
+    points = _cached_points(path, cached)
+    projected = cached.replace(".npz", ".5070.npy")
+    if os.path.exists(projected):
+        xy = np.load(projected)
+    else:
+        xy = np.stack(conus_albers.forward(points.x, points.y))
+        with open(f"{projected}.partial", "wb") as f:
+            np.save(f, xy)
+        os.replace(f"{projected}.partial", projected)
+    points.x, points.y = xy
+    return points
+
+
+def main(argv: Optional[list] = None):
+    # python eia860m.py [workbook] [cache dir] fills the cache ahead of time
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else WORKBOOK_PATH
+    cache_dir = argv[1] if len(argv) > 1 else CACHE_DIR
+    points = projected_points(path, cache_dir)
+    print(f"{len(points)} generators cached at {cache_path(path, cache_dir)}")
+
+
+if __name__ == "__main__":
+    main()
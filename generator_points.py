@@ -0,0 +1,243 @@
+import hashlib
+import os
+from array import array
+from dataclasses import asdict
+from typing import Optional, Sequence
+
+import numpy as np
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProject,
+    QgsProviderRegistry,
+)
+from qgis.PyQt.QtCore import QVariant
+
+import albers
+import validation
+from eia860m import CACHE_DIR, WORKBOOK_PATH, cache_path, file_digest, projected_points
+from generator_table import GeneratorPoints
+from generator_types import GeneratorClassifier, classifier
+from group_by import CategoricalBuilder, NumericBuilder
+from instrumentation import count, traced
+from hex_grid import conus_grid
+from validation import QUARANTINE_GPKG, PolygonIndex, quarantine_rows_kept
+
+capacity_field = "Nameplate Capacity (MW)"
+# Fields the generator types are defined on
+classifier_fields = ["Energy Source Code", "Prime Mover Code", "Technology"]
+# Fields the validation checks and the quarantine layer use, where present
+validation_fields = ["Plant State", "Plant ID", "Generator ID", "Plant Name"]
+
+
+def value_or_none(value):
+    if value is None:
+        return None
+    if isinstance(value, QVariant) and value.isNull():
+        return None
+    return value
+
+
+@traced
+def load_generator_points(
+    points_layer,
+    fields: Sequence[str] = (),
+    generator_classifier: GeneratorClassifier = classifier,
+) -> GeneratorPoints:
+    # Read every generator point exactly once into typed buffers, then
+    # classify every point by generator type in one call
+    layer_fields = points_layer.fields()
+    fields = list(dict.fromkeys(list(fields) + classifier_fields))
+    columns = {
+        name: (
+            NumericBuilder()
+            if layer_fields.field(name).isNumeric()
+            else CategoricalBuilder()
+        )
+        for name in fields
+    }
+    xs, ys, capacities = array("d"), array("d"), array("d")
+    status_column = CategoricalBuilder()
+
+    for feature in points_layer.getFeatures():
+        geom = feature.geometry()
+        if geom.isNull():
+            continue
+
+        try:
+            capacity = float(value_or_none(feature[capacity_field]) or 0)
+        except (TypeError, ValueError):
+            continue
+
+        point = geom.asPoint()
+        xs.append(point.x())
+        ys.append(point.y())
+        capacities.append(capacity)
+        status_column.append(value_or_none(feature["Status"]))
+        for name, column in columns.items():
+            column.append(value_or_none(feature[name]))
+
+    columns = {name: column.build() for name, column in columns.items()}
+    count("features_read", len(xs))
+    return GeneratorPoints(
+        x=np.frombuffer(xs, dtype=np.float64),
+        y=np.frombuffer(ys, dtype=np.float64),
+        capacity=np.frombuffer(capacities, dtype=np.float64),
+        status=status_column.build(),
+        generator=generator_classifier.classify(
+            *(columns[name] for name in classifier_fields)
+        ),
+        columns=columns,
+    )
+
+
+def projection_error(points: GeneratorPoints, crs="EPSG:5070") -> float:
+    # Largest distance, in metres, between projected_points' coordinates and
+    # QGIS' own transform of the workbook's longitude/latitude
+    transform = QgsCoordinateTransform(
+        QgsCoordinateReferenceSystem("EPSG:4326"),
+        QgsCoordinateReferenceSystem(crs),
+        QgsProject.instance(),
+    )
+
+    def qgis_transform(longitude, latitude):
+        expected = [
+            transform.transform(QgsPointXY(lon, lat))
+            for lon, lat in zip(longitude.tolist(), latitude.tolist())
+        ]
+        return (
+            np.array([point.x() for point in expected]),
+            np.array([point.y() for point in expected]),
+        )
+
+    return albers.projection_error(
+        points.x,
+        points.y,
+        points.numeric("Longitude"),
+        points.numeric("Latitude"),
+        qgis_transform,
+    )
+
+
+def states_cache_key(states_layer, key_field: str = "STUSPS") -> Optional[str]:
+    # The States layer's file hash, layer and key field, as gpkg_state_index
+    # in builds.py keys them; None when it isn't a whole layer of a file
+    parts = QgsProviderRegistry.instance().decodeUri(
+        states_layer.providerType(), states_layer.source()
+    )
+    path = parts.get("path", "")
+    if not os.path.isfile(path) or states_layer.subsetString():
+        return None
+    layer = parts.get("layerName") or parts.get("layerId") or ""
+    return f"states-{file_digest(path)[:16]}-{layer}-{key_field}"
+
+
+@traced
+def state_polygon_index(
+    states_layer, key_field: str = "STUSPS", cache_dir: str = CACHE_DIR
+) -> PolygonIndex:
+    # Every state's rings in EPSG:5070, cached under the source file's hash
+    # and layer when the layer comes from a file
+    key = states_cache_key(states_layer, key_field)
+    cached = None
+    if key is not None:
+        cached = os.path.join(cache_dir, f"{key}.npz")
+        if os.path.exists(cached):
+            return PolygonIndex.load(cached)
+
+    transform = QgsCoordinateTransform(
+        states_layer.crs(),
+        QgsCoordinateReferenceSystem("EPSG:5070"),
+        QgsProject.instance(),
+    )
+    rings = {}
+    for feature in states_layer.getFeatures():
+        geometry = QgsGeometry(feature.geometry())
+        if geometry.isNull():
+            continue
+        geometry.transform(transform)
+        polygons = (
+            geometry.asMultiPolygon()
+            if geometry.isMultipart()
+            else [geometry.asPolygon()]
+        )
+        rings.setdefault(str(feature[key_field] or "").strip(), []).extend(
+            np.array([(point.x(), point.y()) for point in ring])
+            for polygon in polygons
+            for ring in polygon
+        )
+    index = PolygonIndex.from_rings(list(rings), list(rings.values()))
+    if cached:
+        os.makedirs(cache_dir, exist_ok=True)
+        index.save(cached)
+    return index
+
+
+def validated_path(cached: str, states_key: str) -> str:
+    # Beside the workbook cache, keyed on the States layer, the grid and the
+    # validation code
+    key = hashlib.sha256(
+        repr(
+            (states_key, asdict(conus_grid), file_digest(validation.__file__))
+        ).encode()
+    ).hexdigest()
+    return cached.replace(".npz", f".valid-{key[:16]}.npy")
+
+
+def quarantine_invalid(
+    points: GeneratorPoints,
+    quarantine_path: str = QUARANTINE_GPKG,
+    cached: Optional[str] = None,
+) -> GeneratorPoints:
+    # validation.quarantine_points, with the state check against the States
+    # layer when one is loaded. cached is the workbook cache the points came
+    # from, if they did: the rows that pass are kept beside it, and the
+    # quarantine is only written when they're first validated.
+    states = QgsProject.instance().mapLayersByName("States")
+    states_key = states_cache_key(states[0]) if states else "no-states"
+    kept_path = None
+    if cached is not None and states_key is not None:
+        kept_path = validated_path(cached, states_key)
+        if os.path.exists(kept_path) and os.path.exists(quarantine_path):
+            return points.take(np.load(kept_path))
+
+    kept = quarantine_rows_kept(
+        points, state_polygon_index(states[0]) if states else None, quarantine_path
+    )
+    if kept_path is not None:
+        with open(f"{kept_path}.partial", "wb") as f:
+            np.save(f, kept)
+        os.replace(f"{kept_path}.partial", kept_path)
+    return points.take(kept)
+
+
+@traced
+def cached_generator_points(
+    points_layer,
+    fields: Sequence[str] = (),
+    workbook_path: str = WORKBOOK_PATH,
+    cache_dir: str = CACHE_DIR,
+    validate: bool = True,
+) -> GeneratorPoints:
+    # Straight from the 860M workbook's columnar cache when the workbook is
+    # there, otherwise from the Generator Points layer. Either way, points
+    # that fail validation are set aside unless validate is off; the
+    # workbook's are validated once per cache.
+    points, cached = None, None
+    if os.path.exists(workbook_path):
+        points = projected_points(workbook_path, cache_dir)
+        cached = cache_path(workbook_path, cache_dir)
+        if not all(name in points.columns for name in fields):
+            points, cached = None, None
+    if points is None:
+        if points_layer is None:
+            raise ValueError("Could not find Generator Points layer with CRS EPSG:5070")
+        layer_fields = points_layer.fields()
+        points = load_generator_points(
+            points_layer,
+            list(fields)
+            + [name for name in validation_fields if layer_fields.indexOf(name) >= 0],
+        )
+    return quarantine_invalid(points, cached=cached) if validate else points
@@ -0,0 +1,141 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+from generator_types import energy_source_code, short_status, statuses
+from group_by import Categorical
+
+# Hex layer groups: the all-capacity "sums" layer, then one per
+# (Generator, Status) combination
+SUMS_GROUP = 0
+
+
+@dataclass
+class GeneratorPoints:
+    x: np.ndarray
+    y: np.ndarray
+    capacity: np.ndarray
+    status: Categorical
+    # Index of the first generator type each point matches, -1 for none
+    generator: np.ndarray
+    # Float arrays (NaN for missing) for numeric fields, Categorical for text
+    columns: Dict[str, Union[np.ndarray, Categorical]] = field(default_factory=dict)
+
+    def __len__(self):
+        return len(self.x)
+
+    def numeric(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def categorical(self, name: str) -> Categorical:
+        return self.columns[name]
+
+    def text(self, name: str) -> np.ndarray:
+        return self.columns[name].decode()
+
+    def take(self, rows) -> "GeneratorPoints":
+        return GeneratorPoints(
+            x=self.x[rows],
+            y=self.y[rows],
+            capacity=self.capacity[rows],
+            status=self.status[rows],
+            generator=self.generator[rows],
+            columns={name: column[rows] for name, column in self.columns.items()},
+        )
+
+
+def point_arrays(points: GeneratorPoints) -> Dict[str, np.ndarray]:
+    # One array per column; text columns as their labels and codes
+    arrays = {
+        "x": points.x,
+        "y": points.y,
+        "capacity": points.capacity,
+        "generator": points.generator,
+        "status.labels": points.status.labels.astype(str),
+        "status.codes": points.status.codes,
+    }
+    for i, (name, column) in enumerate(points.columns.items()):
+        if isinstance(column, Categorical):
+            arrays[f"text.{i}.labels"] = column.labels.astype(str)
+            arrays[f"text.{i}.codes"] = column.codes
+        else:
+            arrays[f"numeric.{i}"] = column
+    arrays["column_names"] = np.array(list(points.columns), dtype=str)
+    return arrays
+
+
+def save_points(path: str, points: GeneratorPoints):
+    with open(path, "wb") as f:
+        np.savez(f, **point_arrays(points))
+
+
+def points_digest(points: GeneratorPoints) -> str:
+    # Hash of everything save_points keeps, the same before and after a
+    # save and load
+    digest = hashlib.sha256()
+    for name, array in point_arrays(points).items():
+        array = np.ascontiguousarray(array)
+        digest.update(f"{name}:{array.dtype.str}:{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def load_points(path: str) -> GeneratorPoints:
+    with np.load(path) as arrays:
+
+        def categorical(prefix):
+            return Categorical(
+                labels=arrays[f"{prefix}.labels"].astype(object),
+                codes=arrays[f"{prefix}.codes"],
+            )
+
+        columns = {}
+        for i, name in enumerate(arrays["column_names"].tolist()):
+            if f"numeric.{i}" in arrays:
+                columns[name] = arrays[f"numeric.{i}"]
+            else:
+                columns[name] = categorical(f"text.{i}")
+        return GeneratorPoints(
+            x=arrays["x"],
+            y=arrays["y"],
+            capacity=arrays["capacity"],
+            status=categorical("status"),
+            generator=arrays["generator"],
+            columns=columns,
+        )
+
+
+def hex_layer_group(generator_index, status_index):
+    return 1 + generator_index * len(statuses) + status_index
+
+
+def hex_layer_groups(points: GeneratorPoints) -> Tuple[np.ndarray, np.ndarray]:
+    # Row indices and hex layer groups to bin them under. Every point goes in
+    # the sums layer, and in the layer for its generator type and status.
+    status_codes = points.status.recode(statuses)
+
+    rows = np.flatnonzero((points.generator >= 0) & (status_codes >= 0))
+    generator_indices = points.generator[rows]
+
+    all_rows = np.arange(len(points))
+    return (
+        np.concatenate((all_rows, rows)),
+        np.concatenate(
+            (
+                np.full(len(points), SUMS_GROUP),
+                hex_layer_group(generator_indices, status_codes[rows]),
+            )
+        ),
+    )
+
+
+def hex_layer_names():
+    # GeoPackage layer name of every hex layer group
+    names = {SUMS_GROUP: "sums"}
+    for generator_index, energy_code in enumerate(energy_source_code):
+        for status_index, status in enumerate(statuses):
+            group = hex_layer_group(generator_index, status_index)
+            names[group] = f"{energy_code.name}_{short_status(status)}"
+    return {group: name.replace(" ", "_").lower() for group, name in names.items()}
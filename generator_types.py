@@ -1,12 +1,24 @@
 from dataclasses import dataclass
 from typing import Callable, List, Union
 
+import numpy as np
+
+from group_by import Categorical
+
+
+def _matches_filter(field: str, values: List[str]):
+    if len(values) > 1:
+        return f"""array_contains(array({', '.join([f"'{x}'" for x in values])}), "{field}")"""
+    return f""""{field}" = '{values[0]}'"""
+
 
 @dataclass
 class Generator:
     name: str
     source_filter: Union[Callable[[], str], str, None] = None
     include: Union[List[str], None] = None
+    prime_movers: Union[List[str], None] = None
+    technologies: Union[List[str], None] = None
     color_ramp: Union[str, None] = "Greys"
     single_color: str = "gray"
 
@@ -17,27 +29,108 @@ class Generator:
             self.source_filter = lambda: old_source
             return
 
-        # If include is provided but source_filter is not a callable, create a filter function
+        # If the match fields are provided but source_filter is not a callable,
+        # create a filter function
         if not callable(self.source_filter):
-            if self.include is not None:
-                self.source_filter = lambda: (
-                    f"""array_contains(array({', '.join([f"'{x}'" for x in self.include])}), "Energy Source Code")"""
-                    if len(self.include) > 1
-                    else f""""Energy Source Code" = '{self.include[0]}'"""
+            clauses = [
+                _matches_filter(field, values)
+                for field, values in self.match_fields()
+                if values is not None
+            ]
+            if clauses:
+                self.source_filter = lambda: " AND ".join(clauses)
+
+    def match_fields(self):
+        return [
+            ("Energy Source Code", self.include),
+            ("Prime Mover Code", self.prime_movers),
+            ("Technology", self.technologies),
+        ]
+
+    def matches(self, energy_source_code, prime_mover_code, technology) -> bool:
+        if all(values is None for _, values in self.match_fields()):
+            raise ValueError(
+                f"{self.name} has no include/prime_movers/technologies to match on"
+            )
+        return all(
+            values is None or value in values
+            for (_, values), value in zip(
+                self.match_fields(),
+                (energy_source_code, prime_mover_code, technology),
+            )
+        )
+
+
+class GeneratorClassifier:
+    # Compiles a list of generator types into a lookup table keyed on
+    # ("Energy Source Code", "Prime Mover Code", "Technology"). Each key maps
+    # to the index of the first type that matches it, or -1, so list order
+    # decides ties (BESS before everything, Petroleum before Coal for PC).
+    def __init__(self, generators: List["Generator"]):
+        self.generators = generators
+        self.table = {}
+
+    def definitions(self) -> list:
+        # Everything the lookup depends on, in list order
+        return [
+            (gen.name, gen.include, gen.prime_movers, gen.technologies)
+            for gen in self.generators
+        ]
+
+    def lookup(self, energy_source_code, prime_mover_code, technology) -> int:
+        key = (energy_source_code, prime_mover_code, technology)
+        if key not in self.table:
+            self.table[key] = next(
+                (i for i, gen in enumerate(self.generators) if gen.matches(*key)),
+                -1,
+            )
+        return self.table[key]
+
+    def classify(self, energy_source_code, prime_mover_code, technology):
+        # Generator index for every row of the three columns in one call.
+        # Columns can be Categoricals or plain arrays of strings; only the
+        # distinct combinations are looked up.
+        columns = [
+            (
+                column
+                if isinstance(column, Categorical)
+                else Categorical.from_values([str(v or "").strip() for v in column])
+            )
+            for column in (energy_source_code, prime_mover_code, technology)
+        ]
+        if len(columns[0]) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        combos, inverse = np.unique(
+            np.stack([column.codes for column in columns]),
+            axis=1,
+            return_inverse=True,
+        )
+        indices = np.array(
+            [
+                self.lookup(
+                    *(column.labels[code] for column, code in zip(columns, combo))
                 )
+                for combo in combos.T
+            ],
+            dtype=np.int64,
+        )
+        return indices[inverse.reshape(-1)]
 
 
 # Create instances using the Generator class
 hydro_conventional = Generator(
     name="Conventional Hydro",
-    source_filter=""""Energy Source Code" = 'WAT' AND "Prime Mover Code" = 'HY'""",
+    include=["WAT"],
+    prime_movers=["HY"],
     color_ramp="Blues",
     single_color="dodgerblue",
 )
 
 pumped_storage = Generator(
     name="Pumped Storage",
-    source_filter=""""Energy Source Code" = 'WAT' AND "Prime Mover Code" = 'PS'""",
+    include=["WAT"],
+    prime_movers=["PS"],
     color_ramp="Blues",
     single_color="deepskyblue",
 )
@@ -108,7 +201,7 @@ other_renewables = Generator(
 
 bess = Generator(
     name="BESS",
-    source_filter=lambda: """Technology = 'Batteries'""",
+    technologies=["Batteries"],
     color_ramp="Reds",
     single_color="red",
 )
@@ -125,3 +218,23 @@ energy_source_code = [
     petroleum,
     coal,
 ]
+
+classifier = GeneratorClassifier(energy_source_code)
+
+# Statuses that get their own hex layer per generator type
+# https://www.eia.gov/electricity/monthly/pdf/AppendixC.pdf
+statuses = [
+    "(U) Under construction, less than or equal to 50 percent complete",
+    "(V) Under construction, more than 50 percent complete",
+    "(TS) Construction complete, but not yet in commercial operation",
+    "(OP) Operating",
+    "(SB) Standby/Backup: available for service but not normally used",
+]
+
+
+def short_status(status: str):
+    return status.split("(")[1].split(")")[0]
+
+
+def trimmed_status(status: str):
+    return status.split(")")[1].strip()
@@ -0,0 +1,166 @@
+import sqlite3
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from albers import conus_albers
+from gpkg_writer import quote, wkb_coordinates
+from instrumentation import count
+
+# Reads GeoPackage layers straight through sqlite3, the counterpart of
+# GpkgWriter: attribute columns as arrays and geometries as plain WKB, with
+# no GDAL or QGIS needed.
+
+# Bytes of envelope after the 8-byte blob header, by the flags' envelope code
+_ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+# Geographic NAD83 and WGS 84, which conus_albers projects as they are
+GEOGRAPHIC_SRS = {4269, 4326}
+
+
+def blob_wkb(blob: Optional[bytes]) -> Optional[bytes]:
+    # The WKB inside a GeoPackage geometry blob, None for a null or empty one
+    if blob is None or blob[3] & 0b10000:
+        return None
+    return bytes(blob[8 + _ENVELOPE_SIZES[(blob[3] >> 1) & 0b111] :])
+
+
+@dataclass
+class FeatureTable:
+    # A layer's features as GpkgWriter.write_layer takes them, so a region
+    # layer can be copied into an output with columns added
+    fields: List[Tuple[str, str]]
+    rows: List[list]
+    geometries: List[Optional[bytes]]
+    geometry_type: Optional[str]
+    # (srs_id, name, definition)
+    srs: Optional[Tuple[int, str, str]]
+
+    def column(self, name: str) -> list:
+        index = [field for field, _ in self.fields].index(name)
+        return [row[index] for row in self.rows]
+
+
+class GpkgReader:
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def layers(self) -> List[str]:
+        return [
+            name
+            for (name,) in self.connection.execute(
+                "SELECT table_name FROM gpkg_contents ORDER BY table_name"
+            )
+        ]
+
+    def releases(self) -> Dict[str, str]:
+        # Generator release digest of each output, as GpkgWriter.set_release
+        # recorded them
+        if not self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'generator_releases'"
+        ).fetchone():
+            return {}
+        return dict(
+            self.connection.execute("SELECT output, release FROM generator_releases")
+        )
+
+    def geometry_column(self, name: str) -> Optional[Tuple[str, str, int]]:
+        # (column, geometry type, srs id), None for an attribute table
+        return self.connection.execute(
+            "SELECT column_name, geometry_type_name, srs_id "
+            "FROM gpkg_geometry_columns WHERE table_name = ?",
+            (name,),
+        ).fetchone()
+
+    def fields(self, name: str) -> List[Tuple[str, str]]:
+        # (name, type) of every attribute column, without the fid and
+        # geometry columns
+        geometry = self.geometry_column(name)
+        return [
+            (column, column_type)
+            for _, column, column_type, _, _, primary_key in self.connection.execute(
+                f"PRAGMA table_info({quote(name)})"
+            )
+            if not primary_key and (geometry is None or column != geometry[0])
+        ]
+
+    def srs(self, srs_id: int) -> Tuple[int, str, str]:
+        return self.connection.execute(
+            "SELECT srs_id, srs_name, definition FROM gpkg_spatial_ref_sys "
+            "WHERE srs_id = ?",
+            (srs_id,),
+        ).fetchone()
+
+    def columns(
+        self, name: str, fields: Sequence[str], where: str = ""
+    ) -> Dict[str, np.ndarray]:
+        # Each field as an array, floats for numeric columns (NULL as NaN)
+        # and objects otherwise, in fid order
+        types = dict(self.fields(name))
+        rows = self.connection.execute(
+            f"SELECT {', '.join(quote(field) for field in fields) or 'fid'} "
+            f"FROM {quote(name)} {where} ORDER BY fid"
+        ).fetchall()
+        count("features_read", len(rows))
+        columns = {}
+        for i, field in enumerate(fields):
+            values = [row[i] for row in rows]
+            if types[field].upper() in ("INTEGER", "REAL", "DOUBLE", "FLOAT"):
+                columns[field] = np.array(
+                    [np.nan if v is None else v for v in values], dtype=np.float64
+                )
+            else:
+                columns[field] = np.array(values, dtype=object)
+        return columns
+
+    def table(self, name: str) -> FeatureTable:
+        # Every feature of a layer, fids dropped
+        fields = self.fields(name)
+        geometry = self.geometry_column(name)
+        selected = [quote(field) for field, _ in fields]
+        if geometry is not None:
+            selected.append(quote(geometry[0]))
+        rows = self.connection.execute(
+            f"SELECT {', '.join(selected)} FROM {quote(name)} ORDER BY fid"
+        ).fetchall()
+        count("features_read", len(rows))
+        if geometry is None:
+            return FeatureTable(fields, [list(row) for row in rows], [], None, None)
+        return FeatureTable(
+            fields,
+            [list(row[:-1]) for row in rows],
+            [blob_wkb(row[-1]) for row in rows],
+            geometry[1],
+            self.srs(geometry[2]),
+        )
+
+
+def polygon_rings(
+    table: FeatureTable, key_field: str
+) -> Tuple[List[str], List[List[np.ndarray]]]:
+    # Every ring of every feature, grouped by key, in EPSG:5070 (projected
+    # from geographic coordinates when the layer has them), as
+    # validation.PolygonIndex.from_rings takes them
+    srs_id = table.srs[0] if table.srs else None
+    if srs_id not in GEOGRAPHIC_SRS | {5070}:
+        raise ValueError(f"Can't project SRS {srs_id} to EPSG:5070")
+    rings = {}
+    for key, wkb in zip(table.column(key_field), table.geometries):
+        if wkb is None:
+            continue
+        key_rings = rings.setdefault(str(key or "").strip(), [])
+        for ring in wkb_coordinates(wkb):
+            if srs_id in GEOGRAPHIC_SRS:
+                ring = np.stack(conus_albers.forward(ring[:, 0], ring[:, 1]), axis=1)
+            key_rings.append(ring)
+    return list(rings), list(rings.values())
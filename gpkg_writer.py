@@ -0,0 +1,618 @@
+import sqlite3
+import struct
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from instrumentation import count, span
+from progress import check_cancelled
+
+# GeoPackage layers written straight through sqlite3: one connection and one
+# transaction for the whole writer, rows streamed in large batches, and
+# R-tree spatial indexes built once at the end instead of maintained row by
+# row. Nothing is committed until the writer closes, so a failed or
+# cancelled write rolls back whole and the file keeps its last good state.
+# The commit goes through SQLite's default rollback journal, synced, so a
+# crash or power cut during it leaves that state too.
+#
+# The R-tree triggers are the GeoPackage extension's own, calling ST_MinX,
+# ST_MaxX, ST_MinY, ST_MaxY and ST_IsEmpty. GDAL, and so QGIS, defines
+# those; any other sqlite3 connection editing a spatial layer of these
+# files needs register_gpkg_functions first, or its edits fail with "no
+# such function".
+
+NAD83_CONUS_ALBERS = (
+    5070,
+    "NAD83 / Conus Albers",
+    'PROJCS["NAD83 / Conus Albers",GEOGCS["NAD83",DATUM["North_American_Datum_1983",'
+    'SPHEROID["GRS 1980",6378137,298.257222101,AUTHORITY["EPSG","7019"]],'
+    'AUTHORITY["EPSG","6269"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+    'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+    'AUTHORITY["EPSG","4269"]],PROJECTION["Albers_Conic_Equal_Area"],'
+    'PARAMETER["latitude_of_center",23],PARAMETER["longitude_of_center",-96],'
+    'PARAMETER["standard_parallel_1",29.5],PARAMETER["standard_parallel_2",45.5],'
+    'PARAMETER["false_easting",0],PARAMETER["false_northing",0],'
+    'UNIT["metre",1,AUTHORITY["EPSG","9001"]],AXIS["Easting",EAST],'
+    'AXIS["Northing",NORTH],AUTHORITY["EPSG","5070"]]',
+)
+
+WGS_84 = (
+    4326,
+    "WGS 84 geodetic",
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+    'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],'
+    'PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+    'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+    'AXIS["Latitude",NORTH],AXIS["Longitude",EAST],AUTHORITY["EPSG","4326"]]',
+)
+
+# Rows per insert batch, and between checks for a cancelled task
+BATCH_SIZE = 50000
+
+_WKB_POINT = 1
+_WKB_LINESTRING = 2
+_WKB_POLYGON = 3
+
+
+def point_wkb(x: float, y: float) -> bytes:
+    return struct.pack("<BIdd", 1, _WKB_POINT, x, y)
+
+
+def polygon_wkb(ring) -> bytes:
+    # Single-ring polygon from an (n, 2) closed ring
+    ring = np.ascontiguousarray(ring, dtype="<f8")
+    return struct.pack("<BIII", 1, _WKB_POLYGON, 1, len(ring)) + ring.tobytes()
+
+
+def ring_envelopes(rings) -> List[List[float]]:
+    # (min_x, max_x, min_y, max_y) of each of an (n, m, 2) array of rings,
+    # for the polygon_wkb of each
+    x, y = rings[..., 0], rings[..., 1]
+    return np.stack(
+        (x.min(axis=1), x.max(axis=1), y.min(axis=1), y.max(axis=1)), axis=1
+    ).tolist()
+
+
+def wkb_coordinates(wkb: bytes) -> List[np.ndarray]:
+    # (n, 2) x/y arrays of every point run of any WKB geometry: one per
+    # point, line string or polygon ring, in order
+    coordinates = []
+    _read_wkb(memoryview(wkb), 0, coordinates)
+    return coordinates
+
+
+def wkb_envelope(wkb: bytes) -> Optional[Tuple[float, float, float, float]]:
+    # (min_x, max_x, min_y, max_y) of any 2D/Z/M WKB geometry, None if empty
+    coordinates = wkb_coordinates(wkb)
+    if not coordinates:
+        return None
+    xy = np.concatenate(coordinates)
+    xy = xy[~np.isnan(xy[:, 0])]
+    if len(xy) == 0:
+        return None
+    return tuple(
+        float(v)
+        for v in (xy[:, 0].min(), xy[:, 0].max(), xy[:, 1].min(), xy[:, 1].max())
+    )
+
+
+def _read_wkb(buffer, offset: int, coordinates: List[np.ndarray]) -> int:
+    byte_order = "<" if buffer[offset] == 1 else ">"
+    (geometry_type,) = struct.unpack_from(f"{byte_order}I", buffer, offset + 1)
+    offset += 5
+
+    # EWKB flags, or ISO Z / M / ZM type offsets
+    dimensions = 2 + bool(geometry_type & 0x80000000) + bool(geometry_type & 0x40000000)
+    if geometry_type & 0x20000000:
+        offset += 4
+    geometry_type &= 0x0FFFFFFF
+    dimensions += {1: 1, 2: 1, 3: 2}.get(geometry_type // 1000, 0)
+    geometry_type %= 1000
+
+    def read_points(count, offset):
+        values = np.frombuffer(
+            buffer, dtype=f"{byte_order}f8", count=count * dimensions, offset=offset
+        )
+        coordinates.append(values.reshape(count, dimensions)[:, :2])
+        return offset + count * dimensions * 8
+
+    if geometry_type == _WKB_POINT:
+        return read_points(1, offset)
+    (count,) = struct.unpack_from(f"{byte_order}I", buffer, offset)
+    offset += 4
+    if geometry_type == _WKB_LINESTRING:
+        return read_points(count, offset)
+    if geometry_type == _WKB_POLYGON:
+        for _ in range(count):
+            (points,) = struct.unpack_from(f"{byte_order}I", buffer, offset)
+            offset = read_points(points, offset + 4)
+        return offset
+    # Multi* and GeometryCollection: a list of whole WKB geometries
+    for _ in range(count):
+        offset = _read_wkb(buffer, offset, coordinates)
+    return offset
+
+
+def gpkg_blob(wkb: bytes, srs_id: int, envelope) -> bytes:
+    if envelope is None:
+        # Empty geometry: flags say little endian, no envelope, empty
+        return struct.pack("<2sBBi", b"GP", 0, 0b10001, srs_id) + wkb
+    return struct.pack("<2sBBi4d", b"GP", 0, 0b11, srs_id, *envelope) + wkb
+
+
+def gpkg_envelope(blob: bytes):
+    # Envelope back out of a GeoPackage geometry blob, None if it's empty
+    flags = blob[3]
+    byte_order = "<" if flags & 1 else ">"
+    if flags & 0b10000:
+        return None
+    if (flags >> 1) & 0b111:
+        return struct.unpack_from(f"{byte_order}4d", blob, 8)
+    return wkb_envelope(bytes(blob[8:]))
+
+
+def _envelope_value(index: int, blob):
+    envelope = None if blob is None else gpkg_envelope(blob)
+    return None if envelope is None else envelope[index]
+
+
+def _is_empty(blob):
+    return None if blob is None else int(gpkg_envelope(blob) is None)
+
+
+def register_gpkg_functions(connection: sqlite3.Connection):
+    # The functions the R-tree triggers call, computed from each geometry
+    # blob's envelope
+    for function, index in (
+        ("ST_MinX", 0),
+        ("ST_MaxX", 1),
+        ("ST_MinY", 2),
+        ("ST_MaxY", 3),
+    ):
+        connection.create_function(
+            function, 1, partial(_envelope_value, index), deterministic=True
+        )
+    connection.create_function("ST_IsEmpty", 1, _is_empty, deterministic=True)
+
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class GpkgWriter:
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        # One transaction per writer, so syncing costs little: only the
+        # commit (and any cache spill) waits for the disk
+        self.connection.execute("PRAGMA journal_mode = DELETE")
+        self.connection.execute("PRAGMA synchronous = FULL")
+        self.connection.execute("PRAGMA temp_store = MEMORY")
+        self.connection.execute("PRAGMA cache_size = -131072")
+        # Envelopes of every spatial layer written, indexed on close
+        self.spatial_layers: Dict[str, Tuple[List[int], List[tuple]]] = {}
+
+        # So edits made through this connection keep existing spatial
+        # indexes up to date
+        register_gpkg_functions(self.connection)
+
+        self.connection.execute("BEGIN")
+        self._create_metadata_tables()
+        self.add_srs(*WGS_84)
+        self.add_srs(*NAD83_CONUS_ALBERS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.connection.execute("ROLLBACK")
+            self.connection.close()
+
+    def _create_metadata_tables(self):
+        execute = self.connection.execute
+        execute("PRAGMA application_id = 1196444487")
+        execute("PRAGMA user_version = 10200")
+        execute("""CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (
+                srs_name TEXT NOT NULL,
+                srs_id INTEGER NOT NULL PRIMARY KEY,
+                organization TEXT NOT NULL,
+                organization_coordsys_id INTEGER NOT NULL,
+                definition TEXT NOT NULL,
+                description TEXT
+            )""")
+        execute("""CREATE TABLE IF NOT EXISTS gpkg_contents (
+                table_name TEXT NOT NULL PRIMARY KEY,
+                data_type TEXT NOT NULL,
+                identifier TEXT UNIQUE,
+                description TEXT DEFAULT '',
+                last_change DATETIME NOT NULL
+                    DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+                min_x DOUBLE,
+                min_y DOUBLE,
+                max_x DOUBLE,
+                max_y DOUBLE,
+                srs_id INTEGER,
+                CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id)
+                    REFERENCES gpkg_spatial_ref_sys(srs_id)
+            )""")
+        execute("""CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (
+                table_name TEXT NOT NULL,
+                column_name TEXT NOT NULL,
+                geometry_type_name TEXT NOT NULL,
+                srs_id INTEGER NOT NULL,
+                z TINYINT NOT NULL,
+                m TINYINT NOT NULL,
+                CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+                CONSTRAINT uk_gc_table_name UNIQUE (table_name),
+                CONSTRAINT fk_gc_tn FOREIGN KEY (table_name)
+                    REFERENCES gpkg_contents(table_name),
+                CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id)
+                    REFERENCES gpkg_spatial_ref_sys (srs_id)
+            )""")
+        execute("""CREATE TABLE IF NOT EXISTS gpkg_extensions (
+                table_name TEXT,
+                column_name TEXT,
+                extension_name TEXT NOT NULL,
+                definition TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name)
+            )""")
+        for srs_id, name in (
+            (-1, "Undefined cartesian SRS"),
+            (0, "Undefined geographic SRS"),
+        ):
+            execute(
+                "INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, 'NONE', ?, 'undefined', ?)",
+                (name, srs_id, srs_id, name),
+            )
+
+    def add_srs(self, srs_id: int, name: str, definition: str, organization="EPSG"):
+        self.connection.execute(
+            "INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, NULL)",
+            (name, srs_id, organization, srs_id, definition),
+        )
+
+    def drop_layer(self, name: str):
+        execute = self.connection.execute
+        for (column,) in execute(
+            "SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?",
+            (name,),
+        ).fetchall():
+            execute(f"DROP TABLE IF EXISTS {quote(f'rtree_{name}_{column}')}")
+        for (kind,) in execute(
+            "SELECT type FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')",
+            (name,),
+        ).fetchall():
+            execute(f"DROP {kind.upper()} {quote(name)}")
+        for table in ("gpkg_extensions", "gpkg_geometry_columns", "gpkg_contents"):
+            execute(f"DELETE FROM {table} WHERE table_name = ?", (name,))
+        # GDAL's cached feature counts, if GDAL has touched this file
+        if execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'gpkg_ogr_contents'"
+        ).fetchone():
+            execute("DELETE FROM gpkg_ogr_contents WHERE table_name = ?", (name,))
+
+    def write_layer(
+        self,
+        name: str,
+        fields: Sequence[Tuple[str, str]],
+        rows: Iterable[Sequence],
+        geometries: Optional[Iterable[Optional[bytes]]] = None,
+        geometry_type: Optional[str] = None,
+        srs_id: int = 5070,
+        fids: Optional[Iterable[int]] = None,
+        envelopes: Optional[Iterable[Optional[Sequence[float]]]] = None,
+    ) -> str:
+        # Replace layer `name` with the given rows. fields are (name, GPKG
+        # type) pairs, geometries are WKB (or None), and fids, if given, pin
+        # each row's feature id. envelopes, if given, are each geometry's
+        # (min_x, max_x, min_y, max_y), taken from the coordinates its WKB was
+        # made from; otherwise they're read back out of the WKB. Returns the
+        # layer's OGR uri.
+        self.drop_layer(name)
+        spatial = geometry_type is not None
+        columns = ["fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL"]
+        if spatial:
+            columns.append(f"geom {geometry_type}")
+        columns += [f"{quote(field)} {field_type}" for field, field_type in fields]
+        self.connection.execute(f"CREATE TABLE {quote(name)} ({', '.join(columns)})")
+
+        self.connection.execute(
+            "INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                name,
+                "features" if spatial else "attributes",
+                name,
+                srs_id if spatial else None,
+            ),
+        )
+        if spatial:
+            self.connection.execute(
+                "INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, ?, 0, 0)",
+                (name, geometry_type, srs_id),
+            )
+
+        if spatial:
+            self.spatial_layers[name] = ([], [])
+        self._append(
+            name,
+            fields,
+            rows,
+            geometries,
+            srs_id if spatial else None,
+            fids,
+            envelopes,
+        )
+        return self.uri(name)
+
+    def set_release(self, output: str, release: str):
+        # Records that output (one build's layers in this file) was made from
+        # the generator release with this digest; GpkgReader.releases reads
+        # them back. A plain table, outside gpkg_contents.
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS generator_releases "
+            "(output TEXT PRIMARY KEY NOT NULL, release TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO generator_releases VALUES (?, ?)",
+            (output, release),
+        )
+
+    def has_layer(self, name: str) -> bool:
+        return (
+            self.connection.execute(
+                "SELECT 1 FROM gpkg_contents WHERE table_name = ?", (name,)
+            ).fetchone()
+            is not None
+        )
+
+    def fids(self, name: str) -> np.ndarray:
+        return np.array(
+            [
+                fid
+                for (fid,) in self.connection.execute(f"SELECT fid FROM {quote(name)}")
+            ],
+            dtype=np.int64,
+        )
+
+    def column(self, name: str, field: str) -> list:
+        # A field's values, in fid order
+        return [
+            value
+            for (value,) in self.connection.execute(
+                f"SELECT {quote(field)} FROM {quote(name)} ORDER BY fid"
+            )
+        ]
+
+    def append_rows(
+        self,
+        name: str,
+        fields: Sequence[Tuple[str, str]],
+        rows: Iterable[Sequence],
+        geometries: Optional[Iterable[Optional[bytes]]] = None,
+        fids: Optional[Iterable[int]] = None,
+        envelopes: Optional[Iterable[Optional[Sequence[float]]]] = None,
+    ):
+        # Add rows to an existing layer, with arguments as for write_layer.
+        # Its spatial index, if it has one, keeps up through the R-tree
+        # triggers.
+        geometry_column = self.connection.execute(
+            "SELECT srs_id FROM gpkg_geometry_columns WHERE table_name = ?", (name,)
+        ).fetchone()
+        self._append(
+            name,
+            fields,
+            rows,
+            geometries,
+            geometry_column and geometry_column[0],
+            fids,
+            envelopes,
+        )
+
+    def delete_rows(self, name: str, columns: Sequence[str], keys: Iterable[Sequence]):
+        # Delete every row whose columns match one of the keys
+        self.connection.executemany(
+            f"DELETE FROM {quote(name)} WHERE "
+            + " AND ".join(f"{quote(column)} = ?" for column in columns),
+            (tuple(key) for key in keys),
+        )
+
+    def update_rows(
+        self,
+        name: str,
+        key_column: str,
+        columns: Sequence[str],
+        rows: Iterable[Sequence],
+    ):
+        # Set columns on the rows matching each key; rows are the column
+        # values followed by the key
+        self.connection.executemany(
+            f"UPDATE {quote(name)} SET "
+            + ", ".join(f"{quote(column)} = ?" for column in columns)
+            + f" WHERE {quote(key_column)} = ?",
+            (tuple(row) for row in rows),
+        )
+
+    def _append(self, name, fields, rows, geometries, srs_id, fids, given_envelopes):
+        spatial = srs_id is not None
+        insert_columns = (
+            ["fid"]
+            + (["geom"] if spatial else [])
+            + [quote(field) for field, _ in fields]
+        )
+        insert = (
+            f"INSERT INTO {quote(name)} ({', '.join(insert_columns)}) "
+            f"VALUES ({', '.join('?' * len(insert_columns))})"
+        )
+
+        (next_fid,) = self.connection.execute(
+            f"SELECT coalesce(max(fid), 0) + 1 FROM {quote(name)}"
+        ).fetchone()
+        fids = iter(fids) if fids is not None else None
+        geometries = iter(geometries) if spatial else None
+        if given_envelopes is not None:
+            given_envelopes = iter(given_envelopes) if spatial else None
+        envelope_fids, envelopes = [], []
+        batch, written = [], 0
+        for fid, row in enumerate(rows, start=next_fid):
+            if fids is not None:
+                fid = int(next(fids))
+            values = [fid]
+            if spatial:
+                wkb = next(geometries)
+                envelope = None
+                if given_envelopes is not None:
+                    envelope = next(given_envelopes)
+                if wkb is None:
+                    values.append(None)
+                else:
+                    if given_envelopes is None:
+                        envelope = wkb_envelope(wkb)
+                    values.append(gpkg_blob(wkb, srs_id, envelope))
+                    if envelope is not None:
+                        envelope_fids.append(fid)
+                        envelopes.append(envelope)
+            values.extend(row)
+            batch.append(values)
+            if len(batch) >= self.batch_size:
+                self._insert(insert, batch)
+                written += len(batch)
+                batch = []
+                check_cancelled()
+        self._insert(insert, batch)
+        count("features_written", written + len(batch))
+
+        if envelopes:
+            # Layers written by this writer get their index on close
+            if name in self.spatial_layers:
+                self.spatial_layers[name][0].extend(envelope_fids)
+                self.spatial_layers[name][1].extend(envelopes)
+            extent = np.asarray(envelopes)
+            self.connection.execute(
+                "UPDATE gpkg_contents SET min_x = min(coalesce(min_x, ?1), ?1), "
+                "max_x = max(coalesce(max_x, ?2), ?2), "
+                "min_y = min(coalesce(min_y, ?3), ?3), "
+                "max_y = max(coalesce(max_y, ?4), ?4), "
+                "last_change = strftime('%Y-%m-%dT%H:%M:%fZ','now') "
+                "WHERE table_name = ?5",
+                (
+                    float(extent[:, 0].min()),
+                    float(extent[:, 1].max()),
+                    float(extent[:, 2].min()),
+                    float(extent[:, 3].max()),
+                    name,
+                ),
+            )
+
+    def _insert(self, insert: str, batch: List[Sequence]):
+        if not batch:
+            return
+        self.connection.executemany(insert, batch)
+
+    def write_view(
+        self,
+        name: str,
+        select: str,
+        geometry_type: Optional[str] = None,
+        srs_id: int = 5070,
+        extent_of: Optional[str] = None,
+    ) -> str:
+        # Register a SELECT over layers already written as a layer of its own.
+        # Its first column should be an integer feature id, and a spatial
+        # view's geometry column must be called geom. extent_of names the
+        # layer whose extent the view shares.
+        self.drop_layer(name)
+        self.connection.execute(f"CREATE VIEW {quote(name)} AS {select}")
+        spatial = geometry_type is not None
+        self.connection.execute(
+            "INSERT INTO gpkg_contents (table_name, data_type, identifier, "
+            "min_x, min_y, max_x, max_y, srs_id) "
+            "SELECT ?, ?, ?, min_x, min_y, max_x, max_y, ? FROM (SELECT 1) "
+            "LEFT JOIN gpkg_contents ON table_name = ?",
+            (
+                name,
+                "features" if spatial else "attributes",
+                name,
+                srs_id if spatial else None,
+                extent_of,
+            ),
+        )
+        if spatial:
+            self.connection.execute(
+                "INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, ?, 0, 0)",
+                (name, geometry_type, srs_id),
+            )
+        return self.uri(name)
+
+    def create_index(self, name: str, columns: Sequence[str]):
+        index = f"idx_{name}_{'_'.join(columns)}"
+        self.connection.execute(f"DROP INDEX IF EXISTS {quote(index)}")
+        self.connection.execute(
+            f"CREATE INDEX {quote(index)} ON {quote(name)} "
+            f"({', '.join(quote(column) for column in columns)})"
+        )
+
+    def uri(self, name: str) -> str:
+        return f"{self.path}|layername={name}"
+
+    def create_spatial_index(self, name: str, fids, envelopes):
+        rtree = f"rtree_{name}_geom"
+        execute = self.connection.execute
+        execute(
+            f"CREATE VIRTUAL TABLE {quote(rtree)} USING rtree(id, minx, maxx, miny, maxy)"
+        )
+        self.connection.executemany(
+            f"INSERT INTO {quote(rtree)} VALUES (?, ?, ?, ?, ?)",
+            ((fid, *envelope) for fid, envelope in zip(fids, envelopes)),
+        )
+        execute(
+            "INSERT INTO gpkg_extensions VALUES (?, 'geom', 'gpkg_rtree_index', "
+            "'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')",
+            (name,),
+        )
+        for trigger in _rtree_triggers(quote(name), quote(rtree), f"{rtree}"):
+            execute(trigger)
+
+    def close(self):
+        # Spatial indexes go in last, in the same transaction as the data
+        with span("spatial_index", layers=len(self.spatial_layers)):
+            for name, (fids, envelopes) in self.spatial_layers.items():
+                self.create_spatial_index(name, fids, envelopes)
+        self.spatial_layers = {}
+        with span("commit", path=self.path):
+            self.connection.execute("COMMIT")
+        self.connection.close()
+
+
+def _rtree_triggers(table: str, rtree: str, prefix: str) -> List[str]:
+    # The triggers from the GeoPackage R-tree extension that keep the index in
+    # step with later edits (e.g. made in QGIS)
+    insert = f"""INSERT OR REPLACE INTO {rtree} VALUES (
+        NEW.fid, ST_MinX(NEW.geom), ST_MaxX(NEW.geom),
+        ST_MinY(NEW.geom), ST_MaxY(NEW.geom))"""
+    return [
+        f"""CREATE TRIGGER {quote(prefix + '_insert')} AFTER INSERT ON {table}
+        WHEN (NEW.geom NOT NULL AND NOT ST_IsEmpty(NEW.geom))
+        BEGIN {insert}; END""",
+        f"""CREATE TRIGGER {quote(prefix + '_update1')} AFTER UPDATE OF geom ON {table}
+        WHEN OLD.fid = NEW.fid AND (NEW.geom NOTNULL AND NOT ST_IsEmpty(NEW.geom))
+        BEGIN {insert}; END""",
+        f"""CREATE TRIGGER {quote(prefix + '_update2')} AFTER UPDATE OF geom ON {table}
+        WHEN OLD.fid = NEW.fid AND (NEW.geom ISNULL OR ST_IsEmpty(NEW.geom))
+        BEGIN DELETE FROM {rtree} WHERE id = OLD.fid; END""",
+        f"""CREATE TRIGGER {quote(prefix + '_update3')} AFTER UPDATE ON {table}
+        WHEN OLD.fid != NEW.fid AND (NEW.geom NOTNULL AND NOT ST_IsEmpty(NEW.geom))
+        BEGIN DELETE FROM {rtree} WHERE id = OLD.fid; {insert}; END""",
+        f"""CREATE TRIGGER {quote(prefix + '_update4')} AFTER UPDATE ON {table}
+        WHEN OLD.fid != NEW.fid AND (NEW.geom ISNULL OR ST_IsEmpty(NEW.geom))
+        BEGIN DELETE FROM {rtree} WHERE id IN (OLD.fid, NEW.fid); END""",
+        f"""CREATE TRIGGER {quote(prefix + '_delete')} AFTER DELETE ON {table}
+        WHEN OLD.geom NOT NULL
+        BEGIN DELETE FROM {rtree} WHERE id = OLD.fid; END""",
+    ]
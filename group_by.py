@@ -0,0 +1,108 @@
+from array import array
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+
+
+@dataclass
+class Categorical:
+    # Dictionary-encoded text column: codes index into labels
+    labels: np.ndarray
+    codes: np.ndarray
+
+    @classmethod
+    def from_values(cls, values) -> "Categorical":
+        labels, codes = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        return cls(labels=labels, codes=codes.astype(np.int32))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index) -> "Categorical":
+        return Categorical(labels=self.labels, codes=self.codes[index])
+
+    def decode(self) -> np.ndarray:
+        return self.labels[self.codes]
+
+    def code_of(self, label: str) -> int:
+        matches = np.flatnonzero(self.labels == label)
+        return int(matches[0]) if len(matches) else -1
+
+    def recode(self, labels: Sequence[str]) -> np.ndarray:
+        # Position of each row's label in `labels`, -1 where it isn't listed
+        lookup = np.full(len(self.labels), -1, dtype=np.int64)
+        for i, label in enumerate(labels):
+            code = self.code_of(label)
+            if code >= 0:
+                lookup[code] = i
+        return lookup[self.codes]
+
+
+class CategoricalBuilder:
+    # Dictionary-encodes text values as they stream in
+    def __init__(self):
+        self.lookup = {}
+        self.codes = array("i")
+
+    def append(self, value):
+        label = str(value or "").strip()
+        self.codes.append(self.lookup.setdefault(label, len(self.lookup)))
+
+    def build(self) -> Categorical:
+        labels = np.array(list(self.lookup), dtype=object)
+        codes = np.frombuffer(self.codes, dtype=np.int32)
+        # Sorted labels, same as Categorical.from_values
+        order = np.argsort(labels)
+        remap = np.empty(len(labels), dtype=np.int32)
+        remap[order] = np.arange(len(labels), dtype=np.int32)
+        return Categorical(labels=labels[order], codes=remap[codes])
+
+
+class NumericBuilder:
+    def __init__(self):
+        self.values = array("d")
+
+    def append(self, value):
+        try:
+            self.values.append(float(value))
+        except (TypeError, ValueError):
+            self.values.append(np.nan)
+
+    def build(self) -> np.ndarray:
+        return np.frombuffer(self.values, dtype=np.float64)
+
+
+def group_sums(
+    group_ids: np.ndarray, n_groups: int, weights: Sequence[np.ndarray]
+) -> np.ndarray:
+    # Per-group sum of every weight column, shaped (len(weights), n_groups).
+    # Rows with a negative group id are left out.
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    keep = group_ids >= 0
+    group_ids = group_ids[keep]
+    return np.stack(
+        [
+            np.bincount(
+                group_ids,
+                weights=np.asarray(weight, dtype=np.float64)[keep],
+                minlength=n_groups,
+            )
+            for weight in weights
+        ]
+    ).reshape(len(weights), n_groups)
+
+
+def weighted_centroids(
+    group_ids: np.ndarray, n_groups: int, capacity: np.ndarray, x: np.ndarray, y
+):
+    # Total capacity and capacity-weighted mean x/y per group, NaN for groups
+    # without capacity
+    total, weighted_x, weighted_y = group_sums(
+        group_ids, n_groups, [capacity, capacity * x, capacity * y]
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        has_capacity = total > 0
+        avg_x = np.where(has_capacity, weighted_x / total, np.nan)
+        avg_y = np.where(has_capacity, weighted_y / total, np.nan)
+    return total, avg_x, avg_y
@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from parallel import WORKERS, map_partitions
+
+
+@dataclass
+class CellSummary:
+    cell_ids: np.ndarray
+    count: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+    total: np.ndarray
+
+    @property
+    def range(self):
+        return self.maximum - self.minimum
+
+    def __len__(self):
+        return len(self.cell_ids)
+
+    def take(self, index) -> "CellSummary":
+        return CellSummary(
+            cell_ids=self.cell_ids[index],
+            count=self.count[index],
+            minimum=self.minimum[index],
+            maximum=self.maximum[index],
+            total=self.total[index],
+        )
+
+
+def summarize_by_cell(
+    cell_ids: np.ndarray, group_ids: np.ndarray, values: np.ndarray
+) -> Dict[int, CellSummary]:
+    # count/min/max/sum of values for every (group, cell) pair in one sort.
+    # Rows with a negative cell or group id (no cell / no group) are skipped.
+    values = np.asarray(values, dtype=np.float64)
+    return combine_summaries(
+        cell_ids,
+        group_ids,
+        np.ones(len(values), dtype=np.int64),
+        values,
+        values,
+        values,
+    )
+
+
+def _summarize_group_range(arrays, group_range) -> Dict[int, CellSummary]:
+    low, high = group_range
+    group_ids = arrays["group_ids"]
+    keep = (group_ids >= low) & (group_ids < high)
+    return summarize_by_cell(
+        arrays["cell_ids"][keep], group_ids[keep], arrays["values"][keep]
+    )
+
+
+def summarize_by_cell_partitioned(
+    cell_ids: np.ndarray,
+    group_ids: np.ndarray,
+    values: np.ndarray,
+    group_ranges: Sequence[Tuple[int, int]],
+    workers: int = WORKERS,
+) -> Dict[int, CellSummary]:
+    # summarize_by_cell, one [low, high) range of groups at a time and
+    # possibly in parallel. Groups never share a summary, so this matches the
+    # single pass exactly for every group inside the ranges.
+    summaries = {}
+    for partial in map_partitions(
+        _summarize_group_range,
+        {
+            "cell_ids": np.asarray(cell_ids, dtype=np.int64),
+            "group_ids": np.asarray(group_ids, dtype=np.int64),
+            "values": np.asarray(values, dtype=np.float64),
+        },
+        list(group_ranges),
+        workers,
+    ):
+        summaries.update(partial)
+    return summaries
+
+
+def combine_summaries(
+    cell_ids: np.ndarray,
+    group_ids: np.ndarray,
+    count: np.ndarray,
+    minimum: np.ndarray,
+    maximum: np.ndarray,
+    total: np.ndarray,
+) -> Dict[int, CellSummary]:
+    # Merge partial summaries that share a (group, cell) key, e.g. finer cells
+    # rolled up into the coarser cell that contains them
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    count = np.asarray(count, dtype=np.int64)
+    minimum = np.asarray(minimum, dtype=np.float64)
+    maximum = np.asarray(maximum, dtype=np.float64)
+    total = np.asarray(total, dtype=np.float64)
+
+    keep = (cell_ids >= 0) & (group_ids >= 0)
+    if not keep.any():
+        return {}
+
+    order = np.lexsort((cell_ids[keep], group_ids[keep]))
+    cell_ids, group_ids = cell_ids[keep][order], group_ids[keep][order]
+    count, minimum = count[keep][order], minimum[keep][order]
+    maximum, total = maximum[keep][order], total[keep][order]
+
+    run_starts = np.flatnonzero(
+        np.concatenate(
+            (
+                [True],
+                (cell_ids[1:] != cell_ids[:-1]) | (group_ids[1:] != group_ids[:-1]),
+            )
+        )
+    )
+    run_cells = cell_ids[run_starts]
+    run_groups = group_ids[run_starts]
+    count = np.add.reduceat(count, run_starts)
+    minimum = np.minimum.reduceat(minimum, run_starts)
+    maximum = np.maximum.reduceat(maximum, run_starts)
+    total = np.add.reduceat(total, run_starts)
+
+    group_starts = np.flatnonzero(
+        np.concatenate(([True], run_groups[1:] != run_groups[:-1]))
+    )
+    group_ends = np.append(group_starts[1:], len(run_groups))
+
+    return {
+        int(run_groups[start]): CellSummary(
+            cell_ids=run_cells[start:end],
+            count=count[start:end],
+            minimum=minimum[start:end],
+            maximum=maximum[start:end],
+            total=total[start:end],
+        )
+        for start, end in zip(group_starts, group_ends)
+    }
@@ -0,0 +1,106 @@
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+# CONUS extent and spacing of the original native:creategrid run (EPSG:5070)
+CONUS_EXTENT = (
+    -3599775.515500000,
+    88872.426600000,
+    3627909.786400000,
+    3332064.549200000,
+)
+GRID_SPACING = 40000
+
+
+@dataclass(frozen=True)
+class HexGrid:
+    # Mirrors the hexagon layout of native:creategrid (TYPE 4): flat-topped
+    # hexagons of height `spacing`, laid out column by column from the top
+    # left of the extent, odd columns shifted down half a cell, with feature
+    # ids counting 1, 2, ... down each column in turn.
+    xmin: float
+    ymin: float
+    xmax: float
+    ymax: float
+    spacing: float = GRID_SPACING
+
+    @property
+    def x_vertex_lo(self):
+        return 0.288675134594813 * self.spacing
+
+    @property
+    def x_vertex_hi(self):
+        return 0.577350269189626 * self.spacing
+
+    @property
+    def column_spacing(self):
+        return self.x_vertex_lo + self.x_vertex_hi
+
+    @property
+    def columns(self):
+        return math.ceil((self.xmax - self.xmin) / self.column_spacing)
+
+    @property
+    def rows(self):
+        return math.ceil((self.ymax - self.ymin) / self.spacing)
+
+    def _row_for_column(self, y, col):
+        offset = (col % 2) * (self.spacing / 2)
+        return np.floor((self.ymax - offset - y) / self.spacing).astype(np.int64)
+
+    def cell_ids(self, x, y) -> np.ndarray:
+        # The owning hexagon is the one with the nearest centre, and only the
+        # column whose strip the point falls in and the column to its left
+        # can hold it. Points outside the grid get -1.
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        col = np.floor((x - self.xmin) / self.column_spacing).astype(np.int64)
+        left_col = col - 1
+        row = self._row_for_column(y, col)
+        left_row = self._row_for_column(y, left_col)
+
+        cx, cy = self.cell_centers(col, row)
+        left_cx, left_cy = self.cell_centers(left_col, left_row)
+        use_left = (x - left_cx) ** 2 + (y - left_cy) ** 2 < (x - cx) ** 2 + (
+            y - cy
+        ) ** 2
+        col = np.where(use_left, left_col, col)
+        row = np.where(use_left, left_row, row)
+
+        inside = (col >= 0) & (col < self.columns) & (row >= 0) & (row < self.rows)
+        return np.where(inside, col * self.rows + row + 1, -1)
+
+    def column_row(self, cell_ids):
+        index = np.asarray(cell_ids, dtype=np.int64) - 1
+        return index // self.rows, index % self.rows
+
+    def cell_centers(self, col, row):
+        col = np.asarray(col)
+        row = np.asarray(row)
+        cx = self.xmin + col * self.column_spacing + self.x_vertex_hi
+        cy = self.ymax - (row + 0.5 + (col % 2) * 0.5) * self.spacing
+        return cx, cy
+
+    def cell_rings(self, cell_ids) -> np.ndarray:
+        # (n, 7, 2) closed exterior rings, vertex for vertex what
+        # native:creategrid emits for the same cells
+        col, row = self.column_row(cell_ids)
+        x1 = self.xmin + col * self.column_spacing
+        x2 = x1 + (self.x_vertex_hi - self.x_vertex_lo)
+        x3 = x1 + self.column_spacing
+        x4 = x3 + (self.x_vertex_hi - self.x_vertex_lo)
+
+        half = self.spacing / 2
+        first = row * 2 + col % 2
+        y1 = self.ymax - first * half
+        y2 = self.ymax - (first + 1) * half
+        y3 = self.ymax - (first + 2) * half
+
+        xs = np.stack((x1, x2, x3, x4, x3, x2, x1), axis=-1)
+        ys = np.stack((y2, y1, y1, y2, y3, y3, y2), axis=-1)
+        return np.stack((xs, ys), axis=-1)
+
+
+conus_grid = HexGrid(*CONUS_EXTENT)
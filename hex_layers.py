@@ -0,0 +1,79 @@
+import numpy as np
+
+from gpkg_writer import GpkgWriter, polygon_wkb, ring_envelopes
+from hex_binning import CellSummary
+from hex_grid import HexGrid
+
+capacity_field = "Nameplate Capacity (MW)"
+
+# Same fields native:creategrid and the summary join produce
+grid_fields = [
+    ("id", "INTEGER"),
+    ("left", "REAL"),
+    ("top", "REAL"),
+    ("right", "REAL"),
+    ("bottom", "REAL"),
+]
+summary_fields = [
+    (f"{capacity_field}_count", "INTEGER"),
+    (f"{capacity_field}_range", "REAL"),
+    (f"{capacity_field}_sum", "REAL"),
+]
+
+
+def cell_layer_rows(
+    grid: HexGrid, cell_ids, summary: CellSummary = None, extra_columns=()
+):
+    # Fields, attribute rows, polygons and their envelopes for the given
+    # cells, and their fids. fid is pinned
+    # to the cell id so ids stay stable however many cells are occupied.
+    # extra_columns are (name, type, values) added after the summary.
+    rings = grid.cell_rings(cell_ids)
+    columns = [
+        cell_ids.tolist(),
+        rings[:, 0, 0].tolist(),
+        rings[:, 1, 1].tolist(),
+        rings[:, 3, 0].tolist(),
+        rings[:, 4, 1].tolist(),
+    ]
+    fields = list(grid_fields)
+    if summary is not None:
+        fields += summary_fields
+        columns += [
+            summary.count.tolist(),
+            summary.range.tolist(),
+            summary.total.tolist(),
+        ]
+    for name, field_type, values in extra_columns:
+        fields.append((name, field_type))
+        columns.append(np.asarray(values).tolist())
+    return (
+        fields,
+        zip(*columns),
+        (polygon_wkb(ring) for ring in rings),
+        ring_envelopes(rings),
+        columns[0],
+    )
+
+
+def write_cell_layer(
+    writer: GpkgWriter,
+    layer_name: str,
+    grid: HexGrid,
+    cell_ids,
+    summary: CellSummary = None,
+    extra_columns=(),
+):
+    # Only the given cells get a polygon
+    fields, rows, geometries, envelopes, fids = cell_layer_rows(
+        grid, cell_ids, summary, extra_columns
+    )
+    return writer.write_layer(
+        layer_name,
+        fields,
+        rows,
+        geometries,
+        geometry_type="POLYGON",
+        fids=fids,
+        envelopes=envelopes,
+    )
@@ -0,0 +1,92 @@
+from typing import Dict, Sequence
+
+import numpy as np
+
+from hex_binning import CellSummary, combine_summaries, summarize_by_cell
+from hex_grid import CONUS_EXTENT, HexGrid
+
+
+def contained_cells(fine: HexGrid, coarse: HexGrid, cell_ids: np.ndarray):
+    # Coarse cell wholly containing each fine cell, or -1 where the fine
+    # hexagon straddles a coarse edge. Hexagons are convex, so a fine cell is
+    # inside a coarse one when all six of its vertices are.
+    vertices = fine.cell_rings(cell_ids)[:, :6]
+    centers = vertices.mean(axis=1, keepdims=True)
+    # Pull the vertices a hair towards the centre so fine edges that lie
+    # exactly on a coarse edge don't count as straddling
+    vertices = centers + (vertices - centers) * (1 - 1e-9)
+    owners = coarse.cell_ids(vertices[..., 0], vertices[..., 1])
+    inside = (owners == owners[:, :1]).all(axis=1)
+    return np.where(inside, owners[:, 0], -1)
+
+
+def summarize_pyramid(
+    x: np.ndarray,
+    y: np.ndarray,
+    group_ids: np.ndarray,
+    values: np.ndarray,
+    spacings: Sequence[float],
+    extent=CONUS_EXTENT,
+) -> Dict[float, Dict[int, CellSummary]]:
+    # Hex summaries at every spacing from a single set of point coordinates.
+    # Only the finest level bins points directly; every coarser level rolls up
+    # the summaries of the next finer level, re-binning just the points that
+    # sit in fine cells straddling a coarse cell edge or in no fine cell at
+    # all (the coarse grid can reach past the fine one's edge).
+    spacings = sorted(spacings)
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+
+    grid = HexGrid(*extent, spacing=spacings[0])
+    point_cells = grid.cell_ids(x, y)
+    summaries = summarize_by_cell(point_cells, group_ids, values)
+    pyramid = {spacings[0]: summaries}
+
+    for spacing in spacings[1:]:
+        coarse = HexGrid(*extent, spacing=spacing)
+
+        occupied = np.unique(point_cells[point_cells >= 0])
+        owners = contained_cells(grid, coarse, occupied)
+
+        # Each point follows its fine cell up, unless that cell straddles or
+        # the point had none
+        point_owners = np.full(len(point_cells), -1, dtype=np.int64)
+        assigned = point_cells >= 0
+        point_owners[assigned] = owners[
+            np.searchsorted(occupied, point_cells[assigned])
+        ]
+        rebinned = point_owners < 0
+        point_owners[rebinned] = coarse.cell_ids(
+            np.asarray(x)[rebinned], np.asarray(y)[rebinned]
+        )
+
+        partial_cells, partial_groups = [], []
+        partial_count, partial_min, partial_max, partial_total = [], [], [], []
+        for group, summary in summaries.items():
+            summary_owners = owners[np.searchsorted(occupied, summary.cell_ids)]
+            rolled = summary_owners >= 0
+            partial_cells.append(summary_owners[rolled])
+            partial_groups.append(np.full(rolled.sum(), group))
+            partial_count.append(summary.count[rolled])
+            partial_min.append(summary.minimum[rolled])
+            partial_max.append(summary.maximum[rolled])
+            partial_total.append(summary.total[rolled])
+
+        partial_cells.append(point_owners[rebinned])
+        partial_groups.append(group_ids[rebinned])
+        partial_count.append(np.ones(rebinned.sum(), dtype=np.int64))
+        for partial in (partial_min, partial_max, partial_total):
+            partial.append(values[rebinned])
+
+        summaries = combine_summaries(
+            np.concatenate(partial_cells),
+            np.concatenate(partial_groups),
+            np.concatenate(partial_count),
+            np.concatenate(partial_min),
+            np.concatenate(partial_max),
+            np.concatenate(partial_total),
+        )
+        pyramid[spacing] = summaries
+        grid, point_cells = coarse, point_owners
+
+    return pyramid
@@ -0,0 +1,190 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, Set, Tuple
+
+import numpy as np
+
+from centroid_groups import centroid_point_fields
+from generator_table import (
+    GeneratorPoints,
+    hex_layer_groups,
+    points_digest,
+    save_points,
+)
+from group_by import Categorical
+from timeline import date_fields
+
+# What changed between two releases of the generator table, and which output
+# rows that touches. Generators are matched on Plant ID + Generator ID.
+#
+# The release the outputs were built from is kept as a snapshot beside them,
+# and every build records that release's digest in what it writes, so an
+# update only runs on outputs that all match the snapshot.
+
+key_fields = ["Plant ID", "Generator ID"]
+# Generator fields the snapshot keeps: everything an update compares or
+# rebuilds from
+snapshot_fields = list(
+    dict.fromkeys(
+        centroid_point_fields + date_fields + key_fields + ["Retirement Year"]
+    )
+)
+
+
+def generator_keys(points: GeneratorPoints) -> np.ndarray:
+    # "plant/generator" per row, with a "#n" suffix on repeats so every row
+    # has its own key
+    plant = points.numeric("Plant ID")
+    generator = points.text("Generator ID")
+    keys = np.array(
+        [
+            f"{int(p) if p == p else ''}/{g}"
+            for p, g in zip(plant.tolist(), generator.tolist())
+        ],
+        dtype=object,
+    )
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    first = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+    run_start = np.maximum.accumulate(np.where(first, np.arange(len(keys)), 0))
+    repeat = np.empty(len(keys), dtype=np.int64)
+    repeat[order] = np.arange(len(keys)) - run_start
+    return np.array(
+        [key if n == 0 else f"{key}#{n}" for key, n in zip(keys, repeat.tolist())],
+        dtype=object,
+    )
+
+
+def _same(old_column, new_column, old_rows, new_rows) -> np.ndarray:
+    if isinstance(old_column, Categorical):
+        return old_column.decode()[old_rows] == new_column.decode()[new_rows]
+    old_values, new_values = old_column[old_rows], new_column[new_rows]
+    return (old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values))
+
+
+@dataclass
+class GeneratorDiff:
+    # Rows of the new table that are new, rows of the old table that are gone,
+    # and paired old/new rows of generators that changed
+    added: np.ndarray
+    removed: np.ndarray
+    changed_old: np.ndarray
+    changed_new: np.ndarray
+    # Of the changed generators (new rows), those whose status changed and
+    # those that gained a retirement year
+    status_changed: np.ndarray
+    retired: np.ndarray
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed_new)
+
+    @property
+    def old_rows(self) -> np.ndarray:
+        return np.concatenate((self.removed, self.changed_old))
+
+    @property
+    def new_rows(self) -> np.ndarray:
+        return np.concatenate((self.added, self.changed_new))
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.added)} added, {len(self.removed)} removed, "
+            f"{len(self.changed_new)} changed ({len(self.status_changed)} status, "
+            f"{len(self.retired)} newly retired)"
+        )
+
+
+def diff_generators(old: GeneratorPoints, new: GeneratorPoints) -> GeneratorDiff:
+    old_keys, new_keys = generator_keys(old), generator_keys(new)
+    old_index = {key: i for i, key in enumerate(old_keys.tolist())}
+    new_index = {key: i for i, key in enumerate(new_keys.tolist())}
+
+    added = np.array(
+        [i for key, i in new_index.items() if key not in old_index], dtype=np.int64
+    )
+    removed = np.array(
+        [i for key, i in old_index.items() if key not in new_index], dtype=np.int64
+    )
+    matched_new = np.array(
+        [i for key, i in new_index.items() if key in old_index], dtype=np.int64
+    )
+    matched_old = np.array(
+        [old_index[key] for key in new_keys[matched_new].tolist()], dtype=np.int64
+    )
+
+    same = np.ones(len(matched_new), dtype=bool)
+    for name in ("x", "y", "capacity", "generator"):
+        same &= _same(getattr(old, name), getattr(new, name), matched_old, matched_new)
+    same_status = _same(old.status, new.status, matched_old, matched_new)
+    same &= same_status
+    for name in set(old.columns) & set(new.columns):
+        same &= _same(old.columns[name], new.columns[name], matched_old, matched_new)
+
+    changed = ~same
+    retired = np.zeros(len(matched_new), dtype=bool)
+    if "Retirement Year" in old.columns and "Retirement Year" in new.columns:
+        retired = np.isnan(old.numeric("Retirement Year")[matched_old]) & ~np.isnan(
+            new.numeric("Retirement Year")[matched_new]
+        )
+    return GeneratorDiff(
+        added=added,
+        removed=removed,
+        changed_old=matched_old[changed],
+        changed_new=matched_new[changed],
+        status_changed=matched_new[changed & ~same_status],
+        retired=matched_new[changed & retired],
+    )
+
+
+def hex_cells_by_group(
+    points: GeneratorPoints, cell_ids: np.ndarray, rows: np.ndarray
+) -> Dict[int, Set[int]]:
+    # Hex cells of every hex layer group the given points fall in
+    all_rows, groups = hex_layer_groups(points)
+    member = np.isin(all_rows, rows) & (cell_ids[all_rows] >= 0)
+    cells_by_group: Dict[int, Set[int]] = {}
+    for group, cell in zip(
+        groups[member].tolist(), cell_ids[all_rows[member]].tolist()
+    ):
+        cells_by_group.setdefault(group, set()).add(cell)
+    return cells_by_group
+
+
+def cell_sources(
+    points: GeneratorPoints, cell_ids: np.ndarray, rows: np.ndarray
+) -> Set[Tuple[int, int]]:
+    # (cell, generator type) pairs of the given points
+    rows = rows[(points.generator[rows] >= 0) & (cell_ids[rows] >= 0)]
+    return set(zip(cell_ids[rows].tolist(), points.generator[rows].tolist()))
+
+
+def region_labels(points: GeneratorPoints, field: str, rows: np.ndarray) -> Set[str]:
+    return set(points.text(field)[rows].tolist())
+
+
+def snapshot_points(points: GeneratorPoints) -> GeneratorPoints:
+    # points with only the snapshot's fields, of those it has
+    return GeneratorPoints(
+        x=points.x,
+        y=points.y,
+        capacity=points.capacity,
+        status=points.status,
+        generator=points.generator,
+        columns={
+            name: points.columns[name]
+            for name in snapshot_fields
+            if name in points.columns
+        },
+    )
+
+
+def release_digest(points: GeneratorPoints) -> str:
+    # Identifies the release points came from, as its snapshot would hold it
+    return points_digest(snapshot_points(points))
+
+
+def save_snapshot(path: str, points: GeneratorPoints):
+    # Written aside and moved into place, so a snapshot is never half there
+    partial = f"{path}.partial"
+    save_points(partial, snapshot_points(points))
+    os.replace(partial, path)
@@ -0,0 +1,325 @@
+import os
+
+from generator_types import energy_source_code
+import builds
+from builds import (
+    CENTROID_YEARS,
+    CUBE_PATH,
+    HEX_GPKG,
+    SNAPSHOT_PATH,
+    SUMS_GPKG,
+    TEMPORAL_YEARS,
+    bivariate_layer_name,
+    bivariate_pairs,
+    region_metric_columns,
+    subregion_bivariate_classes,
+    subregion_bivariates,
+    write_hex_bivariate,
+    write_subregion_legends,
+)
+from centroid_groups import centroid_layers, group_keys
+from capacity_cube import write_step_cube
+from generator_points import cached_generator_points
+from generator_table import hex_layer_groups, hex_layer_names, load_points
+from gpkg_reader import GpkgReader
+from gpkg_writer import GpkgWriter, polygon_wkb, ring_envelopes
+from hex_binning import summarize_by_cell
+from hex_grid import conus_grid
+from hex_layers import cell_layer_rows, write_cell_layer
+from instrumentation import run_report
+from incremental import (
+    cell_sources,
+    diff_generators,
+    hex_cells_by_group,
+    region_labels,
+    release_digest,
+    save_snapshot,
+    snapshot_fields,
+)
+from subregion_metrics import capacity_metrics, fraction_metrics, subregion_metrics
+from timeline import (
+    cell_source_steps,
+    generator_months,
+    interval_rows,
+    temporal_fields,
+    temporal_layer_name,
+)
+from qgis.core import QgsProject
+import numpy as np
+
+# Bring the hex, temporal, centroid and subregion outputs up to date with a
+# new release of the generator table, rewriting only the rows the changed
+# generators touch. The full build (run_pipeline.py or builds.py) saves the
+# release it built from as a snapshot next to the outputs, and each update
+# replaces it with the new one. Without a snapshot, or when any output was
+# built from another release, nothing is updated: rebuild them instead.
+
+# (table, key field) of each region type, by the generator field it's on
+region_tables = {
+    table["generator_field"]: (table["name"], table["key"])
+    for table in builds.region_tables.values()
+}
+region_for_field = {
+    table["generator_field"]: region for region, table in builds.region_tables.items()
+}
+# The builds an update rewrites: their file, and the layers that show
+# they've been built
+updated_outputs = {
+    "hex": (HEX_GPKG, list(hex_layer_names().values())),
+    "temporal": (HEX_GPKG, [temporal_layer_name]),
+    "centroids": (HEX_GPKG, ["weighted_centroids", "weighted_centroids_monthly"]),
+    "subregions": (SUMS_GPKG, [name for name, _ in region_tables.values()]),
+}
+
+points_layer = None
+for layer in QgsProject.instance().mapLayersByName("Generator Points"):
+    if layer.crs().authid() == "EPSG:5070":
+        points_layer = layer
+
+
+def update_hex_layers(writer: GpkgWriter, old, old_cells, new, new_cells, diff):
+    # Every summary is cheap to recompute; only the affected cells of the
+    # affected layers are rewritten
+    affected = hex_cells_by_group(old, old_cells, diff.old_rows)
+    for group, cells in hex_cells_by_group(new, new_cells, diff.new_rows).items():
+        affected.setdefault(group, set()).update(cells)
+
+    rows, groups = hex_layer_groups(new)
+    summaries = summarize_by_cell(new_cells[rows], groups, new.capacity[rows])
+    layer_names = hex_layer_names()
+    for group, cells in affected.items():
+        layer_name = layer_names[group]
+        summary = summaries.get(group)
+        if not writer.has_layer(layer_name):
+            if summary is not None and len(summary):
+                write_cell_layer(
+                    writer, layer_name, conus_grid, summary.cell_ids, summary
+                )
+            continue
+        cells = np.fromiter(cells, dtype=np.int64)
+        writer.delete_rows(layer_name, ["fid"], zip(cells.tolist()))
+        if summary is None:
+            continue
+        summary = summary.take(np.isin(summary.cell_ids, cells))
+        fields, attributes, geometries, envelopes, fids = cell_layer_rows(
+            conus_grid, summary.cell_ids, summary
+        )
+        writer.append_rows(layer_name, fields, attributes, geometries, fids, envelopes)
+        print(f"{layer_name}: {len(cells)} cells updated")
+
+    # A bivariate layer's breaks are over all its cells, so any change can
+    # move every cell's class: those layers and their legends are rewritten
+    for x_name, y_name in bivariate_pairs:
+        layer_name = bivariate_layer_name(x_name, y_name)
+        if writer.has_layer(layer_name):
+            write_hex_bivariate(writer, new, new_cells, x_name, y_name)
+            print(f"{layer_name}: rewritten")
+
+
+def update_temporal_layer(writer: GpkgWriter, old, old_cells, new, new_cells, diff):
+    if not writer.has_layer(temporal_layer_name):
+        return
+    min_year, max_year = TEMPORAL_YEARS
+    n_months = (max_year - min_year + 1) * 12
+    n_sources = len(energy_source_code)
+
+    affected = cell_sources(old, old_cells, diff.old_rows) | cell_sources(
+        new, new_cells, diff.new_rows
+    )
+    affected_keys = np.array(
+        [cell * n_sources + source for cell, source in affected], dtype=np.int64
+    )
+
+    included, _, start, end = generator_months(new, min_year, n_months)
+    rows = np.flatnonzero(included & (new_cells >= 0))
+    step_cells, step_source_index, step_start, step_end, capacity = cell_source_steps(
+        new_cells[rows],
+        new.generator[rows],
+        start[rows],
+        end[rows],
+        new.capacity[rows],
+        n_months,
+    )
+    if CUBE_PATH and os.path.exists(CUBE_PATH):
+        write_step_cube(
+            CUBE_PATH,
+            step_cells,
+            step_source_index,
+            step_start,
+            step_end,
+            capacity,
+            [energy_code.name for energy_code in energy_source_code],
+            n_months,
+            min_year,
+        )
+
+    steps = np.flatnonzero(
+        np.isin(step_cells * n_sources + step_source_index, affected_keys)
+    )
+    step_cells = step_cells[steps]
+    intervals = interval_rows(
+        step_cells,
+        [energy_source_code[i].name for i in step_source_index[steps].tolist()],
+        step_start[steps],
+        step_end[steps],
+        capacity[steps],
+        min_year,
+    )
+    deleted = [
+        (cell, energy_source_code[source].name) for cell, source in sorted(affected)
+    ]
+
+    intervals_table = f"{temporal_layer_name}_intervals"
+    if writer.has_layer(intervals_table):
+        # Normalized: the intervals are a plain table, and any newly occupied
+        # cell needs its polygon in the cells table
+        writer.delete_rows(intervals_table, ["cell_id", "energy_source"], deleted)
+        writer.append_rows(intervals_table, temporal_fields, intervals)
+        cells_table = f"{temporal_layer_name}_cells"
+        new_cells = np.setdiff1d(step_cells, writer.fids(cells_table))
+        rings = conus_grid.cell_rings(new_cells)
+        writer.append_rows(
+            cells_table,
+            [("cell_id", "INTEGER")],
+            zip(new_cells.tolist()),
+            (polygon_wkb(ring) for ring in rings),
+            fids=new_cells.tolist(),
+            envelopes=ring_envelopes(rings),
+        )
+    else:
+        writer.delete_rows(temporal_layer_name, ["cell_id", "energy_source"], deleted)
+        rings = conus_grid.cell_rings(step_cells)
+        writer.append_rows(
+            temporal_layer_name,
+            temporal_fields,
+            intervals,
+            (polygon_wkb(ring) for ring in rings),
+            envelopes=ring_envelopes(rings),
+        )
+    print(f"{temporal_layer_name}: {len(deleted)} cell/source timelines updated")
+
+
+def update_centroids(writer: GpkgWriter, old, new, diff):
+    keys = group_keys(old, diff.old_rows) | group_keys(new, diff.new_rows)
+    layers = centroid_layers(
+        new,
+        *CENTROID_YEARS,
+        monthly=writer.has_layer("weighted_centroids_monthly"),
+        only=keys,
+    )
+    for layer_name, fields, (rows, geometries, envelopes) in layers:
+        if not writer.has_layer(layer_name):
+            continue
+        writer.delete_rows(
+            layer_name, ["energy_type", "group_type", "group_name"], keys
+        )
+        writer.append_rows(layer_name, fields, rows, geometries, envelopes=envelopes)
+        print(f"{layer_name}: {len(keys)} groups updated")
+
+
+def update_subregions(writer: GpkgWriter, old, new, diff):
+    metric_names = capacity_metrics + list(fraction_metrics)
+    for generator_field, (layer_name, key_field) in region_tables.items():
+        if not writer.has_layer(layer_name):
+            continue
+        labels = (
+            region_labels(old, generator_field, diff.old_rows)
+            | region_labels(new, generator_field, diff.new_rows)
+        ) - {""}
+        codes, metrics = subregion_metrics(new, generator_field)
+        row_for_code = {code: i for i, code in enumerate(codes.tolist())}
+        rows = []
+        for label in sorted(labels):
+            row = row_for_code.get(label)
+            rows.append(
+                [
+                    float(metrics[name][row]) if row is not None else 0.0
+                    for name in metric_names
+                ]
+                + [label]
+            )
+        writer.update_rows(layer_name, key_field, metric_names, rows)
+        print(f"{layer_name}: {len(rows)} regions updated")
+
+        # The bivariate breaks are over every region, so every code and the
+        # legends are redone
+        region = region_for_field[generator_field]
+        bivariate = subregion_bivariates.get(region)
+        if bivariate is None:
+            continue
+        metric_columns = region_metric_columns(
+            writer.column(layer_name, key_field), new, generator_field
+        )
+        codes, x_breaks, y_breaks = subregion_bivariate_classes(
+            metric_columns, bivariate
+        )
+        writer.update_rows(
+            layer_name,
+            "fid",
+            [bivariate["field"]],
+            zip(codes.tolist(), writer.column(layer_name, "fid")),
+        )
+        write_subregion_legends(region, (x_breaks, y_breaks))
+        print(f"{layer_name}: bivariate classes updated")
+
+
+def unmatched_outputs(release: str):
+    # Builds with layers on disk that weren't made from this release
+    unmatched = []
+    for output, (path, layers) in updated_outputs.items():
+        if not os.path.exists(path):
+            continue
+        with GpkgReader(path) as reader:
+            built = set(reader.layers()) & set(layers)
+            releases = reader.releases()
+        if built and releases.get(output) != release:
+            unmatched.append(output)
+    return unmatched
+
+
+def record_release(writer: GpkgWriter, release: str):
+    # The builds in writer's file are now of this release
+    for output, (path, layers) in updated_outputs.items():
+        if path == writer.path and any(writer.has_layer(name) for name in layers):
+            writer.set_release(output, release)
+
+
+with run_report("incremental_update"):
+    if not os.path.exists(SNAPSHOT_PATH):
+        raise RuntimeError(
+            f"No snapshot at {SNAPSHOT_PATH}. Build the outputs with "
+            "run_pipeline.py or builds.py first; they save the release they're "
+            "built from there."
+        )
+    old_points = load_points(SNAPSHOT_PATH)
+    unmatched = unmatched_outputs(release_digest(old_points))
+    if unmatched:
+        raise RuntimeError(
+            f"The {', '.join(unmatched)} outputs weren't built from the release "
+            f"in {SNAPSHOT_PATH}. Rebuild them with run_pipeline.py or builds.py "
+            "(forcing the stages, if it finds them up to date)."
+        )
+
+    new_points = cached_generator_points(points_layer, fields=snapshot_fields)
+    diff = diff_generators(old_points, new_points)
+    print(f"Generator changes: {diff.summary()}")
+
+    if len(diff):
+        release = release_digest(new_points)
+        old_cells = conus_grid.cell_ids(old_points.x, old_points.y)
+        new_cells = conus_grid.cell_ids(new_points.x, new_points.y)
+        with GpkgWriter(HEX_GPKG) as writer:
+            update_hex_layers(
+                writer, old_points, old_cells, new_points, new_cells, diff
+            )
+            update_temporal_layer(
+                writer, old_points, old_cells, new_points, new_cells, diff
+            )
+            update_centroids(writer, old_points, new_points, diff)
+            record_release(writer, release)
+        with GpkgWriter(SUMS_GPKG) as writer:
+            update_subregions(writer, old_points, new_points, diff)
+            record_release(writer, release)
+        save_snapshot(SNAPSHOT_PATH, new_points)
+
+    print("Incremental update complete")
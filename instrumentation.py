@@ -0,0 +1,319 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Windows; peak memory is left out of the report
+    resource = None
+
+# Where the time of a run goes. Code marks its stages and loops with span()
+# (or @traced), and counts what it reads and writes with count(); inside
+# run_report() every span's time, counts and the process's peak memory so
+# far are recorded, and when the run ends one JSON report is written and a
+# summary printed. Spans named in GRID_BATTERIES_PROFILE (comma-separated)
+# are also sample-profiled. Outside a run, spans and counts cost next to
+# nothing and record nothing.
+#
+# `python instrumentation.py old.json new.json` compares two reports.
+
+# Beside the workbook cache, eia860m.CACHE_DIR
+REPORT_DIR = "../cache/reports"
+# Spans to sample-profile, by name or path
+PROFILE = {
+    name.strip()
+    for name in os.environ.get("GRID_BATTERIES_PROFILE", "").split(",")
+    if name.strip()
+}
+# Seconds between profiler samples, and how many frames of each stack count
+SAMPLE_INTERVAL = 0.005
+SAMPLE_DEPTH = 4
+# Rows of the printed summary and stacks kept per profiled span
+SUMMARY_ROWS = 20
+TOP_STACKS = 15
+
+
+@dataclass
+class Span:
+    name: str
+    # Names from the outermost span down to this one, joined with "/"
+    path: str
+    thread: str
+    # Seconds since the run started
+    start: float
+    seconds: float = 0.0
+    counts: Dict[str, int] = field(default_factory=dict)
+    attributes: Dict[str, object] = field(default_factory=dict)
+    # The process's high-water mark when the span ended
+    peak_rss_mb: Optional[float] = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+class Sampler:
+    # Samples one thread's stack every SAMPLE_INTERVAL seconds from a
+    # background thread, counting the innermost SAMPLE_DEPTH frames
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def _sample(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < SAMPLE_DEPTH:
+                code = frame.f_code
+                stack.append(
+                    f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(stack)] += 1
+
+    def stop(self) -> List[dict]:
+        self.stopped.set()
+        self.thread.join()
+        total = sum(self.stacks.values())
+        return [
+            {"stack": list(stack), "samples": samples, "share": samples / total}
+            for stack, samples in self.stacks.most_common(TOP_STACKS)
+        ]
+
+
+class Run:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self.counts = Counter()
+        self.profiles: Dict[str, List[dict]] = {}
+        self.lock = threading.Lock()
+        # Each thread's open spans. A thread's first span goes under the
+        # run's own, so stages on worker threads nest like the rest.
+        self.local = threading.local()
+        self.root: Optional[str] = None
+        # run_report() blocks still open on it
+        self.open = 0
+
+    def stack(self) -> List[Span]:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def report(self) -> dict:
+        return {
+            "run": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "argv": sys.argv,
+            "seconds": time.perf_counter() - self.origin,
+            "peak_rss_mb": peak_rss_mb(),
+            "counts": dict(self.counts),
+            "spans": [asdict(span) for span in self.spans],
+            "profiles": self.profiles,
+        }
+
+
+_run: Optional[Run] = None
+_run_lock = threading.Lock()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    # Times the block as a span of the current run, nested in whatever span
+    # this thread has open. attributes (a layer name, say) go in the report.
+    run = _run
+    if run is None:
+        yield
+        return
+    stack = run.stack()
+    parent = stack[-1].path if stack else run.root
+    path = f"{parent}/{name}" if parent else name
+    current = Span(
+        name,
+        path,
+        threading.current_thread().name,
+        time.perf_counter() - run.origin,
+        attributes=attributes,
+    )
+    sampler = Sampler(threading.get_ident()) if {name, path} & PROFILE else None
+    stack.append(current)
+    try:
+        yield
+    finally:
+        stack.pop()
+        current.seconds = time.perf_counter() - run.origin - current.start
+        current.peak_rss_mb = peak_rss_mb()
+        with run.lock:
+            run.spans.append(current)
+            if sampler is not None:
+                run.profiles[f"{path} @ {current.start:.3f}s"] = sampler.stop()
+
+
+def traced(function):
+    # function, run as a span named after it
+    @functools.wraps(function)
+    def traced_function(*args, **kwargs):
+        with span(function.__name__):
+            return function(*args, **kwargs)
+
+    return traced_function
+
+
+def count(name: str, n: int = 1):
+    # Adds n to a counter of the run and of this thread's innermost span
+    run = _run
+    if run is None:
+        return
+    stack = run.stack()
+    with run.lock:
+        run.counts[name] += n
+        if stack:
+            stack[-1].counts[name] = stack[-1].counts.get(name, 0) + n
+
+
+@contextmanager
+def run_report(name: str, directory: str = REPORT_DIR, summary: bool = True):
+    # Records everything in the block as one run, then writes its report to
+    # directory and prints the summary. A run inside a run, or overlapping it
+    # on another thread (two background tasks, say), just adds to it, and
+    # the report is written when the last of them ends.
+    global _run
+    with _run_lock:
+        run = _run
+        if run is None:
+            run = _run = Run(name)
+        run.open += 1
+    try:
+        with span(name):
+            if run.root is None:
+                run.root = name
+            yield run
+    finally:
+        with _run_lock:
+            run.open -= 1
+            last = run.open == 0
+            if last:
+                _run = None
+        if last:
+            write_report(run, directory, summary)
+
+
+def write_report(run: Run, directory: str = REPORT_DIR, summary: bool = True):
+    report = run.report()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(
+        directory,
+        f"{run.name}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(run.started))}.json",
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=repr)
+    if summary:
+        print_summary(report)
+    print(f"Run report written to {path}")
+
+
+def span_totals(report: dict) -> Dict[str, dict]:
+    # Every span path's total, calls, slowest call and counts, for spans
+    # repeated in loops
+    totals = {}
+    for entry in report["spans"]:
+        total = totals.setdefault(
+            entry["path"],
+            {
+                "seconds": 0.0,
+                "calls": 0,
+                "slowest": 0.0,
+                "slowest_at": {},
+                "counts": Counter(),
+            },
+        )
+        total["seconds"] += entry["seconds"]
+        total["calls"] += 1
+        total["counts"].update(entry["counts"])
+        if entry["seconds"] >= total["slowest"]:
+            total["slowest"] = entry["seconds"]
+            total["slowest_at"] = entry["attributes"]
+    return totals
+
+
+def print_summary(report: dict, rows: int = SUMMARY_ROWS):
+    peak = report["peak_rss_mb"]
+    print(
+        f"{report['run']}: {report['seconds']:.1f}s"
+        + (f", peak memory {peak:.0f} MB" if peak is not None else "")
+        + "".join(f", {n} {name}" for name, n in sorted(report["counts"].items()))
+    )
+    totals = sorted(
+        span_totals(report).items(), key=lambda item: item[1]["seconds"], reverse=True
+    )
+    print(f"{'seconds':>9} {'calls':>6} {'slowest':>9}  span")
+    for path, total in totals[:rows]:
+        slowest_at = ", ".join(f"{k}={v}" for k, v in total["slowest_at"].items())
+        counts = ", ".join(f"{n} {name}" for name, n in sorted(total["counts"].items()))
+        print(
+            f"{total['seconds']:>9.2f} {total['calls']:>6} {total['slowest']:>9.2f}  "
+            f"{path}"
+            + (f" (slowest {slowest_at})" if total["calls"] > 1 and slowest_at else "")
+            + (f" [{counts}]" if counts else "")
+        )
+    for name, stacks in report["profiles"].items():
+        print(f"profile of {name}:")
+        for entry in stacks[:5]:
+            print(f"  {entry['share']:6.1%}  {' < '.join(entry['stack'])}")
+
+
+def compare_reports(before: dict, after: dict, rows: int = SUMMARY_ROWS):
+    # Each span path's total time in two reports, biggest change first
+    old, new = span_totals(before), span_totals(after)
+    changes = sorted(
+        set(old) | set(new),
+        key=lambda path: abs(
+            new.get(path, {}).get("seconds", 0) - old.get(path, {}).get("seconds", 0)
+        ),
+        reverse=True,
+    )
+    print(f"{'before':>9} {'after':>9} {'change':>8}  span")
+    for path in changes[:rows]:
+        was = old.get(path, {}).get("seconds")
+        now = new.get(path, {}).get("seconds")
+        change = f"{now / was - 1:+8.0%}" if was and now is not None else f"{'':>8}"
+        print(
+            f"{'-' if was is None else f'{was:.2f}':>9} "
+            f"{'-' if now is None else f'{now:.2f}':>9} {change}  {path}"
+        )
+
+
+def main(argv: Optional[list] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    reports = []
+    for path in argv:
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    if len(reports) == 1:
+        print_summary(reports[0])
+    elif len(reports) == 2:
+        compare_reports(*reports)
+    else:
+        print("python instrumentation.py report.json [later_report.json]")
+
+
+if __name__ == "__main__":
+    main()
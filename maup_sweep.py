@@ -0,0 +1,33 @@
+import os
+
+from builds import SWEEP_SPACINGS, build_sweep, sweep_path
+from eia860m import WORKBOOK_PATH
+from generator_points import cached_generator_points
+from qgis_adapters import add_sweep_layers
+from qgis_tasks import run_in_background
+from qgis.core import QgsProject
+
+# Grid sizes to compare, in metres (EPSG:5070)
+SPACINGS = SWEEP_SPACINGS
+
+points_layer = next(
+    (
+        x
+        for x in QgsProject.instance().mapLayersByName("Generator Points")
+        if x.crs().authid() == "EPSG:5070"
+    ),
+    None,
+)
+if not points_layer and not os.path.exists(WORKBOOK_PATH):
+    raise ValueError("Could not find Generator Points layer with CRS EPSG:5070")
+
+
+# Load the point coordinates once and bin every resolution from them
+points = cached_generator_points(points_layer)
+run_in_background(
+    "maup_sweep",
+    lambda: build_sweep(points, SPACINGS),
+    add_sweep_layers,
+    "Grid size sweep",
+    [sweep_path(spacing) for spacing in SPACINGS],
+)
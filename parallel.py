@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from instrumentation import span
+from progress import cancel_requested, check_cancelled
+
+# Spreads independent partitions of a job (one per generator type, say) over a
+# process pool. Every worker maps the same read-only snapshot of the input
+# arrays from .npy files instead of having them pickled to it, and results
+# come back in partition order, so a parallel run produces exactly what a
+# serial one does.
+
+# Worker processes to use; 1 runs everything in this process. Serial unless
+# GRID_BATTERIES_WORKERS (or builds.py --workers) asks for more, since the
+# same count also sets how many pipeline stages run at once.
+WORKERS = int(os.environ.get("GRID_BATTERIES_WORKERS", 0)) or 1
+# Below this many rows, starting the pool costs more than it saves
+MIN_PARALLEL_ROWS = 100000
+# Seconds between checks for a cancelled task while the pool works
+CANCEL_POLL = 0.25
+
+_snapshots: Dict[str, Dict[str, np.ndarray]] = {}
+
+
+def python_executable() -> Optional[str]:
+    # Inside QGIS sys.executable is QGIS itself, and spawning workers with it
+    # would open more copies of QGIS. Look for the bundled interpreter instead.
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    version = f"python{sys.version_info.major}.{sys.version_info.minor}"
+    for candidate in (
+        os.path.join(sys.exec_prefix, "python.exe"),
+        os.path.join(sys.exec_prefix, "bin", version),
+        os.path.join(sys.exec_prefix, "bin", "python3"),
+        os.path.join(sys.exec_prefix, "bin", "python"),
+    ):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def save_snapshot(arrays: Dict[str, np.ndarray], directory: str):
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(values))
+
+
+def load_snapshot(directory: str) -> Dict[str, np.ndarray]:
+    # Memory-mapped once per worker process, shared through the page cache
+    if directory not in _snapshots:
+        _snapshots[directory] = {
+            name[: -len(".npy")]: np.load(os.path.join(directory, name), mmap_mode="r")
+            for name in os.listdir(directory)
+            if name.endswith(".npy")
+        }
+    return _snapshots[directory]
+
+
+def _run_partition(function, directory, partition):
+    return function(load_snapshot(directory), partition)
+
+
+def _run_serially(function, arrays, partitions) -> List:
+    results = []
+    for partition in partitions:
+        check_cancelled()
+        with span("partition", function=function.__name__, partition=partition):
+            results.append(function(arrays, partition))
+    return results
+
+
+def map_partitions(
+    function: Callable,
+    arrays: Dict[str, np.ndarray],
+    partitions: Sequence,
+    workers: int = WORKERS,
+) -> List:
+    # [function(arrays, partition) for partition in partitions], run across
+    # worker processes when it's worth it. function must be importable from a
+    # module so the workers can find it.
+    rows = max((len(values) for values in arrays.values()), default=0)
+    executable = python_executable()
+    if (
+        workers <= 1
+        or len(partitions) <= 1
+        or rows < MIN_PARALLEL_ROWS
+        or executable is None
+    ):
+        return _run_serially(function, arrays, partitions)
+
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(executable)
+    directory = tempfile.mkdtemp(prefix="grid-batteries-")
+    try:
+        with span("snapshot", rows=rows):
+            save_snapshot(arrays, directory)
+        with span(
+            "process_pool",
+            function=function.__name__,
+            partitions=len(partitions),
+            workers=workers,
+        ), ProcessPoolExecutor(
+            max_workers=min(workers, len(partitions)), mp_context=context
+        ) as pool:
+            futures = [
+                pool.submit(_run_partition, function, directory, partition)
+                for partition in partitions
+            ]
+            waiting = set(futures)
+            while waiting:
+                _, waiting = wait(waiting, timeout=CANCEL_POLL)
+                if waiting and cancel_requested():
+                    # Partitions already running finish; the rest never start
+                    for future in waiting:
+                        future.cancel()
+                    check_cancelled()
+            return [future.result() for future in futures]
+    except (BrokenProcessPool, OSError) as error:
+        print(f"Parallel run failed ({error}), running serially")
+        return _run_serially(function, arrays, partitions)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
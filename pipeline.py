@@ -0,0 +1,289 @@
+import ast
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Sequence, Union
+
+from eia860m import CACHE_DIR, file_digest
+from generator_types import energy_source_code
+from instrumentation import span
+from parallel import WORKERS
+from progress import Cancelled, current_progress, subtask
+
+# Runs the pipeline's stages as a DAG, skipping every stage whose outputs
+# were built from exactly its current inputs. A stage's fingerprint hashes
+# its input files by content, its settings by value, the source of its
+# script and every repo module that script imports, and the fingerprints of
+# the stages it runs after, so a change anywhere upstream reaches everything
+# downstream and nothing else. Settings that only change how a stage's
+# layers are drawn are hashed apart, so changing them restyles those layers
+# without rebuilding anything. The fingerprints of the last successful
+# builds, and of the styles last applied, are kept in a manifest.
+
+MANIFEST_PATH = os.path.join(CACHE_DIR, "pipeline.json")
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Generator fields that decide which type each row gets
+classification_fields = ["name", "include", "prime_movers", "technologies"]
+
+# Fingerprinted by the values stages declare from them, not by their
+# source, so editing one Generator only reaches the stages that use the
+# fields that changed
+definition_modules = {"generator_types.py"}
+# Only watch or stop the builds, so changing them rebuilds nothing
+untracked_modules = {"instrumentation.py", "progress.py"}
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], None]
+    # Input files, hashed by content ("missing" when absent)
+    files: Sequence[str] = ()
+    # Settings and definitions, hashed by their JSON
+    values: Dict[str, object] = field(default_factory=dict)
+    # Scripts whose source, and the source of the repo modules they import,
+    # is part of the fingerprint; functions count by their own source only
+    code: Sequence[Union[str, Callable]] = ()
+    # Files the stage writes; a missing one makes the stage stale
+    outputs: Sequence[str] = ()
+    # Stages whose outputs this one reads
+    after: Sequence[str] = ()
+    # Settings that only style the stage's layers, hashed by their JSON
+    style: Dict[str, object] = field(default_factory=dict)
+
+
+def generator_values(fields: Sequence[str], generators=energy_source_code) -> list:
+    # The given fields of every generator type, in list order
+    return [{name: getattr(gen, name) for name in fields} for gen in generators]
+
+
+def value_digest(value) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=repr).encode()
+    ).hexdigest()
+
+
+def code_digest(
+    code: Sequence[Union[str, Callable]], directory: str = SCRIPT_DIR
+) -> str:
+    # Source of every script and, transitively, of the modules it imports
+    # from this directory, then of every function
+    functions = [entry for entry in code if callable(entry)]
+    paths = [entry for entry in code if not callable(entry)]
+    seen, pending = set(), [os.path.join(directory, path) for path in paths]
+    while pending:
+        path = pending.pop()
+        if path in seen or not os.path.exists(path):
+            continue
+        seen.add(path)
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                names = [node.module]
+            else:
+                continue
+            pending += [
+                os.path.join(directory, f"{name.split('.')[0]}.py") for name in names
+            ]
+
+    digest = hashlib.sha256()
+    for path in sorted(seen):
+        if os.path.basename(path) in definition_modules | untracked_modules:
+            continue
+        digest.update(os.path.relpath(path, directory).encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    for function in functions:
+        digest.update(function.__qualname__.encode())
+        digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages: Sequence[Stage], manifest_path: str = MANIFEST_PATH):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            unknown = set(stage.after) - set(self.stages)
+            if unknown:
+                raise ValueError(f"{stage.name} runs after unknown stages {unknown}")
+        self.order = self._topological_order()
+        self.manifest_path = manifest_path
+        self.manifest = self._load_manifest()
+
+    def _topological_order(self) -> List[str]:
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage {name} depends on itself")
+            visiting.add(name)
+            for upstream in self.stages[name].after:
+                visit(upstream)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _load_manifest(self) -> dict:
+        manifest = {"stages": {}, "files": {}, "styles": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest.update(json.load(f))
+        return manifest
+
+    def _save_manifest(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        partial = f"{self.manifest_path}.partial"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(partial, self.manifest_path)
+
+    def _file_digest(self, path: str) -> str:
+        # Content hash, reused while the file's size and mtime are unchanged
+        if not os.path.exists(path):
+            return "missing"
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        known = self.manifest["files"].get(key)
+        if (
+            known
+            and known["size"] == stat.st_size
+            and known["mtime"] == stat.st_mtime_ns
+        ):
+            return known["digest"]
+        digest = file_digest(path)
+        self.manifest["files"][key] = dict(
+            size=stat.st_size, mtime=stat.st_mtime_ns, digest=digest
+        )
+        return digest
+
+    def fingerprints(self) -> Dict[str, str]:
+        # Every stage's fingerprint, upstream stages first
+        fingerprints = {}
+        for name in self.order:
+            stage = self.stages[name]
+            fingerprints[name] = value_digest(
+                {
+                    "files": {path: self._file_digest(path) for path in stage.files},
+                    "values": stage.values,
+                    "code": code_digest(stage.code),
+                    "after": {up: fingerprints[up] for up in sorted(stage.after)},
+                }
+            )
+        return fingerprints
+
+    def stale(self, fingerprints: Dict[str, str]) -> List[str]:
+        # Stages whose last successful build had other inputs, or whose
+        # outputs have gone missing, in run order
+        built = self.manifest["stages"]
+        return [
+            name
+            for name in self.order
+            if built.get(name) != fingerprints[name]
+            or not all(os.path.exists(path) for path in self.stages[name].outputs)
+        ]
+
+    def restyle(self) -> List[str]:
+        # Stages whose layers were last styled with other settings, or never
+        # styled, in run order
+        styled = self.manifest["styles"]
+        return [
+            name
+            for name in self.order
+            if styled.get(name) != value_digest(self.stages[name].style)
+        ]
+
+    def styled(self, names: Sequence[str]):
+        # The named stages' layers now have their current style
+        for name in names:
+            self.manifest["styles"][name] = value_digest(self.stages[name].style)
+        self._save_manifest()
+
+    def run(self, workers: int = WORKERS, force: Sequence[str] = ()):
+        # Builds every stale stage (and the forced ones), each as soon as the
+        # stages it runs after are done. Stages writing the same file never
+        # overlap. Returns the names of the stages that ran. In a background
+        # task each stage is an equal share of its progress, and cancelling
+        # it stops the pipeline with the stages done so far.
+        fingerprints = self.fingerprints()
+        pending = [
+            name
+            for name in self.order
+            if name in set(self.stale(fingerprints)) | set(force)
+        ]
+        for name in self.order:
+            if name not in pending:
+                print(f"{name}: up to date")
+        if not pending:
+            return []
+
+        done = set(self.stages) - set(pending)
+        ran, running, failure = [], {}, None
+
+        def writing(stage):
+            return {os.path.abspath(path) for path in stage.outputs}
+
+        def ready(name):
+            stage = self.stages[name]
+            busy = set().union(*(writing(self.stages[n]) for n in running.values()))
+            return set(stage.after) <= done and not writing(stage) & busy
+
+        def finished(name, seconds):
+            done.add(name)
+            ran.append(name)
+            self.manifest["stages"][name] = fingerprints[name]
+            self._save_manifest()
+            print(f"{name}: built in {seconds:.1f}s")
+
+        task = current_progress()
+        share = 1 / len(pending)
+
+        def timed(name):
+            start = time.perf_counter()
+            with subtask(task, name, share), span(name):
+                self.stages[name].run()
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            while (pending and failure is None) or running:
+                if failure is None:
+                    for name in list(pending):
+                        # Checked one at a time, so stages writing the
+                        # same file aren't started together
+                        if ready(name):
+                            pending.remove(name)
+                            running[pool.submit(timed, name)] = name
+                if not running:
+                    raise RuntimeError(f"Stages {pending} can never run")
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    name = running.pop(future)
+                    try:
+                        seconds = future.result()
+                    except Exception as error:
+                        failure = failure or (name, error)
+                    else:
+                        finished(name, seconds)
+
+        if failure is not None:
+            name, error = failure
+            if isinstance(error, Cancelled):
+                print(f"{name}: cancelled, {', '.join(ran) or 'nothing'} rebuilt")
+                return ran
+            raise RuntimeError(f"Stage {name} failed: {error}") from error
+        return ran
@@ -0,0 +1,104 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# How far along a background task is, and whether it's been asked to stop.
+# A task binds a Progress to its thread with reporting(); the builds it runs
+# call report_progress() as they finish each layer, and check_cancelled()
+# every so many features, which raises Cancelled once the task has been
+# cancelled. Work the task hands to other threads (the pipeline's stages)
+# runs as a subtask() carrying its share of the task. Outside a task these
+# calls do nothing, so the same builds run headless unchanged.
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Progress:
+    def __init__(
+        self,
+        report: Optional[Callable[[float], None]] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ):
+        # report gets the fraction of the whole task done, cancelled says
+        # whether it should stop
+        self.report = report
+        self.cancelled = cancelled
+        self.lock = threading.Lock()
+        # Each part's share of the task and the fraction of it done
+        self.parts: Dict[str, Tuple[float, float]] = {}
+
+    def update(self, part: str, weight: float, fraction: float):
+        with self.lock:
+            self.parts[part] = (weight, min(max(fraction, 0.0), 1.0))
+            done = sum(weight * fraction for weight, fraction in self.parts.values())
+        if self.report is not None:
+            self.report(min(done, 1.0))
+        self.check()
+
+    def cancel_requested(self) -> bool:
+        return self.cancelled is not None and self.cancelled()
+
+    def check(self):
+        if self.cancel_requested():
+            raise Cancelled()
+
+
+_local = threading.local()
+
+
+def current_progress() -> Optional[Tuple[Progress, str, float]]:
+    # This thread's task, the part of it this thread is doing and that
+    # part's share of the task, or None outside a task
+    return getattr(_local, "binding", None)
+
+
+@contextmanager
+def reporting(progress: Optional[Progress], part: str = "", weight: float = 1.0):
+    # Reports this thread's progress in the block to progress, as `weight`
+    # of the whole task
+    previous = current_progress()
+    _local.binding = None if progress is None else (progress, part, weight)
+    try:
+        yield
+    finally:
+        _local.binding = previous
+
+
+@contextmanager
+def subtask(binding: Optional[Tuple[Progress, str, float]], name: str, weight: float):
+    # Runs the block, on any thread, as `weight` of binding's part of its
+    # task (binding from current_progress() on the thread handing it out).
+    # The part counts as done once the block finishes.
+    if binding is None:
+        yield
+        return
+    progress, part, parent_weight = binding
+    part = f"{part}/{name}"
+    weight *= parent_weight
+    progress.check()
+    with reporting(progress, part, weight):
+        yield
+    progress.update(part, weight, 1.0)
+
+
+def report_progress(fraction: float):
+    # This thread's part of the current task is fraction done; raises
+    # Cancelled if the task has been cancelled
+    binding = current_progress()
+    if binding is not None:
+        progress, part, weight = binding
+        progress.update(part, weight, fraction)
+
+
+def cancel_requested() -> bool:
+    binding = current_progress()
+    return binding is not None and binding[0].cancel_requested()
+
+
+def check_cancelled():
+    # Raises Cancelled if the current task has been cancelled
+    binding = current_progress()
+    if binding is not None:
+        binding[0].check()
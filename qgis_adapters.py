@@ -0,0 +1,467 @@
+import os
+from typing import Dict, List, Optional
+
+from qgis.core import (
+    QgsCategorizedSymbolRenderer,
+    QgsFillSymbol,
+    QgsGraduatedSymbolRenderer,
+    QgsMarkerSymbol,
+    QgsPalLayerSettings,
+    QgsProject,
+    QgsProviderRegistry,
+    QgsRendererCategory,
+    QgsStyle,
+    QgsSymbol,
+    QgsTextBackgroundSettings,
+    QgsTextFormat,
+    QgsVectorLayer,
+    QgsVectorLayerSimpleLabeling,
+    QgsVectorLayerTemporalProperties,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QDate, QDateTime, QSizeF, Qt, QVariant
+from qgis.PyQt.QtGui import QColor
+
+from bivariate import bivariate_palette, category_labels
+from builds import (
+    HEX_GPKG,
+    SUMS_GPKG,
+    bivariate_capacity_fields,
+    bivariate_layer_name,
+    bivariate_pairs,
+    hex_bivariate_breaks,
+    region_tables,
+    subregion_bivariates,
+    subregion_values,
+)
+from generator_points import value_or_none
+from generator_table import SUMS_GROUP, hex_layer_group, hex_layer_names
+from generator_types import energy_source_code, statuses, trimmed_status
+from gpkg_reader import FeatureTable, GpkgReader
+from hex_layers import capacity_field
+from instrumentation import count, span, traced
+from renderers import bivariate_renderer, optimal_renderer
+
+# The QGIS side of the builds in builds.py: turning project layers into the
+# plain tables the builds take, and styling and registering what they wrote.
+# Everything here has to run on QGIS' main thread.
+
+gpkg_field_types = {
+    QVariant.Int: "INTEGER",
+    QVariant.LongLong: "INTEGER",
+    QVariant.Double: "REAL",
+    QVariant.Bool: "BOOLEAN",
+    QVariant.Date: "DATE",
+    QVariant.DateTime: "DATETIME",
+}
+
+
+def gpkg_value(value):
+    value = value_or_none(value)
+    if isinstance(value, (QDate, QDateTime)):
+        return value.toString(Qt.ISODate)
+    return value
+
+
+@traced
+def feature_table(layer) -> FeatureTable:
+    # A vector layer's features as a FeatureTable, without its fid (the
+    # writer numbers the features itself)
+    layer_fields = [
+        (i, field)
+        for i, field in enumerate(layer.fields())
+        if field.name().lower() != "fid"
+    ]
+    rows, geometries = [], []
+    for feature in layer.getFeatures():
+        attributes = feature.attributes()
+        rows.append([gpkg_value(attributes[i]) for i, _ in layer_fields])
+        geometry = feature.geometry()
+        geometries.append(None if geometry.isNull() else bytes(geometry.asWkb()))
+    count("features_read", len(rows))
+    crs = layer.crs()
+    return FeatureTable(
+        fields=[
+            (field.name(), gpkg_field_types.get(field.type(), "TEXT"))
+            for _, field in layer_fields
+        ],
+        rows=rows,
+        geometries=geometries,
+        geometry_type=QgsWkbTypes.displayString(
+            QgsWkbTypes.flatType(layer.wkbType())
+        ).upper(),
+        srs=(crs.postgisSrid(), crs.description(), crs.toWkt()),
+    )
+
+
+def load_layer(uri: str, display_name: str) -> Optional[QgsVectorLayer]:
+    layer = QgsVectorLayer(uri, display_name, "ogr")
+    if not layer.isValid():
+        print(f"Failed to load layer '{display_name}' from GeoPackage")
+        return None
+    return layer
+
+
+@traced
+def add_grid_layer(uri: str):
+    grid_layer = load_layer(uri, "Grid")
+    if grid_layer is None:
+        return None
+    QgsProject.instance().addMapLayer(grid_layer)
+
+    # Style the grid with a light border
+    symbol = QgsFillSymbol.createSimple(
+        {
+            "color": "transparent",
+            "outline_width": "0.25",
+            "outline_width_unit": "Point",
+            "name": "hexagon",
+        }
+    )
+    grid_layer.renderer().setSymbol(symbol)
+    grid_layer.triggerRepaint()
+    print("Grid successfully added to the map")
+    return grid_layer
+
+
+def capacity_label(lower_value: float, upper_value: float):
+    # Format the label as desired, e.g., "min - max unit"
+    unit = "MW"
+    if upper_value >= 1000:
+        unit = "GW"
+        lower_value /= 1000
+        upper_value /= 1000
+    return f"{lower_value:g} - {upper_value:g} {unit}"
+
+
+def hexagon_symbol():
+    return QgsFillSymbol.createSimple(
+        {"outline_width": "0.25", "outline_width_unit": "Point"}
+    )
+
+
+@traced
+def add_hex_layers(path: str = HEX_GPKG, num_classes: int = 7):
+    # Every hex layer build_hex_layers wrote, under a Generators group: the
+    # sums layer, each generator type's status layers with its own colour
+    # ramp over the sums layer's classes, and the bivariate pairs
+    with GpkgReader(path) as reader:
+        written = set(reader.layers())
+        layer_names = {
+            group: name for group, name in hex_layer_names().items() if name in written
+        }
+        if SUMS_GROUP not in layer_names:
+            print(f"No hex layers in {path}")
+            return
+        totals = reader.columns(layer_names[SUMS_GROUP], [f"{capacity_field}_sum"])[
+            f"{capacity_field}_sum"
+        ]
+
+    def hex_layer(group: int, display_name: str):
+        if group not in layer_names:
+            return None
+        return load_layer(f"{path}|layername={layer_names[group]}", display_name)
+
+    summed_layer = hex_layer(SUMS_GROUP, "All Generation Capacity")
+    QgsProject.instance().addMapLayer(summed_layer, False)
+
+    # Optimal classes of the summed cells
+    renderer = optimal_renderer(
+        f"{capacity_field}_sum",
+        totals,
+        num_classes,
+        symbol=hexagon_symbol(),
+        label=capacity_label,
+    )
+
+    root = QgsProject.instance().layerTreeRoot()
+    parent_group = root.insertGroup(3, "Generators")
+
+    for generator_index, energy_code in enumerate(energy_source_code):
+        with span("style_layers", generator=energy_code.name):
+            group = parent_group.addGroup(energy_code.name)
+            color_ramp = QgsStyle.defaultStyle().colorRamp(energy_code.color_ramp)
+            for status_index, status in enumerate(statuses):
+                result_layer = hex_layer(
+                    hex_layer_group(generator_index, status_index),
+                    trimmed_status(status),
+                )
+                if result_layer is None:
+                    continue
+                QgsProject.instance().addMapLayer(result_layer, False)
+                group.addLayer(result_layer).setItemVisibilityChecked(False)
+
+                # Every layer owns its own copy of the renderer
+                renderer_copy = QgsGraduatedSymbolRenderer.clone(renderer)
+                renderer_copy.updateColorRamp(color_ramp.clone())
+                result_layer.setRenderer(renderer_copy)
+
+    # The bivariate layers, styled from their own breaks
+    bivariate_group = parent_group.addGroup("Bivariate")
+    for x_name, y_name in bivariate_pairs:
+        layer_name = bivariate_layer_name(x_name, y_name)
+        if layer_name not in written:
+            continue
+        bivariate_layer = load_layer(
+            f"{path}|layername={layer_name}", f"{y_name} against {x_name}"
+        )
+        if bivariate_layer is None:
+            continue
+        x_breaks, y_breaks = hex_bivariate_breaks(path, x_name, y_name)
+        x_title, y_title = (
+            field.replace(" (MW)", "")
+            for field in bivariate_capacity_fields(x_name, y_name)
+        )
+        bivariate_layer.setRenderer(
+            bivariate_renderer(
+                "bivariate_class",
+                bivariate_palette(len(y_breaks) - 1, len(x_breaks) - 1),
+                category_labels(
+                    x_breaks, y_breaks, x_title, y_title, value_format="{:.3g} MW"
+                ),
+                hexagon_symbol(),
+            )
+        )
+        QgsProject.instance().addMapLayer(bivariate_layer, False)
+        bivariate_group.addLayer(bivariate_layer).setItemVisibilityChecked(False)
+
+    print("Processing complete. All layers have consistent graduated symbology.")
+
+
+@traced
+def add_temporal_layer(uri: str):
+    temporal_layer = load_layer(uri, "Generator Capacity (Temporal)")
+    if temporal_layer is None:
+        return None
+    tprops = temporal_layer.temporalProperties()
+    tprops.setIsActive(True)
+    tprops.setMode(
+        QgsVectorLayerTemporalProperties.ModeFeatureDateTimeStartAndEndFromFields
+    )
+    tprops.setStartField("start_date")
+    tprops.setEndField("end_date")
+    QgsProject.instance().addMapLayer(temporal_layer)
+    print("Temporal layer created successfully")
+    return temporal_layer
+
+
+@traced
+def add_centroid_layer(uri: str):
+    vlayer = load_layer(uri, "Weighted Centroids")
+    if vlayer is None:
+        return None
+    QgsProject.instance().addMapLayer(vlayer)
+
+    label_settings = QgsPalLayerSettings()
+    label_settings.fieldName = """format('%1 %2', "energy_type", "year")"""
+    label_settings.enabled = True
+    label_settings.isExpression = True
+    vlayer.setLabelsEnabled(True)
+    vlayer.setLabeling(QgsVectorLayerSimpleLabeling(label_settings))
+
+    vlayer.setRenderer(centroid_renderer())
+    vlayer.triggerRepaint()
+    return vlayer
+
+
+def centroid_renderer():
+    # Categorized on energy type, in each type's single_color
+    categories = [
+        QgsRendererCategory(
+            energy_code.name,
+            QgsMarkerSymbol.createSimple(
+                {"name": "circle", "color": energy_code.single_color, "size": "3.0"}
+            ),
+            energy_code.name,
+        )
+        for energy_code in energy_source_code
+    ]
+    return QgsCategorizedSymbolRenderer("energy_type", categories)
+
+
+def project_layers(path: str, layer_name: str) -> List[QgsVectorLayer]:
+    # Project layers showing layer_name of the GeoPackage at path
+    path = os.path.abspath(path)
+    layers = []
+    for layer in QgsProject.instance().mapLayers().values():
+        if layer.providerType() != "ogr":
+            continue
+        parts = QgsProviderRegistry.instance().decodeUri("ogr", layer.source())
+        if (
+            os.path.abspath(parts.get("path", "")) == path
+            and parts.get("layerName") == layer_name
+        ):
+            layers.append(layer)
+    return layers
+
+
+@traced
+def restyle_hex_layers(path: str = HEX_GPKG):
+    # Recolours the hex layers already in the project with each generator
+    # type's colour ramp, keeping their classes
+    layer_names = hex_layer_names()
+    for generator_index, energy_code in enumerate(energy_source_code):
+        color_ramp = QgsStyle.defaultStyle().colorRamp(energy_code.color_ramp)
+        for status_index in range(len(statuses)):
+            group = hex_layer_group(generator_index, status_index)
+            for layer in project_layers(path, layer_names[group]):
+                renderer = layer.renderer()
+                if not isinstance(renderer, QgsGraduatedSymbolRenderer):
+                    continue
+                renderer = QgsGraduatedSymbolRenderer.clone(renderer)
+                renderer.updateColorRamp(color_ramp.clone())
+                layer.setRenderer(renderer)
+                layer.triggerRepaint()
+
+
+@traced
+def restyle_centroid_layer(path: str = HEX_GPKG):
+    # Recolours the centroid layer already in the project with each
+    # generator type's single_color
+    for layer in project_layers(path, "weighted_centroids"):
+        layer.setRenderer(centroid_renderer())
+        layer.triggerRepaint()
+
+
+subregion_displays = [
+    {
+        "region": "state",
+        "display": "Battery Capacity by State",
+        "field_expr": """format('%1MW', format_number(total_battery_capacity))""",
+    },
+    {
+        "region": "ba",
+        "display": "Battery Capacity by Balancing Authority",
+        "field_expr": """format('%1\n%2MW', EIAcode, format_number(total_battery_capacity))""",
+    },
+    {
+        "field": "battery_fraction",
+        "region": "state",
+        "display": "Battery Fraction by State",
+        "field_expr": """format('%1%', format_number(battery_fraction, 1))""",
+        "graduated": True,
+    },
+    {
+        "field": "battery_fraction",
+        "region": "ba",
+        "display": "Battery Fraction by Balancing Authority",
+        "field_expr": """format('%1\n%2%', EIAcode, format_number(battery_fraction, 1))""",
+        "graduated": True,
+    },
+    {
+        "field": "renewables_fraction",
+        "region": "ba",
+        "display": "Renewables Fraction by Balancing Authority",
+        "field_expr": """format('%1\n%2%', EIAcode, format_number(renewables_fraction, 1))""",
+        "graduated": True,
+    },
+] + [
+    {
+        "region": region,
+        "display": bivariate["display"],
+        "field_expr": f"""format('%1 / %2', format_number({bivariate['y']}, 1), format_number({bivariate['x']}, 1))""",
+        "bivariate": True,
+    }
+    for region, bivariate in subregion_bivariates.items()
+]
+
+
+def label_with_background(layer, expression: str):
+    label_settings = QgsPalLayerSettings()
+    label_settings.fieldName = expression
+    label_settings.enabled = True
+    label_settings.isExpression = True
+
+    # Label mask: white at 80% opacity, thin black outline at 40%
+    background_settings = QgsTextBackgroundSettings()
+    background_settings.setEnabled(True)
+    background_settings.setType(QgsTextBackgroundSettings.ShapeRectangle)
+    background_settings.setSizeType(QgsTextBackgroundSettings.SizeBuffer)
+    background_settings.setSize(QSizeF(1.5, 1.5))
+    background_settings.setFillColor(QColor(255, 255, 255, 200))
+    background_settings.setStrokeColor(QColor(0, 0, 0, 100))
+    background_settings.setStrokeWidth(0.2)
+
+    text_format = QgsTextFormat()
+    text_format.setBackground(background_settings)
+    label_settings.setFormat(text_format)
+
+    layer.setLabelsEnabled(True)
+    layer.setLabeling(QgsVectorLayerSimpleLabeling(label_settings))
+
+
+@traced
+def add_subregion_layers(path: str = SUMS_GPKG):
+    # Every display of the wide tables build_subregions wrote, under a
+    # Capacity By Subregion group
+    values: Dict[str, tuple] = {
+        region: subregion_values(path, region) for region in region_tables
+    }
+    group = (
+        QgsProject.instance().layerTreeRoot().insertGroup(3, "Capacity By Subregion")
+    )
+
+    for display_info in subregion_displays:
+        region = display_info["region"]
+        display_name = display_info["display"]
+        permanent_layer = load_layer(
+            f"{path}|layername={region_tables[region]['name']}", display_name
+        )
+        if permanent_layer is None:
+            continue
+        label_with_background(permanent_layer, display_info["field_expr"])
+
+        metric_columns, breaks = values[region]
+        if display_info.get("graduated", False):
+            # Exact optimal breaks from the values written, the same on every
+            # run
+            color_ramp = QgsStyle.defaultStyle().colorRamp("Greens")
+            color_ramp.invert()
+            permanent_layer.setRenderer(
+                optimal_renderer(
+                    display_info["field"],
+                    metric_columns[display_info["field"]],
+                    8,
+                    symbol=QgsSymbol.defaultSymbol(permanent_layer.geometryType()),
+                    color_ramp=color_ramp,
+                )
+            )
+
+        if display_info.get("bivariate", False):
+            bivariate = subregion_bivariates[region]
+            x_breaks, y_breaks = breaks
+            permanent_layer.setRenderer(
+                bivariate_renderer(
+                    bivariate["field"],
+                    bivariate_palette(len(y_breaks) - 1, len(x_breaks) - 1),
+                    category_labels(
+                        x_breaks, y_breaks, bivariate["x_title"], bivariate["y_title"]
+                    ),
+                    QgsSymbol.defaultSymbol(permanent_layer.geometryType()),
+                )
+            )
+
+        QgsProject.instance().addMapLayer(permanent_layer, False)
+        group.addLayer(permanent_layer).setItemVisibilityChecked(False)
+        print(f"{display_name} layer created and labeled")
+
+    print("All layers saved to", path)
+
+
+@traced
+def add_sweep_layers(uris: Dict[float, str]):
+    sweep_group = (
+        QgsProject.instance().layerTreeRoot().insertGroup(3, "Grid Size Sweep")
+    )
+    for spacing, uri in uris.items():
+        sums_layer = load_layer(uri, f"All Generation Capacity ({spacing / 1000:g} km)")
+        if sums_layer is None:
+            continue
+        QgsProject.instance().addMapLayer(sums_layer, False)
+        sweep_group.addLayer(sums_layer).setItemVisibilityChecked(False)
+
+
+def project_layer_source(name: str) -> Optional[str]:
+    # File behind the first project layer of that name
+    layers = QgsProject.instance().mapLayersByName(name)
+    return layers[0].source().split("|")[0] if layers else None
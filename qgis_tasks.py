@@ -0,0 +1,97 @@
+import os
+import threading
+import traceback
+from contextlib import ExitStack
+from typing import Callable, Dict, Optional, Sequence
+
+from qgis.core import QgsApplication, QgsTask
+
+from instrumentation import run_report
+from progress import Cancelled, Progress, reporting
+
+# Runs builds from builds.py as QGIS background tasks, so the desktop stays
+# responsive while they work. The task manager shows each one's progress
+# (reported by the builds layer by layer) and can cancel it; the build stops
+# at its next check. Layers are read before a task starts and registered
+# once it finishes, both on the main thread; the build itself touches no
+# project or layer. Tasks run alongside each other on the task manager's
+# threads, so independent builds can be started together; like the
+# pipeline's stages, tasks writing the same file take turns.
+
+# Tasks still running. The task manager doesn't keep the Python objects
+# alive, and finished() never comes for a collected task.
+_tasks = set()
+# One lock per output file, held by the task writing it
+_output_locks: Dict[str, threading.Lock] = {}
+# Seconds between checks for cancellation while waiting for a file
+LOCK_POLL = 0.25
+
+
+class BuildTask(QgsTask):
+    def __init__(
+        self,
+        name: str,
+        build: Callable[[], object],
+        on_finished: Optional[Callable[[object], None]] = None,
+        description: Optional[str] = None,
+        outputs: Sequence[str] = (),
+    ):
+        super().__init__(description or name, QgsTask.CanCancel)
+        self.name = name
+        self.build = build
+        self.on_finished = on_finished
+        # Locks created here, on the main thread, and taken in path order
+        self.locks = [
+            _output_locks.setdefault(path, threading.Lock())
+            for path in sorted({os.path.abspath(path) for path in outputs if path})
+        ]
+        self.result = None
+        self.error = None
+
+    def run(self) -> bool:
+        # On a task manager thread, with its own run report
+        progress = Progress(
+            lambda fraction: self.setProgress(100 * fraction), self.isCanceled
+        )
+        try:
+            with ExitStack() as held:
+                for lock in self.locks:
+                    while not lock.acquire(timeout=LOCK_POLL):
+                        progress.check()
+                    held.callback(lock.release)
+                with reporting(progress), run_report(self.name):
+                    self.result = self.build()
+        except Cancelled:
+            return False
+        except Exception:
+            self.error = traceback.format_exc()
+            return False
+        return True
+
+    def finished(self, result: bool):
+        # Back on the main thread, where layers can be added
+        _tasks.discard(self)
+        if result:
+            if self.on_finished is not None:
+                self.on_finished(self.result)
+        elif self.error is not None:
+            print(f"{self.description()} failed:\n{self.error}")
+        else:
+            print(f"{self.description()} cancelled")
+
+
+def run_in_background(
+    name: str,
+    build: Callable[[], object],
+    on_finished: Optional[Callable[[object], None]] = None,
+    description: Optional[str] = None,
+    outputs: Sequence[str] = (),
+) -> BuildTask:
+    # Starts build() as a background task; on_finished gets what it returns,
+    # on the main thread, unless it fails or is cancelled. name is the run
+    # report's, description what the task manager shows, and outputs the
+    # files the build writes.
+    task = BuildTask(name, build, on_finished, description, outputs)
+    _tasks.add(task)
+    QgsApplication.taskManager().addTask(task)
+    return task
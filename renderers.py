@@ -0,0 +1,66 @@
+from typing import Callable, Optional
+
+import numpy as np
+from qgis.core import (
+    QgsCategorizedSymbolRenderer,
+    QgsColorRamp,
+    QgsGraduatedSymbolRenderer,
+    QgsRendererCategory,
+    QgsRendererRange,
+    QgsSymbol,
+)
+from qgis.PyQt.QtGui import QColor
+
+from classify import ckmeans_breaks
+from instrumentation import traced
+
+
+def range_label(lower: float, upper: float) -> str:
+    return f"{lower:g} - {upper:g}"
+
+
+def graduated_renderer(
+    field: str,
+    breaks,
+    symbol: QgsSymbol,
+    color_ramp: Optional[QgsColorRamp] = None,
+    label: Callable[[float, float], str] = range_label,
+) -> QgsGraduatedSymbolRenderer:
+    # A graduated renderer with one range per pair of consecutive breaks
+    # (see classify.ckmeans_breaks), instead of letting QGIS classify a
+    # sample of the layer. A new renderer has no source symbol to copy into
+    # the ranges, so symbol is required (QgsSymbol.defaultSymbol of the
+    # layer's geometry type for QGIS's default look).
+    renderer = QgsGraduatedSymbolRenderer(field)
+    renderer.setSourceSymbol(symbol.clone())
+    breaks = np.asarray(breaks, dtype=np.float64).tolist()
+    for lower, upper in zip(breaks[:-1], breaks[1:]):
+        renderer.addClassRange(
+            QgsRendererRange(
+                lower, upper, renderer.sourceSymbol().clone(), label(lower, upper)
+            )
+        )
+    if color_ramp is not None:
+        renderer.updateColorRamp(color_ramp)
+    return renderer
+
+
+@traced
+def optimal_renderer(field: str, values, classes: int, **kwargs):
+    # graduated_renderer over the optimal 1-D classes of values
+    return graduated_renderer(field, ckmeans_breaks(values, classes), **kwargs)
+
+
+@traced
+def bivariate_renderer(
+    field: str, palette, labels, symbol: QgsSymbol
+) -> QgsCategorizedSymbolRenderer:
+    # One category per bivariate code (see bivariate.bivariate_classes), in
+    # code order: palette rows are y classes, columns x classes
+    colors = [color for row in palette for color in row]
+    categories = []
+    for code, (color, label) in enumerate(zip(colors, labels)):
+        category_symbol = symbol.clone()
+        category_symbol.setColor(QColor(color))
+        categories.append(QgsRendererCategory(code, category_symbol, label))
+    return QgsCategorizedSymbolRenderer(field, categories)
@@ -0,0 +1,128 @@
+import os
+
+from builds import GRID_GPKG, HEX_GPKG, build_stages, memoized, subregion_point_fields
+from centroid_groups import centroid_point_fields
+from eia860m import WORKBOOK_PATH
+from generator_points import cached_generator_points
+from incremental import snapshot_fields
+from parallel import WORKERS
+from pipeline import Pipeline
+from qgis_adapters import (
+    add_centroid_layer,
+    add_grid_layer,
+    add_hex_layers,
+    add_subregion_layers,
+    add_temporal_layer,
+    feature_table,
+    restyle_centroid_layer,
+    restyle_hex_layers,
+)
+from qgis_tasks import run_in_background
+from timeline import date_fields, temporal_layer_name
+from qgis.core import QgsProject
+
+# Rebuilds whatever is out of date, in dependency order: the grid, hex,
+# temporal, centroid and subregion outputs of grid_creation.py,
+# grid_clustering.py, temporal_animation.py, centroids.py and
+# sum_by_subregion.py, and the snapshot incremental_update.py starts from.
+# Run it in place of those scripts; stages whose inputs haven't changed
+# since their last build are skipped. The builds run as one background
+# task, independent stages at once on its worker threads, and the rebuilt
+# layers are added to the project when it finishes (or is cancelled, for
+# the stages done by then). Layers whose style settings changed (a
+# Generator's colours) but whose data didn't are restyled in place.
+
+# Stages to rebuild even when they're up to date
+force = []
+# Threads for the stages, and for the work inside each; 1 (serial) unless
+# GRID_BATTERIES_WORKERS is set
+workers = WORKERS
+
+
+def layer_sources(*names):
+    # Files behind the named project layers
+    return [
+        layer.source().split("|")[0]
+        for name in names
+        for layer in QgsProject.instance().mapLayersByName(name)
+    ]
+
+
+points_layer = next(
+    (
+        x
+        for x in QgsProject.instance().mapLayersByName("Generator Points")
+        if x.crs().authid() == "EPSG:5070"
+    ),
+    None,
+)
+if os.path.exists(WORKBOOK_PATH):
+    generator_sources = [WORKBOOK_PATH]
+else:
+    generator_sources = layer_sources("Generator Points")
+point_fields = list(
+    dict.fromkeys(
+        date_fields + centroid_point_fields + subregion_point_fields + snapshot_fields
+    )
+)
+
+# Layers are read here, on the main thread, before any build starts
+load_points = memoized(
+    lambda: cached_generator_points(points_layer, fields=point_fields)
+)
+load_regions = memoized(
+    lambda: {
+        "state": feature_table(QgsProject.instance().mapLayersByName("States")[0]),
+        "ba": feature_table(
+            QgsProject.instance().mapLayersByName("World Grid Subdivisions")[0]
+        ),
+    }
+)
+
+pipeline = Pipeline(
+    build_stages(
+        load_points,
+        load_regions,
+        workbook_path=WORKBOOK_PATH,
+        input_files=generator_sources + layer_sources("States"),
+        region_files=layer_sources("World Grid Subdivisions"),
+        workers=workers,
+    )
+)
+
+stale = set(pipeline.stale(pipeline.fingerprints())) | set(force)
+restyle = set(pipeline.restyle())
+if stale - {"workbook"}:
+    load_points()
+    if "subregions" in stale:
+        load_regions()
+
+
+def add_layers(ran):
+    # Rebuilt layers are added with their current style, and the rest
+    # restyled where that's changed
+    if "grid" in ran:
+        add_grid_layer(f"{GRID_GPKG}|layername=Grid")
+    if "hex" in ran:
+        add_hex_layers()
+    if "temporal" in ran:
+        add_temporal_layer(f"{HEX_GPKG}|layername={temporal_layer_name}")
+    if "centroids" in ran:
+        add_centroid_layer(f"{HEX_GPKG}|layername=weighted_centroids")
+    if "subregions" in ran:
+        add_subregion_layers()
+    if "hex" in restyle - set(ran):
+        restyle_hex_layers()
+    if "centroids" in restyle - set(ran):
+        restyle_centroid_layer()
+    pipeline.styled(restyle | set(ran))
+    print(f"Pipeline complete: {', '.join(ran) or 'nothing'} rebuilt")
+
+
+run_in_background(
+    "run_pipeline",
+    lambda: pipeline.run(workers, force),
+    add_layers,
+    "Rebuild layers",
+    [path for stage in pipeline.stages.values() for path in stage.outputs],
+)
@@ -0,0 +1,75 @@
+from typing import Dict, Tuple
+
+import numpy as np
+
+from group_by import group_sums
+
+# Generators left out of the subregion totals
+excluded_statuses = [
+    "(P) Planned for installation, but regulatory approvals not initiated",
+    "(L) Regulatory approvals pending. Not under construction",
+    "(OS) Out of service and NOT expected to return to service in next calendar year",
+]
+retired_before_year = 2026
+
+peaker_status = "(SB) Standby/Backup: available for service but not normally used"
+
+# Capacity columns of the wide table, then the percentage columns derived
+# from them
+capacity_metrics = [
+    "total_battery_capacity",
+    "total_renewable_capacity",
+    "total_hydro_capacity",
+    "total_peaker_capacity",
+    "total_capacity",
+]
+fraction_metrics = {
+    "battery_fraction": "total_battery_capacity",
+    "renewables_fraction": "total_renewable_capacity",
+    "hydro_fraction": "total_hydro_capacity",
+}
+
+
+def metric_masks(points) -> Dict[str, np.ndarray]:
+    energy_source = points.text("Energy Source Code")
+    prime_mover = points.text("Prime Mover Code")
+    status = points.status.decode()
+    return {
+        "total_battery_capacity": energy_source == "MWH",
+        "total_renewable_capacity": np.isin(energy_source, ["SUN", "WND"]),
+        "total_hydro_capacity": (energy_source == "WAT") & (prime_mover == "HY"),
+        "total_peaker_capacity": status == peaker_status,
+        "total_capacity": np.ones(len(points), dtype=bool),
+    }
+
+
+def included_points(points) -> np.ndarray:
+    retirement_year = points.numeric("Retirement Year")
+    return ~np.isin(points.status.decode(), excluded_statuses) & (
+        np.isnan(retirement_year) | (retirement_year < retired_before_year)
+    )
+
+
+def subregion_metrics(points, region_field: str) -> Tuple[np.ndarray, Dict]:
+    # Every capacity metric and fraction for every region in one pass.
+    # Returns the region codes and a column per metric, aligned with them.
+    region = points.categorical(region_field)
+    included = included_points(points)
+    masks = metric_masks(points)
+
+    totals = group_sums(
+        np.where(included, region.codes, -1),
+        len(region.labels),
+        [points.capacity * masks[name] for name in capacity_metrics],
+    )
+    table = dict(zip(capacity_metrics, totals))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for name, metric in fraction_metrics.items():
+            table[name] = np.where(
+                table["total_capacity"] > 0,
+                table[metric] / table["total_capacity"] * 100,
+                0.0,
+            )
+
+    return region.labels, table
@@ -0,0 +1,332 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from albers import conus_albers
+from generator_table import GeneratorPoints
+from generator_types import GeneratorClassifier, classifier
+from gpkg_reader import FeatureTable
+from gpkg_writer import NAD83_CONUS_ALBERS, polygon_wkb
+from group_by import Categorical
+from hex_grid import CONUS_EXTENT
+
+# Generator tables shaped like the ones read_workbook makes from an 860M
+# workbook (same columns, statuses and codes, operating, planned and retired
+# rows), made up from a seed so the builds can be timed at many times the
+# real size. Generators sit in plants that share a site, and plants crowd
+# around hubs, so cells fill as unevenly as they do with the real data.
+
+# About how many rows read_workbook keeps from the February 2025 release
+REAL_ROWS = 33000
+# Longitude and latitude the sites are drawn from
+CONUS_BOUNDS = (-124.5, 25.0, -67.0, 49.0)
+HUBS = 80
+# Share of rows from each sheet, in eia860m.sheets order
+sheet_shares = [0.78, 0.09, 0.13]
+
+# (Energy Source Code, Prime Mover Code, Technology, share of the operating,
+# planned and retired rows, median MW, spread of log MW, first operating
+# year, how strongly operating years lean recent)
+technologies = [
+    ("SUN", "PV", "Solar Photovoltaic", (0.23, 0.42, 0.01), 5, 1.2, 2005, 6),
+    ("MWH", "BA", "Batteries", (0.04, 0.32, 0.002), 10, 1.1, 2012, 8),
+    ("WND", "WT", "Onshore Wind Turbine", (0.06, 0.09, 0.01), 100, 0.6, 1985, 3),
+    (
+        "NG",
+        "CT",
+        "Natural Gas Fired Combustion Turbine",
+        (0.08, 0.04, 0.12),
+        50,
+        0.9,
+        1960,
+        1.5,
+    ),
+    (
+        "NG",
+        "CA",
+        "Natural Gas Fired Combined Cycle",
+        (0.06, 0.03, 0.05),
+        150,
+        0.6,
+        1990,
+        2,
+    ),
+    (
+        "NG",
+        "IC",
+        "Natural Gas Internal Combustion Engine",
+        (0.07, 0.02, 0.05),
+        2,
+        1.0,
+        1980,
+        2,
+    ),
+    ("NG", "ST", "Natural Gas Steam Turbine", (0.02, 0.0, 0.12), 100, 0.9, 1950, 1),
+    ("DFO", "IC", "Petroleum Liquids", (0.13, 0.01, 0.3), 1.5, 1.1, 1960, 1.5),
+    ("BIT", "ST", "Conventional Steam Coal", (0.02, 0.0, 0.2), 300, 0.8, 1950, 1),
+    ("SUB", "ST", "Conventional Steam Coal", (0.01, 0.0, 0.05), 400, 0.7, 1960, 1),
+    ("NUC", "ST", "Nuclear", (0.004, 0.0, 0.003), 1100, 0.2, 1969, 1),
+    (
+        "WAT",
+        "HY",
+        "Conventional Hydroelectric",
+        (0.15, 0.005, 0.03),
+        10,
+        1.6,
+        1900,
+        0.8,
+    ),
+    (
+        "WAT",
+        "PS",
+        "Hydroelectric Pumped Storage",
+        (0.006, 0.002, 0.0),
+        250,
+        0.8,
+        1960,
+        1,
+    ),
+    ("LFG", "IC", "Landfill Gas", (0.06, 0.005, 0.04), 2, 0.8, 1985, 1.5),
+    ("WDS", "ST", "Wood/Wood Waste Biomass", (0.015, 0.0, 0.02), 20, 1.0, 1970, 1),
+    ("GEO", "BT", "Geothermal", (0.008, 0.002, 0.002), 15, 0.8, 1980, 1.5),
+    ("OTH", "OT", "All Other", (0.01, 0.005, 0.01), 5, 1.0, 1970, 1),
+]
+
+# (status, share) on each sheet
+sheet_statuses = [
+    [
+        ("(OP) Operating", 0.93),
+        ("(SB) Standby/Backup: available for service but not normally used", 0.06),
+        (
+            "(OA) Out of service but expected to return to service in next "
+            "calendar year",
+            0.005,
+        ),
+        (
+            "(OS) Out of service and NOT expected to return to service in next "
+            "calendar year",
+            0.005,
+        ),
+    ],
+    [
+        ("(P) Planned for installation, but regulatory approvals not initiated", 0.3),
+        ("(L) Regulatory approvals pending. Not under construction", 0.2),
+        ("(T) Regulatory approvals received. Not under construction", 0.2),
+        ("(U) Under construction, less than or equal to 50 percent complete", 0.12),
+        ("(V) Under construction, more than 50 percent complete", 0.1),
+        ("(TS) Construction complete, but not yet in commercial operation", 0.05),
+        ("(OT) Other", 0.03),
+    ],
+    [("(RE) Retired", 1.0)],
+]
+
+# Synthetic regions tile the grid's extent, (columns, rows) of tiles
+STATE_TILES = (8, 6)
+BA_TILES = (5, 4)
+
+
+def _categorical(labels, codes) -> Categorical:
+    return Categorical(
+        labels=np.asarray(labels, dtype=object), codes=np.asarray(codes, dtype=np.int32)
+    )
+
+
+def _tile_codes(x, y, tiles: Tuple[int, int], extent=CONUS_EXTENT) -> np.ndarray:
+    # Index of the extent tile holding each point, counted row by row from
+    # the bottom left
+    xmin, ymin, xmax, ymax = extent
+    columns, rows = tiles
+    column = np.clip(
+        ((x - xmin) / (xmax - xmin) * columns).astype(np.int64), 0, columns - 1
+    )
+    row = np.clip(((y - ymin) / (ymax - ymin) * rows).astype(np.int64), 0, rows - 1)
+    return row * columns + column
+
+
+def _tile_names(prefix: str, tiles: Tuple[int, int]) -> List[str]:
+    return [f"{prefix}{i:02d}" for i in range(tiles[0] * tiles[1])]
+
+
+def _sites(rng: np.random.Generator, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Longitude and latitude of n plants, crowded around hubs of very
+    # different sizes and spreads
+    west, south, east, north = CONUS_BOUNDS
+    hub_lon = rng.uniform(west, east, HUBS)
+    hub_lat = rng.uniform(south, north, HUBS)
+    weight = rng.pareto(1.2, HUBS) + 1
+    spread = rng.uniform(0.2, 2.5, HUBS)
+    hub = rng.choice(HUBS, n, p=weight / weight.sum())
+    lon = np.clip(hub_lon[hub] + rng.normal(0, 1, n) * spread[hub] * 1.3, west, east)
+    lat = np.clip(hub_lat[hub] + rng.normal(0, 1, n) * spread[hub], south, north)
+    return lon, lat
+
+
+def synthetic_generators(
+    rows: int = REAL_ROWS,
+    seed: int = 0,
+    generator_classifier: GeneratorClassifier = classifier,
+) -> GeneratorPoints:
+    # rows generators, in EPSG:5070 as projected_points returns them, with
+    # every column read_workbook keeps. The same seed and rows always give
+    # the same table.
+    rng = np.random.default_rng(seed)
+
+    # Plants of one to a dozen or so generators, cut off at exactly rows
+    sizes = rng.geometric(0.5, rows)
+    plants = int(np.searchsorted(np.cumsum(sizes), rows)) + 1
+    sizes = sizes[:plants]
+    sizes[-1] -= sizes.sum() - rows
+    plant = np.repeat(np.arange(plants), sizes)
+    generator_number = np.arange(rows) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+    lon, lat = _sites(rng, plants)
+    plant_x, plant_y = conus_albers.forward(lon, lat)
+    lon, lat, x, y = lon[plant], lat[plant], plant_x[plant], plant_y[plant]
+
+    # Each generator's sheet, then its technology and status on that sheet;
+    # a quarter of a plant's generators differ from its main technology,
+    # like the batteries next to solar farms
+    sheet = rng.choice(len(sheet_shares), rows, p=sheet_shares)
+    technology = np.empty(rows, dtype=np.int64)
+    status = np.empty(rows, dtype=np.int64)
+    status_labels = [name for statuses in sheet_statuses for name, _ in statuses]
+    first_status = np.cumsum([0] + [len(statuses) for statuses in sheet_statuses])
+    for i, statuses in enumerate(sheet_statuses):
+        on_sheet = np.flatnonzero(sheet == i)
+        shares = np.array([t[3][i] for t in technologies])
+        main = rng.choice(len(technologies), plants, p=shares / shares.sum())
+        technology[on_sheet] = np.where(
+            rng.random(len(on_sheet)) < 0.75,
+            main[plant[on_sheet]],
+            rng.choice(len(technologies), len(on_sheet), p=shares / shares.sum()),
+        )
+        shares = np.array([share for _, share in statuses])
+        status[on_sheet] = first_status[i] + rng.choice(
+            len(statuses), len(on_sheet), p=shares / shares.sum()
+        )
+
+    median, spread, first_year, lean = (
+        np.array([t[i] for t in technologies], dtype=np.float64)[technology]
+        for i in (4, 5, 6, 7)
+    )
+    capacity = np.maximum(
+        np.round(median * np.exp(rng.normal(0, 1, rows) * spread), 1), 0.1
+    )
+
+    # Dates by sheet: operating generators have run since between their
+    # technology's first year and 2025, planned ones start 2025-2030, and
+    # retired ones ran until 2010-2025
+    operating, planned, retired = (sheet == i for i in range(3))
+    nan = np.full(rows, np.nan)
+    built = np.floor(first_year + (2025 - first_year) * rng.power(lean)).clip(max=2025)
+    retired_year = rng.integers(2010, 2026, rows).astype(np.float64)
+    built_before_retiring = np.minimum(built, retired_year)
+    months = [rng.integers(1, 13, rows).astype(np.float64) for _ in range(4)]
+    # A few operating generators lack a month, as in the workbook
+    months[0][rng.random(rows) < 0.002] = np.nan
+    planned_retirement = operating & (rng.random(rows) < 0.05)
+    columns = {
+        "Operating Year": np.where(
+            operating, built, np.where(retired, built_before_retiring, nan)
+        ),
+        "Operating Month": np.where(operating | retired, months[0], nan),
+        "Planned Operation Year": np.where(
+            planned, rng.integers(2025, 2031, rows).astype(np.float64), nan
+        ),
+        "Planned Operation Month": np.where(planned, months[1], nan),
+        "Retirement Year": np.where(retired, retired_year, nan),
+        "Retirement Month": np.where(retired, months[2], nan),
+        "Planned Retirement Year": np.where(
+            planned_retirement, rng.integers(2025, 2041, rows).astype(np.float64), nan
+        ),
+        "Planned Retirement Month": np.where(planned_retirement, months[3], nan),
+        "Entity ID": (plant // 3 + 1).astype(np.float64),
+        "Plant ID": (plant + 1).astype(np.float64),
+        "Latitude": lat,
+        "Longitude": lon,
+    }
+
+    # Regions are where the synthetic_regions tiles put each plant; a few
+    # plants have no balancing authority, as in the workbook
+    state = _tile_codes(plant_x, plant_y, STATE_TILES)[plant]
+    ba = _tile_codes(plant_x, plant_y, BA_TILES)
+    ba = np.where(rng.random(plants) < 0.01, BA_TILES[0] * BA_TILES[1], ba)[plant]
+    columns.update(
+        {
+            "Entity Name": _categorical(
+                [f"Utility {i + 1}" for i in range(plants // 3 + 1)], plant // 3
+            ),
+            "Plant Name": _categorical(
+                [f"Plant {i + 1}" for i in range(plants)], plant
+            ),
+            "Generator ID": _categorical(
+                [str(i + 1) for i in range(sizes.max())], generator_number
+            ),
+            "Plant State": _categorical(_tile_names("S", STATE_TILES), state),
+            "County": _categorical(
+                [f"County {i + 1}" for i in range(STATE_TILES[0] * STATE_TILES[1])],
+                state,
+            ),
+            "Balancing Authority Code": _categorical(
+                _tile_names("B", BA_TILES) + [""], ba
+            ),
+            "Technology": _categorical([t[2] for t in technologies], technology),
+            "Energy Source Code": _categorical(
+                [t[0] for t in technologies], technology
+            ),
+            "Prime Mover Code": _categorical([t[1] for t in technologies], technology),
+        }
+    )
+
+    return GeneratorPoints(
+        x=np.asarray(x, dtype=np.float64),
+        y=np.asarray(y, dtype=np.float64),
+        capacity=capacity,
+        status=_categorical(status_labels, status),
+        generator=generator_classifier.classify(
+            columns["Energy Source Code"],
+            columns["Prime Mover Code"],
+            columns["Technology"],
+        ),
+        columns=columns,
+    )
+
+
+def _tile_table(
+    prefix: str, key_field: str, tiles: Tuple[int, int], extent=CONUS_EXTENT
+) -> FeatureTable:
+    xmin, ymin, xmax, ymax = extent
+    columns, rows = tiles
+    width, height = (xmax - xmin) / columns, (ymax - ymin) / rows
+    geometries = []
+    for row in range(rows):
+        for column in range(columns):
+            left, bottom = xmin + column * width, ymin + row * height
+            geometries.append(
+                polygon_wkb(
+                    [
+                        (left, bottom),
+                        (left + width, bottom),
+                        (left + width, bottom + height),
+                        (left, bottom + height),
+                        (left, bottom),
+                    ]
+                )
+            )
+    names = _tile_names(prefix, tiles)
+    return FeatureTable(
+        fields=[(key_field, "TEXT"), ("NAME", "TEXT")],
+        rows=[[name, f"Region {name}"] for name in names],
+        geometries=geometries,
+        geometry_type="POLYGON",
+        srs=NAD83_CONUS_ALBERS,
+    )
+
+
+def synthetic_regions() -> Dict[str, FeatureTable]:
+    # State and balancing authority polygons matching the codes
+    # synthetic_generators gives, as build_subregions takes them
+    return {
+        "state": _tile_table("S", "STUSPS", STATE_TILES),
+        "ba": _tile_table("B", "EIACode", BA_TILES),
+    }
@@ -0,0 +1,192 @@
+import sqlite3
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from group_by import Categorical
+from timeline import active_totals, generator_months
+
+# Point-in-time and range questions about capacity ("how much BESS did BA Y
+# have in March 2023?") answered from per-key monthly levels. Every key gets
+# its level in each month plus a running total over months, so capacity at a
+# date, change between dates and capacity-months over a range are constant
+# time, and a sparse table of running maxima makes the peak month over any
+# range constant time too.
+
+Date = Union[str, Tuple[int, int]]
+
+
+@dataclass
+class CapacityTimeline:
+    keys: List[Hashable]
+    # (keys, months) capacity active in each month
+    levels: np.ndarray
+    origin_year: int
+
+    def __post_init__(self):
+        self.key_index: Dict[Hashable, int] = {
+            key: i for i, key in enumerate(self.keys)
+        }
+        self.running = np.concatenate(
+            (np.zeros((len(self.keys), 1)), np.cumsum(self.levels, axis=1)), axis=1
+        )
+        # peaks[k][:, m] is the argmax over months m .. m + 2**k - 1
+        self.peaks = [np.broadcast_to(np.arange(self.months), self.levels.shape)]
+        rows = np.arange(len(self.keys))[:, None]
+        width = 1
+        while width * 2 <= self.months:
+            previous = self.peaks[-1]
+            left, right = previous[:, : -width or None], previous[:, width:]
+            self.peaks.append(
+                np.where(
+                    self.levels[rows, right] > self.levels[rows, left], right, left
+                )
+            )
+            width *= 2
+
+    @property
+    def months(self) -> int:
+        return self.levels.shape[1]
+
+    def month(self, date: Date) -> int:
+        # Month index of a "yyyy-mm[-dd]" string or a (year, month) pair
+        if isinstance(date, str):
+            year, month = (int(part) for part in date.split("-")[:2])
+        else:
+            year, month = date
+        return (year - self.origin_year) * 12 + month - 1
+
+    def date(self, month: int) -> Tuple[int, int]:
+        year, month = divmod(int(month), 12)
+        return self.origin_year + year, month + 1
+
+    def _row(self, key: Hashable):
+        if key not in self.key_index:
+            raise KeyError(f"No capacity recorded for {key!r}")
+        return self.key_index[key]
+
+    def capacity_at(self, key: Hashable, date: Date) -> float:
+        month = self.month(date)
+        if not 0 <= month < self.months:
+            return 0.0
+        return float(self.levels[self._row(key), month])
+
+    def change(self, key: Hashable, start: Date, end: Date) -> float:
+        return self.capacity_at(key, end) - self.capacity_at(key, start)
+
+    def capacity_months(self, key: Hashable, start: Date, end: Date) -> float:
+        # Sum of monthly capacity from start through end, inclusive
+        first, last = self._month_range(start, end)
+        running = self.running[self._row(key)]
+        return float(running[last + 1] - running[first])
+
+    def peak(self, key: Hashable, start: Date, end: Date):
+        # (year, month) and capacity of the first month with the most capacity
+        # from start through end, inclusive
+        first, last = self._month_range(start, end)
+        row = self._row(key)
+        level = int(last - first + 1).bit_length() - 1
+        left = self.peaks[level][row, first]
+        right = self.peaks[level][row, last - (1 << level) + 1]
+        month = right if self.levels[row, right] > self.levels[row, left] else left
+        return self.date(month), float(self.levels[row, month])
+
+    def _month_range(self, start: Date, end: Date) -> Tuple[int, int]:
+        first = max(self.month(start), 0)
+        last = min(self.month(end), self.months - 1)
+        if first > last:
+            raise ValueError(f"No months of the timeline between {start} and {end}")
+        return first, last
+
+
+def build_timeline(
+    keys: Sequence[Hashable],
+    key_ids: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    capacity: np.ndarray,
+    origin_year: int,
+    n_months: int,
+) -> CapacityTimeline:
+    # key_ids index into keys; intervals run from month start up to but not
+    # including month end
+    (levels,) = active_totals(key_ids, start, end, len(keys), n_months, [capacity])
+    return CapacityTimeline(keys=list(keys), levels=levels, origin_year=origin_year)
+
+
+def read_intervals(gpkg_path: str, layer_name: str = "generator_capacity_temporal"):
+    # cell_id, start_date, end_date, energy_source and capacity_mw columns of
+    # the temporal layer (table or view)
+    connection = sqlite3.connect(f"file:{gpkg_path}?mode=ro", uri=True)
+    try:
+        rows = connection.execute(
+            f'SELECT cell_id, start_date, end_date, energy_source, capacity_mw FROM "{layer_name}"'
+        ).fetchall()
+    finally:
+        connection.close()
+    cell_id, start_date, end_date, source, capacity = zip(*rows) if rows else ([],) * 5
+    return (
+        np.array(cell_id, dtype=np.int64),
+        np.array(start_date, dtype=object),
+        np.array(end_date, dtype=object),
+        np.array(source, dtype=object),
+        np.array(capacity, dtype=np.float64),
+    )
+
+
+def _month_indices(dates: np.ndarray, origin_year: int) -> np.ndarray:
+    # "yyyy-mm-dd" strings to month indices
+    return np.fromiter(
+        ((int(date[:4]) - origin_year) * 12 + int(date[5:7]) - 1 for date in dates),
+        dtype=np.int64,
+        count=len(dates),
+    )
+
+
+def cell_timeline(
+    gpkg_path: str,
+    origin_year: int,
+    n_months: int,
+    layer_name: str = "generator_capacity_temporal",
+) -> CapacityTimeline:
+    # Keyed by (cell id, energy source), from the merged interval layer
+    cell_id, start_date, end_date, source, capacity = read_intervals(
+        gpkg_path, layer_name
+    )
+    sources = Categorical.from_values(source)
+    pairs, key_ids = np.unique(
+        np.stack((cell_id, sources.codes.astype(np.int64)), axis=1),
+        axis=0,
+        return_inverse=True,
+    )
+    return build_timeline(
+        [(int(cell), sources.labels[code]) for cell, code in pairs.tolist()],
+        key_ids.reshape(-1),
+        _month_indices(start_date, origin_year),
+        _month_indices(end_date, origin_year) + 1,
+        capacity,
+        origin_year,
+        n_months,
+    )
+
+
+def region_timeline(
+    points, region_field: str, energy_names: Sequence[str], origin_year, n_months
+) -> CapacityTimeline:
+    # Keyed by (region, energy source), straight from the generator points
+    # (loaded with timeline.date_fields and region_field), counting each
+    # generator the same way the temporal layer does
+    included, _, start, end = generator_months(points, origin_year, n_months)
+    rows = np.flatnonzero(included)
+    region = points.categorical(region_field)
+    n_sources = len(energy_names)
+    return build_timeline(
+        [(label, name) for label in region.labels.tolist() for name in energy_names],
+        region.codes[rows].astype(np.int64) * n_sources + points.generator[rows],
+        start[rows],
+        end[rows],
+        points.capacity[rows],
+        origin_year,
+        n_months,
+    )
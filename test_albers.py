@@ -0,0 +1,58 @@
+import numpy as np
+
+from albers import AlbersEqualArea, conus_albers, projection_error
+
+# conus_albers against EPSG:5070 coordinates from PROJ (NAD83 longitude and
+# latitude to NAD83 / Conus Albers), and Snyder's worked example
+
+# Longitude, latitude, x, y, to the millimetre
+reference_points = [
+    (-96.0, 23.0, 0.000, 0.000),
+    (-96.0, 45.5, 0.000, 2501326.094),
+    (-77.0365, 38.8977, 1618600.049, 1925474.643),
+    (-122.4194, 37.7749, -2275431.915, 1955935.417),
+    (-80.1918, 25.7617, 1594077.430, 434469.969),
+    (-69.0, 47.0, 2035359.486, 2958785.693),
+    (-124.5, 48.4, -2099461.436, 3139428.553),
+    (-116.2, 43.6, -1611576.758, 2461620.185),
+]
+
+
+def test_matches_epsg_5070():
+    longitude, latitude, x, y = np.array(reference_points).T
+    projected_x, projected_y = conus_albers.forward(longitude, latitude)
+    assert np.abs(projected_x - x).max() < 0.001
+    assert np.abs(projected_y - y).max() < 0.001
+
+
+def test_snyder_example():
+    # Map Projections: A Working Manual, p. 292: the same parallels and
+    # origin on the Clarke 1866 ellipsoid, 35N 75W
+    clarke = AlbersEqualArea(
+        29.5,
+        45.5,
+        23.0,
+        -96.0,
+        semi_major_axis=6378206.4,
+        inverse_flattening=294.978698214,
+    )
+    x, y = clarke.forward(-75.0, 35.0)
+    assert abs(x - 1885472.7) < 0.1 and abs(y - 1535925.0) < 0.1
+
+
+def test_missing_coordinates_stay_missing():
+    x, y = conus_albers.forward([np.nan, -96.0], [30.0, np.nan])
+    assert np.isnan(x).all() and np.isnan(y).all()
+
+
+def test_projection_error():
+    longitude, latitude, x, y = np.array(reference_points).T
+    longitude[0] = np.nan
+    assert projection_error(x, y, longitude, latitude, conus_albers.forward) < 0.001
+
+    def shifted(longitude, latitude):
+        x, y = conus_albers.forward(longitude, latitude)
+        return x + 3.0, y - 4.0
+
+    error = projection_error(x, y, longitude, latitude, shifted)
+    assert abs(error - 5.0) < 0.001
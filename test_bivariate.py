@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from bivariate import (
+    bivariate_classes,
+    bivariate_palette,
+    category_labels,
+    cell_pair_values,
+    class_breaks,
+    classify,
+)
+
+# Breaks and classes of the bivariate maps, where quantiles tie and where
+# most features have none of one variable
+
+
+def test_quantile_breaks():
+    values = np.arange(1.0, 13.0)
+    breaks = class_breaks(values, 3)
+    assert breaks.tolist() == [1.0, 4.666666666666666, 8.333333333333332, 12.0]
+    classes = classify(values, breaks)
+    assert np.bincount(classes).tolist() == [4, 4, 4]
+    # Upper edges are inclusive
+    assert classify([1.0, 4.666666666666666, 4.7, 12.0], breaks).tolist() == [
+        0,
+        0,
+        1,
+        2,
+    ]
+
+
+def test_tied_quantiles_merge_classes():
+    values = np.array([0.0] * 6 + [5.0, 6.0, 7.0, 8.0])
+    breaks = class_breaks(values, 3)
+    assert breaks.tolist() == [0.0, 5.0, 8.0]
+    assert classify(values, breaks).tolist() == [0] * 7 + [1, 1, 1]
+    # Every quantile but the top one on zero leaves one class
+    values = np.array([0.0] * 8 + [5.0, 7.0])
+    assert class_breaks(values, 3).tolist() == [0.0, 7.0]
+    assert not classify(values, [0.0, 7.0]).any()
+    # One value throughout still makes one class
+    breaks = class_breaks(np.full(5, 2.0), 3)
+    assert breaks.tolist() == [2.0, 2.0]
+    assert classify(np.full(5, 2.0), breaks).tolist() == [0] * 5
+    assert len(class_breaks(np.array([np.nan]), 3)) == 0
+
+
+def test_zero_floor():
+    # Without it, the zeros take two of the quantiles and merge two classes
+    values = np.array([0.0] * 9 + [1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    assert len(class_breaks(values, 3)) == 3
+    floored = class_breaks(values, 3, zero_floor=True)
+    assert np.allclose(floored, [0.0, 8.0 / 3, 13.0 / 3, 6.0])
+    assert classify(values, floored).tolist() == [0] * 9 + [0, 0, 1, 1, 2, 2]
+    # All zeros: nothing positive to take breaks from
+    assert class_breaks(np.zeros(4), 3, zero_floor=True).tolist() == [0.0, 0.0]
+    jenks = class_breaks(values, 2, "jenks", zero_floor=True)
+    assert jenks.tolist() == [0.0, 3.0, 6.0]
+    with pytest.raises(ValueError):
+        class_breaks(values, 3, "equal")
+
+
+def test_bivariate_codes():
+    x = np.array([0.0, 1.0, 2.0, 3.0, np.nan, 5.0])
+    y = np.array([6.0, 5.0, 4.0, 3.0, 2.0, 1.0])
+    codes, x_breaks, y_breaks = bivariate_classes(x, y, 2, 3)
+    x_class, y_class = classify(x, x_breaks), classify(y, y_breaks)
+    assert codes.tolist()[4] == -1
+    keep = codes >= 0
+    assert (codes[keep] == y_class[keep] * 2 + x_class[keep]).all()
+    assert len(category_labels(x_breaks, y_breaks, "x", "y")) == 6
+    assert np.array(bivariate_palette(3, 2)).shape == (3, 2)
+
+
+def test_cell_pair_values():
+    cells = np.array([3, 3, 1, 1, -1, 2])
+    generator = np.array([0, 1, 1, 2, 0, 2])
+    capacity = np.array([1.0, 2.0, 4.0, 8.0, 16.0, 32.0])
+    found, x, y = cell_pair_values(cells, generator, capacity, 0, 1)
+    assert found.tolist() == [1, 3]
+    assert x.tolist() == [0.0, 1.0] and y.tolist() == [4.0, 2.0]
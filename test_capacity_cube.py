@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+
+from capacity_cube import CapacityCube, write_capacity_cube, write_step_cube
+from generator_types import energy_source_code
+from hex_grid import conus_grid
+from synthetic_860m import synthetic_generators
+from timeline import cell_source_steps, generator_months
+
+# The cube written from the temporal layer's steps against summing every
+# generator's capacity into each month it's active, cell and type directly
+
+
+def direct_levels(cells, generator, start, end, capacity, n_months):
+    # (months, cell, type) sums, keyed on cell id and type index
+    levels = {}
+    for cell, source, first, last, mw in zip(
+        cells.tolist(), generator.tolist(), start, end, capacity.tolist()
+    ):
+        series = levels.setdefault((cell, source), np.zeros(n_months))
+        series[max(int(first), 0) : max(min(int(last), n_months), 0)] += mw
+    return levels
+
+
+def test_cube_matches_direct_sums(tmp_path):
+    points = synthetic_generators(3000, 0)
+    origin_year, n_months = 2015, 12 * 12
+    sources = [generator.name for generator in energy_source_code]
+    included, _, start, end = generator_months(points, origin_year, n_months)
+    cell_ids = conus_grid.cell_ids(points.x, points.y)
+    rows = np.flatnonzero(included & (cell_ids >= 0))
+    steps = cell_source_steps(
+        cell_ids[rows],
+        points.generator[rows],
+        start[rows],
+        end[rows],
+        points.capacity[rows],
+        n_months,
+    )
+    path = os.path.join(tmp_path, "capacity.cube")
+    write_step_cube(path, *steps, sources, n_months, origin_year)
+    cube = CapacityCube(path)
+
+    expected = direct_levels(
+        cell_ids[rows],
+        points.generator[rows],
+        start[rows],
+        end[rows],
+        points.capacity[rows],
+        n_months,
+    )
+    assert cube.months == n_months and cube.sources == sources
+    assert set(cube.cell_ids.tolist()) <= {cell for cell, _ in expected}
+    total = np.zeros((n_months, len(cube.cell_ids), len(sources)))
+    positions = cube.cell_positions([cell for cell, _ in expected])
+    for (cell, source), position in zip(expected, positions.tolist()):
+        series = expected[cell, source]
+        if position < 0:
+            assert not series.any()
+            continue
+        total[:, position, source] = series
+    assert np.allclose(cube.data, total, rtol=1e-6, atol=1e-3)
+
+    # Frames, series and slices are views of the same array
+    cell = int(cube.cell_ids[len(cube.cell_ids) // 2])
+    assert np.array_equal(
+        cube.series(cell), cube.data[:, cube.cell_positions([cell])[0]]
+    )
+    assert np.array_equal(cube.frame(40), cube.data[40])
+    block = cube.slice([cell, -5], slice(10, 20), [sources[1], sources[0]])
+    assert block.shape == (10, 2, 2)
+    assert np.array_equal(block[:, 0], cube.series(cell)[10:20, [1, 0]])
+    assert not block[:, 1].any()
+    assert not cube.series(-5).any()
+    assert cube.month_of(cube.month_index(2020, 7)) == (2020, 7)
+
+
+def test_header_round_trip(tmp_path):
+    # Cells come back sorted, whatever order they're written in
+    levels = np.arange(2 * 3 * 2, dtype=np.float64).reshape(2, 3, 2)
+    path = os.path.join(tmp_path, "small.cube")
+    write_capacity_cube(path, levels, [30, 10, 20], ["x", "y"], 2020)
+    cube = CapacityCube(path)
+    assert cube.cell_ids.tolist() == [10, 20, 30]
+    assert cube.origin_year == 2020 and cube.sources == ["x", "y"]
+    assert np.array_equal(cube.data, levels[:, [1, 2, 0]])
+    assert cube.data.offset % 64 == 0
@@ -0,0 +1,70 @@
+from itertools import combinations
+
+import numpy as np
+
+from classify import ckmeans, ckmeans_breaks
+
+# The optimal classes against trying every way to cut the sorted values
+
+
+def sse(values) -> float:
+    return float(((values - values.mean()) ** 2).sum()) if len(values) else 0.0
+
+
+def exhaustive_cost(values, k: int) -> float:
+    x = np.sort(values)
+    return min(
+        sum(sse(part) for part in np.split(x, cuts))
+        for cuts in combinations(range(1, len(x)), k - 1)
+    )
+
+
+def classes_cost(values, classes) -> float:
+    return sum(sse(values[classes == c]) for c in np.unique(classes))
+
+
+def check_breaks(values, k: int):
+    classes = ckmeans(values, k)
+    breaks = ckmeans_breaks(values, k)
+    classes_used = min(k, len(np.unique(values)))
+    assert len(breaks) == classes_used + 1
+    assert breaks[0] == values.min() and breaks[-1] == values.max()
+    assert (np.diff(breaks) >= 0).all()
+    # Every value falls in its class's range, and classes run in value order
+    assert (values >= breaks[classes]).all()
+    assert (values <= breaks[classes + 1]).all()
+    assert (np.diff(classes[np.argsort(values, kind="stable")]) >= 0).all()
+    assert np.isclose(
+        classes_cost(values, classes), exhaustive_cost(values, classes_used)
+    )
+
+
+def test_matches_exhaustive_search():
+    rng = np.random.default_rng(0)
+    for trial in range(60):
+        n = int(rng.integers(2, 11))
+        values = rng.normal(0, 10, n).round(1)
+        for k in range(1, min(n, 5) + 1):
+            check_breaks(values, k)
+
+
+def test_ties_and_few_distinct_values():
+    rng = np.random.default_rng(1)
+    for trial in range(60):
+        n = int(rng.integers(2, 11))
+        # Only a handful of distinct values, often fewer than the classes
+        values = rng.integers(0, 4, n).astype(np.float64) * 2.5
+        for k in range(1, 6):
+            check_breaks(values, k)
+    values = np.array([3.0, 1.0, 3.0, 1.0, 3.0])
+    assert ckmeans_breaks(values, 5).tolist() == [1.0, 1.0, 3.0]
+    assert ckmeans(values, 5).tolist() == [1, 0, 1, 0, 1]
+
+
+def test_single_value_and_nans():
+    assert ckmeans_breaks(np.array([4.0]), 3).tolist() == [4.0, 4.0]
+    assert ckmeans_breaks(np.full(6, 7.0), 3).tolist() == [7.0, 7.0]
+    values = np.array([np.nan, 2.0, np.nan, 9.0])
+    assert ckmeans(values, 2).tolist() == [-1, 0, -1, 1]
+    assert ckmeans_breaks(values, 2).tolist() == [2.0, 2.0, 9.0]
+    assert len(ckmeans_breaks(np.array([np.nan]), 2)) == 0
@@ -0,0 +1,24 @@
+import hashlib
+import os
+
+from eia860m import cache_path, file_digest, file_digests
+
+# The workbook is hashed once and again only when it changes
+
+
+def test_digest_reused_until_the_file_changes(tmp_path):
+    path = os.path.join(tmp_path, "workbook.xlsx")
+    with open(path, "wb") as f:
+        f.write(b"first release")
+    first = cache_path(path, str(tmp_path))
+    assert file_digest(path) == hashlib.sha256(b"first release").hexdigest()
+
+    # Later calls take the stored digest rather than reading the file
+    key = (os.path.abspath(path), len(b"first release"), os.stat(path).st_mtime_ns)
+    file_digests[key] = "f" * 64
+    assert cache_path(path, str(tmp_path)) != first
+    assert file_digest(path) == "f" * 64
+
+    with open(path, "wb") as f:
+        f.write(b"second release, longer")
+    assert file_digest(path) == hashlib.sha256(b"second release, longer").hexdigest()
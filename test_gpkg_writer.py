@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import struct
+
+import numpy as np
+import pytest
+
+from gpkg_writer import (
+    GpkgWriter,
+    point_wkb,
+    polygon_wkb,
+    register_gpkg_functions,
+    ring_envelopes,
+)
+from hex_grid import HexGrid
+
+# Files written by GpkgWriter, read back with nothing but sqlite3
+
+fields = [("cell_id", "INTEGER"), ("capacity", "REAL"), ("name", "TEXT")]
+
+
+def cells():
+    grid = HexGrid(0.0, 0.0, 10000.0, 8000.0, spacing=1000.0)
+    ids = np.arange(1, 31)
+    rings = grid.cell_rings(ids)
+    rows = [(int(i), float(i) * 1.5, f"cell {i}") for i in ids]
+    return ids, rings, rows
+
+
+def blob_envelope(blob):
+    # A GeoPackage blob with an xy envelope: magic, version, flags, srs id
+    magic, _, flags, srs_id = struct.unpack_from("<2sBBi", blob)
+    assert magic == b"GP" and (flags >> 1) & 0b111 == 1
+    return srs_id, struct.unpack_from("<4d", blob, 8)
+
+
+def write_cells(path):
+    ids, rings, rows = cells()
+    with GpkgWriter(path) as writer:
+        writer.write_layer(
+            "cells",
+            fields,
+            rows,
+            (polygon_wkb(ring) for ring in rings),
+            geometry_type="POLYGON",
+            fids=ids.tolist(),
+            envelopes=ring_envelopes(rings),
+        )
+        writer.write_layer("plain", [("value", "REAL")], [(1.0,), (2.0,)])
+    return ids, rings, rows
+
+
+def test_round_trip(tmp_path):
+    path = os.path.join(tmp_path, "cells.gpkg")
+    ids, rings, rows = write_cells(path)
+
+    connection = sqlite3.connect(path)
+    assert connection.execute("PRAGMA application_id").fetchone()[0] == 0x47504B47
+    assert connection.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    contents = dict(
+        connection.execute("SELECT table_name, data_type FROM gpkg_contents")
+    )
+    assert contents == {"cells": "features", "plain": "attributes"}
+    assert connection.execute(
+        "SELECT column_name, geometry_type_name, srs_id FROM gpkg_geometry_columns"
+    ).fetchall() == [("geom", "POLYGON", 5070)]
+
+    written = connection.execute(
+        "SELECT fid, cell_id, capacity, name, geom FROM cells ORDER BY fid"
+    ).fetchall()
+    assert [row[0] for row in written] == ids.tolist()
+    assert [row[1:4] for row in written] == rows
+    envelopes = ring_envelopes(rings)
+    for (_, _, _, _, blob), ring, envelope in zip(written, rings, envelopes):
+        srs_id, blob_bounds = blob_envelope(blob)
+        assert srs_id == 5070
+        assert list(blob_bounds) == envelope
+        assert bytes(blob[40:]) == polygon_wkb(ring)
+
+    rtree = connection.execute(
+        "SELECT id, minx, maxx, miny, maxy FROM rtree_cells_geom ORDER BY id"
+    ).fetchall()
+    assert [row[0] for row in rtree] == ids.tolist()
+    # The R-tree stores 32-bit floats, rounded outwards
+    bounds = np.array([row[1:] for row in rtree])
+    assert (bounds[:, [0, 2]] <= np.array(envelopes)[:, [0, 2]]).all()
+    assert (bounds[:, [1, 3]] >= np.array(envelopes)[:, [1, 3]]).all()
+    assert np.allclose(bounds, envelopes, rtol=1e-6)
+    assert connection.execute("SELECT value FROM plain").fetchall() == [(1.0,), (2.0,)]
+    connection.close()
+
+
+def test_edits_through_other_connections(tmp_path):
+    path = os.path.join(tmp_path, "cells.gpkg")
+    write_cells(path)
+    blob = sqlite3.connect(path).execute("SELECT geom FROM cells").fetchone()[0]
+    insert = "INSERT INTO cells (fid, geom, cell_id) VALUES (100, ?, 100)"
+
+    # The R-tree triggers need the ST_ functions
+    connection = sqlite3.connect(path)
+    with pytest.raises(sqlite3.OperationalError, match="no such function"):
+        connection.execute(insert, (blob,))
+    connection.close()
+
+    connection = sqlite3.connect(path)
+    register_gpkg_functions(connection)
+    connection.execute(insert, (blob,))
+    connection.execute("DELETE FROM cells WHERE fid = 1")
+    connection.commit()
+    ids = [id for (id,) in connection.execute("SELECT id FROM rtree_cells_geom")]
+    assert 100 in ids and 1 not in ids
+    connection.close()
+
+
+def test_failed_write_keeps_the_file(tmp_path):
+    path = os.path.join(tmp_path, "cells.gpkg")
+    _, _, rows = write_cells(path)
+
+    def failing_rows():
+        yield (1.0,)
+        raise RuntimeError("stop")
+
+    with pytest.raises(RuntimeError):
+        with GpkgWriter(path) as writer:
+            writer.drop_layer("cells")
+            writer.write_layer(
+                "points",
+                [("value", "REAL")],
+                failing_rows(),
+                (point_wkb(0.0, 0.0) for _ in range(2)),
+                geometry_type="POINT",
+            )
+
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT count(*) FROM cells").fetchone()[0] == len(rows)
+    assert not connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'points'"
+    ).fetchone()
+    assert not os.path.exists(f"{path}-journal")
+    connection.close()
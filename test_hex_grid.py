@@ -0,0 +1,101 @@
+import numpy as np
+
+from hex_grid import HexGrid, conus_grid
+
+# HexGrid.cell_ids against brute force: which of the grid's own polygons
+# (cell_rings) holds each point
+
+
+def ring_sides(grid: HexGrid, x, y):
+    # Cross product of every hexagon edge with every point, shaped
+    # (points, cells, edges). Rings run clockwise, so a point is inside a
+    # cell where all six are negative and on its boundary where the largest
+    # is zero.
+    cells = np.arange(1, grid.columns * grid.rows + 1)
+    rings = grid.cell_rings(cells)
+    start, end = rings[:, :-1], rings[:, 1:]
+    edge = end - start
+    dx = x[:, None, None] - start[None, :, :, 0]
+    dy = y[:, None, None] - start[None, :, :, 1]
+    return edge[None, :, :, 0] * dy - edge[None, :, :, 1] * dx
+
+
+def containing_cells(grid: HexGrid, x, y, tolerance: float):
+    # For each point, the cells whose polygon holds it strictly inside, and
+    # the cells whose polygon touches it (within tolerance of an edge)
+    sides = ring_sides(grid, x, y).max(axis=2)
+    # Cross products scale with edge length
+    tolerance *= grid.spacing
+    return sides < -tolerance, sides <= tolerance
+
+
+def small_grid():
+    # Few enough cells to test every point against every cell, with an
+    # extent that isn't a whole number of cells either way
+    return HexGrid(1000.0, -2000.0, 3437.5, 113.0, spacing=250.0)
+
+
+def test_interior_points_match_point_in_polygon():
+    grid = small_grid()
+    rng = np.random.default_rng(0)
+    # Beyond the extent on every side, so off-grid points are covered too
+    x = rng.uniform(grid.xmin - 500, grid.xmax + 500, 20000)
+    y = rng.uniform(grid.ymin - 500, grid.ymax + 500, 20000)
+    inside, touching = containing_cells(grid, x, y, 1e-9)
+    # Leave out the few points too close to an edge to call
+    clear = inside.any(axis=1) | ~touching.any(axis=1)
+    x, y, inside = x[clear], y[clear], inside[clear]
+
+    assert (inside.sum(axis=1) <= 1).all()
+    expected = np.where(inside.any(axis=1), inside.argmax(axis=1) + 1, -1)
+    assert (grid.cell_ids(x, y) == expected).all()
+    assert (expected == -1).any() and (expected > 0).any()
+
+
+def test_edge_and_vertex_points_go_to_a_touching_cell():
+    grid = small_grid()
+    cells = np.arange(1, grid.columns * grid.rows + 1)
+    rings = grid.cell_rings(cells)
+    vertices = rings[:, :-1].reshape(-1, 2)
+    midpoints = ((rings[:, :-1] + rings[:, 1:]) / 2).reshape(-1, 2)
+    points = np.unique(np.concatenate((vertices, midpoints)), axis=0)
+    x, y = points[:, 0], points[:, 1]
+
+    _, touching = containing_cells(grid, x, y, 1e-9)
+    assigned = grid.cell_ids(x, y)
+    # Inside the grid where every point a hair away in any direction is in
+    # some cell; otherwise on the grid's outline. No direction runs along an
+    # edge.
+    angles = np.linspace(0, 2 * np.pi, 12, endpoint=False) + np.pi / 12
+    step = 1e-6 * grid.spacing
+    around_x = (x[:, None] + step * np.cos(angles)).ravel()
+    around_y = (y[:, None] + step * np.sin(angles)).ravel()
+    around, _ = containing_cells(grid, around_x, around_y, 0.0)
+    within = around.any(axis=1).reshape(len(x), -1).all(axis=1)
+
+    # Inside: one of the cells the point touches, never none
+    assert within.sum() > len(x) / 2
+    assert (assigned[within] > 0).all()
+    assert touching[within, assigned[within] - 1].all()
+    # On the outline: a cell there, or off the grid
+    on_grid = ~within & (assigned > 0)
+    assert touching[on_grid, assigned[on_grid] - 1].all()
+
+
+def test_points_off_the_grid():
+    x = np.array([conus_grid.xmin - 1e5, conus_grid.xmax + 1e5, 0.0, 0.0])
+    y = np.array([2e6, 2e6, conus_grid.ymin - 1e5, conus_grid.ymax + 1e5])
+    assert (conus_grid.cell_ids(x, y) == -1).all()
+
+
+def test_conus_cell_centers_and_vertices():
+    # Every cell's centre is its own, and a point just inside each vertex
+    # stays in the cell
+    cells = np.arange(1, conus_grid.columns * conus_grid.rows + 1)
+    cx, cy = conus_grid.cell_centers(*conus_grid.column_row(cells))
+    assert (conus_grid.cell_ids(cx, cy) == cells).all()
+
+    rings = conus_grid.cell_rings(cells)[:, :-1]
+    near = rings + 1e-3 * (np.stack((cx, cy), axis=-1)[:, None] - rings)
+    assigned = conus_grid.cell_ids(near[..., 0].ravel(), near[..., 1].ravel())
+    assert (assigned == np.repeat(cells, 6)).all()
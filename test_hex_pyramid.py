@@ -0,0 +1,47 @@
+import numpy as np
+
+from hex_binning import summarize_by_cell
+from hex_grid import HexGrid
+from hex_pyramid import summarize_pyramid
+
+# Every level of the pyramid against binning the points directly at that
+# level's spacing
+
+
+def test_pyramid_levels_match_direct_binning():
+    extent = (1000.0, -2000.0, 23437.5, 17113.0)
+    spacings = [250.0, 500.0, 750.0, 2000.0, 3100.0]
+    rng = np.random.default_rng(0)
+    # Points all over, and a band along each edge of the extent, where a
+    # coarse grid reaches past the finer ones
+    xmin, ymin, xmax, ymax = extent
+    x = np.concatenate(
+        (
+            rng.uniform(xmin - 2000, xmax + 4000, 20000),
+            rng.uniform(xmin, xmax + 4000, 5000),
+            rng.uniform(xmax - 500, xmax + 4000, 5000),
+        )
+    )
+    y = np.concatenate(
+        (
+            rng.uniform(ymin - 4000, ymax + 2000, 20000),
+            rng.uniform(ymin - 4000, ymin + 500, 5000),
+            rng.uniform(ymin, ymax, 5000),
+        )
+    )
+    groups = rng.integers(0, 4, len(x))
+    values = rng.integers(1, 100, len(x)).astype(np.float64)
+
+    pyramid = summarize_pyramid(x, y, groups, values, spacings, extent)
+    assert sorted(pyramid) == spacings
+    for spacing in spacings:
+        cells = HexGrid(*extent, spacing=spacing).cell_ids(x, y)
+        expected = summarize_by_cell(cells, groups, values)
+        assert sorted(pyramid[spacing]) == sorted(expected)
+        for group, summary in expected.items():
+            level = pyramid[spacing][group]
+            assert np.array_equal(level.cell_ids, summary.cell_ids)
+            assert np.array_equal(level.count, summary.count)
+            assert np.array_equal(level.minimum, summary.minimum)
+            assert np.array_equal(level.maximum, summary.maximum)
+            assert np.array_equal(level.total, summary.total)
@@ -0,0 +1,33 @@
+import os
+
+from generator_table import load_points
+from incremental import release_digest, save_snapshot, snapshot_fields
+from synthetic_860m import synthetic_generators
+
+# The snapshot incremental_update.py checks the outputs' recorded release
+# against
+
+
+def test_snapshot_keeps_the_release_digest(tmp_path):
+    points = synthetic_generators(2000, 0)
+    path = os.path.join(tmp_path, "snapshot.npz")
+    save_snapshot(path, points)
+    snapshot = load_points(path)
+
+    assert set(snapshot.columns) == set(snapshot_fields) & set(points.columns)
+    assert release_digest(snapshot) == release_digest(points)
+    assert not os.path.exists(f"{path}.partial")
+
+
+def test_release_digest_changes_with_the_release():
+    points = synthetic_generators(2000, 0)
+    digest = release_digest(points)
+    assert release_digest(synthetic_generators(2000, 1)) != digest
+
+    changed = points.take(slice(None))
+    changed.capacity = changed.capacity.copy()
+    changed.capacity[0] += 1
+    assert release_digest(changed) != digest
+    # Fields the snapshot doesn't keep don't count
+    del points.columns["County"]
+    assert release_digest(points) == digest
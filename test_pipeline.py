@@ -0,0 +1,112 @@
+import os
+import threading
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+# Which stages Pipeline.run builds, skips and overlaps
+
+
+def counting_stages(tmp_path, runs, **overrides):
+    # source -> derived, and an independent stage, each writing a file
+    def stage(name, **kwargs):
+        output = os.path.join(tmp_path, f"{name}.out")
+
+        def run():
+            runs.append(name)
+            with open(output, "w") as f:
+                f.write(name)
+
+        return Stage(name, run, outputs=[output], **kwargs)
+
+    source = os.path.join(tmp_path, "source.txt")
+    if not os.path.exists(source):
+        with open(source, "w") as f:
+            f.write("first")
+    return [
+        stage("source", files=[source], values=overrides.get("source", {})),
+        stage("derived", after=["source"]),
+        stage("other", values=overrides.get("other", {})),
+    ]
+
+
+def run_pipeline(tmp_path, runs, force=(), **overrides):
+    runs.clear()
+    manifest = os.path.join(tmp_path, "pipeline.json")
+    Pipeline(counting_stages(tmp_path, runs, **overrides), manifest).run(1, force)
+    return sorted(runs)
+
+
+def test_up_to_date_stages_are_skipped(tmp_path):
+    runs = []
+    assert run_pipeline(tmp_path, runs) == ["derived", "other", "source"]
+    assert run_pipeline(tmp_path, runs) == []
+    assert run_pipeline(tmp_path, runs, force=["other"]) == ["other"]
+
+
+def test_changes_rebuild_the_stage_and_everything_after_it(tmp_path):
+    runs = []
+    run_pipeline(tmp_path, runs)
+
+    with open(os.path.join(tmp_path, "source.txt"), "w") as f:
+        f.write("second")
+    assert run_pipeline(tmp_path, runs) == ["derived", "source"]
+
+    assert run_pipeline(tmp_path, runs, source={"spacing": 2}) == ["derived", "source"]
+    assert run_pipeline(tmp_path, runs, source={"spacing": 2}) == []
+    assert run_pipeline(tmp_path, runs, source={"spacing": 2}, other={"x": 1}) == [
+        "other"
+    ]
+
+    # A missing output makes its stage stale, but not the stages after it
+    os.remove(os.path.join(tmp_path, "source.out"))
+    assert run_pipeline(tmp_path, runs, source={"spacing": 2}, other={"x": 1}) == [
+        "source"
+    ]
+
+
+def test_failed_stages_stay_stale(tmp_path):
+    manifest = os.path.join(tmp_path, "pipeline.json")
+
+    def fail():
+        raise ValueError("no")
+
+    with pytest.raises(RuntimeError, match="Stage broken failed"):
+        Pipeline([Stage("broken", fail)], manifest).run(1)
+    ran = []
+    assert Pipeline([Stage("broken", lambda: ran.append(1))], manifest).run(1) == [
+        "broken"
+    ]
+
+
+def test_independent_stages_run_at_once(tmp_path):
+    # Each waits for the other to start, which only happens if they overlap
+    barrier = threading.Barrier(2, timeout=10)
+    stages = [Stage(name, barrier.wait) for name in ("a", "b")]
+    ran = Pipeline(stages, os.path.join(tmp_path, "pipeline.json")).run(2)
+    assert sorted(ran) == ["a", "b"]
+
+
+def test_stages_writing_one_file_take_turns(tmp_path):
+    shared = os.path.join(tmp_path, "shared.gpkg")
+    lock = threading.Lock()
+    running, overlaps = [], []
+
+    def stage(name):
+        def run():
+            with lock:
+                running.append(name)
+                overlaps.append(len(running))
+            threading.Event().wait(0.05)
+            with lock:
+                running.remove(name)
+            with open(shared, "a") as f:
+                f.write(name)
+
+        return Stage(name, run, outputs=[shared])
+
+    stages = [stage(name) for name in ("a", "b", "c")]
+    ran = Pipeline(stages, os.path.join(tmp_path, "pipeline.json")).run(3)
+    assert sorted(ran) == ["a", "b", "c"]
+    assert max(overlaps) == 1
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+
+from builds import build_temporal
+from centroid_groups import centroid_layers
+from generator_types import energy_source_code
+from hex_grid import conus_grid
+from synthetic_860m import synthetic_generators
+from temporal_query import cell_timeline, region_timeline
+from timeline import generator_months, out_of_service_status
+
+# Timeline queries against summing the generators timeline.generator_months
+# puts in each month directly
+
+origin_year, n_years = 2018, 10
+n_months = n_years * 12
+names = [generator.name for generator in energy_source_code]
+
+
+def active_capacity(points, keep, month):
+    included, _, start, end = generator_months(points, origin_year, n_months)
+    active = included & keep & (start <= month) & (month < end)
+    return points.capacity[active].sum()
+
+
+def test_region_queries_match_generator_months():
+    points = synthetic_generators(4000, 2)
+    timeline = region_timeline(points, "Plant State", names, origin_year, n_months)
+    states = points.text("Plant State")
+    rng = np.random.default_rng(0)
+    for state in rng.choice(np.unique(states), 5, replace=False).tolist():
+        for generator in range(len(names)):
+            key = (state, names[generator])
+            keep = (states == state) & (points.generator == generator)
+            levels = np.array(
+                [active_capacity(points, keep, month) for month in range(n_months)]
+            )
+            for month in rng.integers(0, n_months, 4).tolist():
+                date = timeline.date(month)
+                assert np.isclose(timeline.capacity_at(key, date), levels[month])
+            assert np.isclose(
+                timeline.capacity_months(key, "2019-03", (2023, 8)),
+                levels[14:68].sum(),
+            )
+            assert np.isclose(
+                timeline.change(key, "2019-03-15", "2024-01"),
+                levels[72] - levels[14],
+            )
+            (year, month), peak = timeline.peak(key, (2018, 6), (2025, 2))
+            first = int(np.argmax(levels[5:86])) + 5
+            assert (year, month) == timeline.date(first)
+            assert np.isclose(peak, levels[first])
+    # Before or after the timeline there's nothing
+    assert timeline.capacity_at(key, (2010, 1)) == 0.0
+
+
+def test_cell_queries_read_the_temporal_layer(tmp_path):
+    points = synthetic_generators(3000, 3)
+    path = os.path.join(tmp_path, "hex.gpkg")
+    years = (origin_year, origin_year + n_years - 1)
+    build_temporal(points, path, years, cube_path=None, normalized=True)
+    timeline = cell_timeline(path, origin_year, n_months)
+
+    cells = conus_grid.cell_ids(points.x, points.y)
+    rng = np.random.default_rng(1)
+    for cell, name in rng.permutation(timeline.keys)[:20].tolist():
+        keep = (cells == int(cell)) & (points.generator == names.index(name))
+        for month in rng.integers(0, n_months, 6).tolist():
+            assert np.isclose(
+                timeline.capacity_at((int(cell), name), timeline.date(month)),
+                active_capacity(points, keep, month),
+            )
+
+
+def test_monthly_centroids_share_the_timeline_months():
+    # Generators the timeline takes as they are (operating month given, not
+    # out of service) count in the same months for the monthly centroids,
+    # retirement month included
+    points = synthetic_generators(3000, 4)
+    included, _, _, _ = generator_months(points, origin_year, n_months)
+    out_of_service = points.status.codes == points.status.code_of(out_of_service_status)
+    points = points.take(np.flatnonzero(included & ~out_of_service))
+    layers = centroid_layers(points, origin_year, origin_year + n_years - 1)
+    rows = layers[1][2][0]
+    capacity = {
+        (energy, (year - origin_year) * 12 + month - 1): total
+        for energy, year, month, total, _, _, group_type, _ in rows
+        if group_type == "total"
+    }
+    for generator, name in enumerate(names):
+        keep = points.generator == generator
+        for month in range(n_months):
+            expected = active_capacity(points, keep, month)
+            assert np.isclose(capacity.get((name, month), 0.0), expected)
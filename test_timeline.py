@@ -0,0 +1,118 @@
+import numpy as np
+
+from timeline import (
+    active_totals,
+    active_totals_partitioned,
+    exclude_period,
+    step_intervals,
+)
+
+# The interval engines against loops over every row and period
+
+
+def random_intervals(n_rows: int, n_keys: int, n_periods: int, seed: int = 0):
+    # Keys, starts and ends that run off both ends of the periods, empty and
+    # backwards intervals, rows with no key (-1), and whole-number weights so
+    # the sums are exact
+    rng = np.random.default_rng(seed)
+    keys = rng.integers(-1, n_keys, n_rows)
+    start = rng.integers(-3, n_periods + 3, n_rows)
+    end = start + rng.integers(-2, n_periods, n_rows)
+    weights = rng.integers(1, 50, n_rows).astype(np.float64)
+    return keys, start, end, weights
+
+
+def looped_totals(keys, start, end, n_keys, n_periods, weights):
+    totals = np.zeros((n_keys, n_periods))
+    for key, first, last, weight in zip(keys, start, end, weights):
+        if key < 0:
+            continue
+        for period in range(max(first, 0), min(last, n_periods)):
+            totals[key, period] += weight
+    return totals
+
+
+def looped_steps(keys, start, end, n_keys, n_periods, weights):
+    # Every interval's clipped start and end bounds a step of its key
+    steps = []
+    for key in range(n_keys):
+        rows = [
+            (min(max(first, 0), n_periods), min(max(last, 0), n_periods), weight)
+            for k, first, last, weight in zip(keys, start, end, weights)
+            if k == key and min(max(last, 0), n_periods) > max(first, 0)
+        ]
+        events = sorted({bound for first, last, _ in rows for bound in (first, last)})
+        for low, high in zip(events, events[1:]):
+            open_rows = [weight for first, last, weight in rows if first <= low < last]
+            if open_rows and low < n_periods and sum(open_rows) > 0:
+                steps.append((key, low, high, sum(open_rows)))
+    return steps
+
+
+def test_active_totals_match_a_loop():
+    n_keys, n_periods = 7, 30
+    keys, start, end, weights = random_intervals(500, n_keys, n_periods)
+    totals = active_totals(keys, start, end, n_keys, n_periods, [weights, 2 * weights])
+    expected = looped_totals(keys, start, end, n_keys, n_periods, weights)
+    assert totals.shape == (2, n_keys, n_periods)
+    assert np.array_equal(totals[0], expected)
+    assert np.array_equal(totals[1], 2 * expected)
+
+
+def test_active_totals_partitioned_match_unpartitioned():
+    n_keys, n_periods = 23, 12
+    keys, start, end, weights = random_intervals(2000, n_keys, n_periods, seed=1)
+    whole = active_totals(keys, start, end, n_keys, n_periods, [weights])
+    for block_size in (1, 5, 23, 100):
+        blocks = active_totals_partitioned(
+            keys, start, end, n_keys, n_periods, [weights], block_size, workers=1
+        )
+        assert np.array_equal(blocks, whole)
+
+
+def test_exclude_period_cuts_only_the_flagged_intervals():
+    n_periods = 24
+    keys, start, end, weights = random_intervals(300, 1, n_periods, seed=2)
+    excluded = np.random.default_rng(2).random(len(start)) < 0.5
+    rows, piece_start, piece_end = exclude_period(start, end, excluded, 10, 13)
+
+    rows_totals = looped_totals(
+        np.zeros(len(rows), dtype=np.int64),
+        piece_start,
+        piece_end,
+        1,
+        n_periods,
+        weights[rows],
+    )[0]
+    kept_totals = looped_totals(
+        np.where(excluded, -1, 0), start, end, 1, n_periods, weights
+    )[0]
+    flagged_totals = looped_totals(
+        np.where(excluded, 0, -1), start, end, 1, n_periods, weights
+    )[0]
+    flagged_totals[10:13] = 0
+    assert np.array_equal(rows_totals, kept_totals + flagged_totals)
+
+
+def test_step_intervals_match_a_loop():
+    n_keys, n_periods = 9, 40
+    keys, start, end, weights = random_intervals(400, n_keys, n_periods, seed=3)
+    steps = step_intervals(keys.clip(0), start, end, n_keys, n_periods, weights)
+    expected = looped_steps(keys.clip(0), start, end, n_keys, n_periods, weights)
+    assert list(zip(*(column.tolist() for column in steps))) == expected
+
+
+def test_step_intervals_known_case():
+    # Key 0: 5 MW over [2, 6) and 3 MW over [4, 8); key 1: one interval that
+    # retires before it opens, and one running past the last period
+    keys = np.array([0, 0, 1, 1])
+    start = np.array([2, 4, 5, 7])
+    end = np.array([6, 8, 3, 20])
+    weights = np.array([5.0, 3.0, 9.0, 2.0])
+    steps = step_intervals(keys, start, end, 2, 10, weights)
+    assert [column.tolist() for column in steps] == [
+        [0, 0, 0, 1],
+        [2, 4, 6, 7],
+        [4, 6, 8, 10],
+        [5.0, 8.0, 3.0, 2.0],
+    ]
@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+
+from generator_table import GeneratorPoints
+from group_by import Categorical
+from hex_grid import HexGrid
+from validation import (
+    FAR_FROM_CELL,
+    MISSING_CAPACITY,
+    OUT_OF_RANGE,
+    OUTSIDE_GRID,
+    OUTSIDE_STATE,
+    UNKNOWN_STATE,
+    PolygonIndex,
+    validate_points,
+)
+
+# PolygonIndex against shapes whose insides and edges are known exactly,
+# and each of validate_points' reasons
+
+
+def square(x0, y0, x1, y1):
+    return np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)], dtype=float)
+
+
+def circle(cx, cy, radius, n=400):
+    angles = np.linspace(0, 2 * np.pi, n + 1)
+    return np.stack((cx + radius * np.cos(angles), cy + radius * np.sin(angles)), 1)
+
+
+def shapes():
+    # A square with a square hole, two squares apart, and a circle with
+    # enough edges to be filed into many bands
+    return PolygonIndex.from_rings(
+        ["holed", "pair", "round"],
+        [
+            [square(0, 0, 10, 10), square(3, 3, 7, 7)],
+            [square(20, 0, 24, 4), square(26, 6, 30, 10)],
+            [circle(50, 50, 10)],
+        ],
+    )
+
+
+def expected_inside(label, x, y):
+    def in_box(x0, y0, x1, y1):
+        return (x > x0) & (x < x1) & (y > y0) & (y < y1)
+
+    if label == 0:
+        return in_box(0, 0, 10, 10) & ~in_box(3, 3, 7, 7)
+    if label == 1:
+        return in_box(20, 0, 24, 4) | in_box(26, 6, 30, 10)
+    return np.hypot(x - 50, y - 50) < 10
+
+
+def clear_of_edges(index, label, x, y):
+    # The circle's chords sit up to r(1 - cos(pi / n)) inside its radius
+    return index.distance(np.full(len(x), label), x, y) > 0.01
+
+
+def test_contains_matches_the_shapes():
+    index = shapes()
+    rng = np.random.default_rng(0)
+    for label, (x0, y0, x1, y1) in enumerate(
+        [(-2, -2, 12, 12), (18, -2, 32, 12), (38, 38, 62, 62)]
+    ):
+        x = rng.uniform(x0, x1, 5000)
+        y = rng.uniform(y0, y1, 5000)
+        keep = clear_of_edges(index, label, x, y)
+        x, y = x[keep], y[keep]
+        inside = index.contains(np.full(len(x), label), x, y)
+        assert np.array_equal(inside, expected_inside(label, x, y))
+        assert inside.any() and not inside.all()
+    # Points without a polygon are never inside
+    assert not index.contains(np.array([-1]), np.array([5.0]), np.array([1.0])).any()
+
+
+def test_distance_to_the_nearest_edge():
+    index = shapes()
+    x = np.array([5.0, 5.0, -3.0, 25.0, 50.0])
+    y = np.array([1.0, 5.0, 5.0, 5.0, 50.0])
+    labels = np.array([0, 0, 0, 1, 2])
+    distance = index.distance(labels, x, y)
+    assert np.allclose(distance[:4], [1.0, 2.0, 3.0, np.sqrt(2)])
+    assert abs(distance[4] - 10) < 0.01
+    assert np.isinf(index.distance(np.array([-1]), x[:1], y[:1])).all()
+
+
+def test_save_and_load(tmp_path):
+    index = shapes()
+    path = os.path.join(tmp_path, "states.npz")
+    index.save(path)
+    loaded = PolygonIndex.load(path)
+    assert loaded.labels.tolist() == index.labels.tolist()
+    assert np.array_equal(
+        loaded.label_index(np.array(["round", "x", "holed"])), [2, -1, 0]
+    )
+    x = np.random.default_rng(1).uniform(-2, 62, 2000)
+    y = np.random.default_rng(2).uniform(-2, 62, 2000)
+    for label in range(3):
+        labels = np.full(len(x), label)
+        assert np.array_equal(
+            loaded.contains(labels, x, y), index.contains(labels, x, y)
+        )
+
+
+def generator_points(x, y, states, capacity, latitude=None):
+    columns = {"Plant State": Categorical.from_values(states)}
+    if latitude is not None:
+        columns["Latitude"] = np.asarray(latitude, dtype=float)
+        columns["Longitude"] = np.zeros(len(x))
+    return GeneratorPoints(
+        x=np.asarray(x, dtype=float),
+        y=np.asarray(y, dtype=float),
+        capacity=np.asarray(capacity, dtype=float),
+        status=Categorical.from_values([""] * len(x)),
+        generator=np.zeros(len(x), dtype=np.int64),
+        columns=columns,
+    )
+
+
+def test_every_reason():
+    grid = HexGrid(-5.0, -5.0, 65.0, 65.0, spacing=4.0)
+    index = shapes()
+    points = generator_points(
+        x=[5.0, 11.0, 40.0, 5.0, 5.0, 5.0, np.nan, 100.0, 50.0],
+        y=[1.0, 5.0, 40.0, 5.0, 1.0, 1.0, 1.0, 1.0, 50.0],
+        states=["holed", "holed", "round", "holed", "nowhere", "", "holed", "", ""],
+        capacity=[1, 1, 1, 1, 1, np.nan, 1, 1, 1],
+        latitude=[40, 40, 40, 40, 40, 40, 40, 40, 95],
+    )
+    reasons = validate_points(points, grid, index, state_tolerance=1.5)
+    assert reasons.tolist() == [
+        0,
+        # 1 outside, within the tolerance
+        0,
+        OUTSIDE_STATE,
+        # In the hole
+        OUTSIDE_STATE,
+        UNKNOWN_STATE,
+        MISSING_CAPACITY,
+        OUT_OF_RANGE,
+        OUTSIDE_GRID,
+        OUT_OF_RANGE,
+    ]
+    # No state polygons, no state check
+    assert validate_points(points, grid)[1:4].tolist() == [0, 0, 0]
+
+
+def test_far_from_cell():
+    grid = HexGrid(-5.0, -5.0, 65.0, 65.0, spacing=4.0)
+    rng = np.random.default_rng(3)
+    x, y = rng.uniform(-5, 65, 2000), rng.uniform(-5, 65, 2000)
+    points = generator_points(x, y, [""] * len(x), np.ones(len(x)))
+    # Every point on the grid is within the circumradius of its cell
+    assert not (validate_points(points, grid) & FAR_FROM_CELL).any()
+
+    threshold = 0.3 * grid.spacing
+    cells = grid.cell_ids(x, y)
+    cx, cy = grid.cell_centers(*grid.column_row(cells))
+    far = (cells > 0) & (np.hypot(x - cx, y - cy) > threshold)
+    reasons = validate_points(points, grid, max_cell_distance=threshold)
+    assert np.array_equal(reasons & FAR_FROM_CELL > 0, far) and far.any()
+
+    # A grid that bins points into the wrong cell fails it
+    class ShiftedGrid(HexGrid):
+        def cell_ids(self, x, y):
+            ids = super().cell_ids(x, y)
+            return np.where(ids > 1, ids - 1, ids)
+
+    shifted = ShiftedGrid(-5.0, -5.0, 65.0, 65.0, spacing=4.0)
+    assert (validate_points(points, shifted) & FAR_FROM_CELL).mean() > 0.9
@@ -0,0 +1,286 @@
+from typing import Sequence
+
+import numpy as np
+
+from group_by import group_sums
+from parallel import WORKERS, map_partitions
+
+
+def coalesce(*columns: np.ndarray) -> np.ndarray:
+    result = np.array(columns[0], dtype=np.float64)
+    for column in columns[1:]:
+        result = np.where(np.isnan(result), column, result)
+    return result
+
+
+def month_index(year: np.ndarray, month: np.ndarray, origin_year: int) -> np.ndarray:
+    # Months since January of origin_year, NaN where either part is missing
+    return (np.asarray(year) - origin_year) * 12 + np.asarray(month) - 1
+
+
+def active_totals(
+    group_ids: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    n_groups: int,
+    n_periods: int,
+    weights: Sequence[np.ndarray],
+) -> np.ndarray:
+    # Sum of each weight over the rows active in every period, per group.
+    # A row is active from period `start` up to but not including `end`, so
+    # it only touches the delta array twice and a cumulative sum along the
+    # period axis recovers every period at once. Returns an array shaped
+    # (len(weights), n_groups, n_periods).
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    start = np.clip(np.asarray(start, dtype=np.int64), 0, n_periods)
+    end = np.clip(np.asarray(end, dtype=np.int64), 0, n_periods)
+
+    active = (group_ids >= 0) & (end > start)
+    group_ids, start, end = group_ids[active], start[active], end[active]
+
+    # Flatten (group, period) so every weight is two bincounts
+    slots = n_periods + 1
+    deltas = group_sums(
+        np.concatenate((group_ids * slots + start, group_ids * slots + end)),
+        n_groups * slots,
+        [
+            np.concatenate((weight[active], -weight[active]))
+            for weight in (np.asarray(w, dtype=np.float64) for w in weights)
+        ],
+    ).reshape(len(weights), n_groups, slots)
+
+    return np.cumsum(deltas, axis=2)[:, :, :n_periods]
+
+
+def _active_totals_block(arrays, block) -> np.ndarray:
+    low, high, n_periods = block
+    group_ids = arrays["group_ids"]
+    keep = (group_ids >= low) & (group_ids < high)
+    return active_totals(
+        group_ids[keep] - low,
+        arrays["start"][keep],
+        arrays["end"][keep],
+        high - low,
+        n_periods,
+        arrays["weights"][:, keep],
+    )
+
+
+def active_totals_partitioned(
+    group_ids: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    n_groups: int,
+    n_periods: int,
+    weights: Sequence[np.ndarray],
+    block_size: int,
+    workers: int = WORKERS,
+) -> np.ndarray:
+    # active_totals over blocks of block_size groups at a time, possibly in
+    # parallel, stitched back together along the group axis. Each group's
+    # totals come from the same rows in the same order either way.
+    blocks = [
+        (low, min(low + block_size, n_groups), n_periods)
+        for low in range(0, n_groups, block_size)
+    ]
+    return np.concatenate(
+        map_partitions(
+            _active_totals_block,
+            {
+                "group_ids": np.asarray(group_ids, dtype=np.int64),
+                "start": np.asarray(start, dtype=np.float64),
+                "end": np.asarray(end, dtype=np.float64),
+                "weights": np.array(weights, dtype=np.float64).reshape(
+                    len(weights), len(group_ids)
+                ),
+            },
+            blocks,
+            workers,
+        ),
+        axis=1,
+    )
+
+
+def exclude_period(
+    start: np.ndarray,
+    end: np.ndarray,
+    excluded: np.ndarray,
+    period_start: int,
+    period_end: int,
+):
+    # Cut [period_start, period_end) out of the intervals flagged in
+    # `excluded`. Returns the index of the interval each piece came from,
+    # plus the pieces' starts and ends.
+    index = np.arange(len(start))
+    kept, split = index[~excluded], index[excluded]
+    return (
+        np.concatenate((kept, split, split)),
+        np.concatenate(
+            (start[kept], start[split], np.maximum(start[split], period_end))
+        ),
+        np.concatenate((end[kept], np.minimum(end[split], period_start), end[split])),
+    )
+
+
+def step_intervals(
+    keys: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    n_keys: int,
+    n_periods: int,
+    weights: np.ndarray,
+):
+    # Merge each key's [start, end) intervals into steps of constant total
+    # weight. Every interval start or end opens a new step, and only steps
+    # with a positive total inside [0, n_periods) are kept. Returns the key,
+    # start, end (exclusive) and total of every step, ordered by key then
+    # start.
+    keys = np.asarray(keys, dtype=np.int64)
+    start = np.clip(np.asarray(start, dtype=np.int64), 0, n_periods)
+    end = np.clip(np.asarray(end, dtype=np.int64), 0, n_periods)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    # An interval ending before it starts (retired before it opened) holds
+    # nothing, as in active_totals, rather than cutting into the others
+    active = end > start
+    keys, start, end, weights = (
+        keys[active],
+        start[active],
+        end[active],
+        weights[active],
+    )
+
+    slots = n_periods + 1
+    flat = np.concatenate((keys * slots + start, keys * slots + end))
+    deltas = np.bincount(
+        flat, weights=np.concatenate((weights, -weights)), minlength=n_keys * slots
+    )
+    levels = np.cumsum(deltas.reshape(n_keys, slots), axis=1).reshape(-1)
+    # How many intervals are open at each slot; rounding in the running sums
+    # can leave dust where a key has emptied
+    open_counts = np.cumsum(
+        np.bincount(
+            flat,
+            weights=np.repeat([1.0, -1.0], len(keys)),
+            minlength=n_keys * slots,
+        ).reshape(n_keys, slots),
+        axis=1,
+    ).reshape(-1)
+
+    # Consecutive event slots of the same key bound a step
+    events = np.flatnonzero(np.bincount(flat, minlength=n_keys * slots))
+    event_keys, event_slots = np.divmod(events, slots)
+    same_key = event_keys[1:] == event_keys[:-1]
+    step_keys = event_keys[:-1][same_key]
+    step_start = event_slots[:-1][same_key]
+    step_end = event_slots[1:][same_key]
+    step_total = levels[events[:-1][same_key]]
+    step_open = open_counts[events[:-1][same_key]]
+
+    keep = (step_start < n_periods) & (np.rint(step_open) > 0) & (step_total > 0)
+    return step_keys[keep], step_start[keep], step_end[keep], step_total[keep]
+
+
+# Operating and retirement dates of a generator, actual then planned
+date_fields = [
+    "Operating Year",
+    "Operating Month",
+    "Planned Operation Year",
+    "Planned Operation Month",
+    "Retirement Year",
+    "Retirement Month",
+    "Planned Retirement Year",
+    "Planned Retirement Month",
+]
+out_of_service_status = (
+    "(OS) Out of service and NOT expected to return to service in next calendar year"
+)
+# Out of service generators are left out of the timeline from this
+# operating year on, and out of this year's centroids
+out_of_service_year = 2025
+
+
+def retirement_end(points, origin_year: int) -> np.ndarray:
+    # Month index after each generator's (planned) retirement month, NaN where
+    # it has no retirement date. A generator still runs in the month it
+    # retires, so this is the exclusive end of its months for the timeline and
+    # the monthly centroids alike.
+    retire_year = coalesce(
+        points.numeric("Retirement Year"), points.numeric("Planned Retirement Year")
+    )
+    retire_month = coalesce(
+        points.numeric("Retirement Month"), points.numeric("Planned Retirement Month")
+    )
+    with np.errstate(invalid="ignore"):
+        retires = (retire_year > 0) & (retire_month > 0)
+    return np.where(
+        retires, month_index(retire_year, retire_month, origin_year) + 1, np.nan
+    )
+
+
+def generator_months(points, origin_year: int, n_months: int):
+    # Month index each generator starts operating, and the month after it
+    # retires (n_months if it doesn't). Also which generators belong on the
+    # timeline at all (typed, and not out of service from out_of_service_year
+    # on), and which of those lack an operating date.
+    op_year = coalesce(
+        points.numeric("Operating Year"), points.numeric("Planned Operation Year")
+    )
+    op_month = coalesce(
+        points.numeric("Operating Month"), points.numeric("Planned Operation Month")
+    )
+    out_of_service = points.status.codes == points.status.code_of(out_of_service_status)
+
+    included = (points.generator >= 0) & ~(
+        (op_year >= out_of_service_year) & out_of_service
+    )
+    missing = included & (np.isnan(op_year) | np.isnan(op_month))
+
+    start = month_index(op_year, op_month, origin_year)
+    end = retirement_end(points, origin_year)
+    end = np.where(np.isnan(end), n_months, end)
+    return included & ~missing, missing, start, end
+
+
+def cell_source_steps(cell_ids, generator, start, end, capacity, n_months: int):
+    # step_intervals with one delta row per occupied (cell, generator type)
+    # pair, summed over all months at once. Returns each step's cell, type,
+    # start, end (exclusive) and capacity.
+    pairs, key = np.unique(
+        np.stack((cell_ids, generator), axis=1), axis=0, return_inverse=True
+    )
+    step_key, step_start, step_end, capacity = step_intervals(
+        key.reshape(-1), start, end, len(pairs), n_months, capacity
+    )
+    return pairs[step_key, 0], pairs[step_key, 1], step_start, step_end, capacity
+
+
+temporal_layer_name = "generator_capacity_temporal"
+temporal_fields = [
+    ("cell_id", "INTEGER"),
+    ("start_date", "DATE"),
+    ("end_date", "DATE"),
+    ("energy_source", "TEXT"),
+    ("capacity_mw", "REAL"),
+]
+
+
+def month_date(month: np.ndarray, origin_year: int):
+    # "yyyy-MM-01" for each month index counted from January of origin_year
+    year, month = np.divmod(np.asarray(month, dtype=np.int64), 12)
+    return [
+        f"{origin_year + y:04d}-{m + 1:02d}-01"
+        for y, m in zip(year.tolist(), month.tolist())
+    ]
+
+
+def interval_rows(cells, sources, start, end, capacity, origin_year: int):
+    # temporal_fields rows for steps from cell_source_steps; end dates are
+    # the last month a step covers
+    return zip(
+        np.asarray(cells).tolist(),
+        month_date(start, origin_year),
+        month_date(np.asarray(end) - 1, origin_year),
+        list(sources),
+        np.asarray(capacity).tolist(),
+    )
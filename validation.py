@@ -0,0 +1,349 @@
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from generator_table import GeneratorPoints
+from gpkg_writer import GpkgWriter, point_wkb
+from hex_grid import HexGrid, conus_grid
+from instrumentation import traced
+
+# Checks every generator's coordinates before anything is binned. Each check
+# sets a bit in the row's reason code; rows with any bit set are quarantined
+# rather than binned into whatever cell happens to be nearest.
+
+OUT_OF_RANGE = 1
+UNKNOWN_STATE = 2
+OUTSIDE_STATE = 4
+OUTSIDE_GRID = 8
+MISSING_CAPACITY = 16
+FAR_FROM_CELL = 32
+reason_names = {
+    OUT_OF_RANGE: "coordinates out of range",
+    UNKNOWN_STATE: "unknown Plant State",
+    OUTSIDE_STATE: "outside Plant State",
+    OUTSIDE_GRID: "outside the hex grid",
+    MISSING_CAPACITY: "no nameplate capacity",
+    FAR_FROM_CELL: "too far from its hex cell",
+}
+
+QUARANTINE_GPKG = "../quarantine.gpkg"
+
+# Points tested against polygon edges per chunk, to bound memory
+CHUNK_CELLS = 1 << 22
+
+
+@dataclass
+class PolygonIndex:
+    # Every ring edge of every labelled (multi)polygon, grouped by label,
+    # with each label's bounding box for a quick reject
+    labels: np.ndarray
+    # (n_edges, 4) x0, y0, x1, y1; label i owns edges[offsets[i]:offsets[i + 1]]
+    edges: np.ndarray
+    offsets: np.ndarray
+    # (n_labels, 4) xmin, ymin, xmax, ymax
+    bounds: np.ndarray
+
+    def __post_init__(self):
+        # Each label's edges are also filed into horizontal bands, by every
+        # band their y range touches. A ray cast from a point only crosses
+        # edges spanning its y, which all sit in the point's band.
+        self.bands, band_edges, band_keys = [], [], []
+        first_band = 0
+        for label in range(len(self.labels)):
+            edges = self.edges[self.offsets[label] : self.offsets[label + 1]]
+            ymin, ymax = self.bounds[label, 1], self.bounds[label, 3]
+            n_bands = max(1, int(np.sqrt(len(edges))))
+            height = (ymax - ymin) / n_bands if ymax > ymin else 1.0
+            low = np.minimum(edges[:, 1], edges[:, 3])
+            high = np.maximum(edges[:, 1], edges[:, 3])
+            lo = np.clip(((low - ymin) // height).astype(np.int64), 0, n_bands - 1)
+            hi = np.clip(((high - ymin) // height).astype(np.int64), 0, n_bands - 1)
+            spans = hi - lo + 1
+            edge = np.repeat(np.arange(len(edges)), spans)
+            band = np.repeat(lo - np.cumsum(spans) + spans, spans) + np.arange(
+                spans.sum()
+            )
+            band_edges.append(edges[edge])
+            band_keys.append(first_band + band)
+            self.bands.append((first_band, n_bands, ymin, height))
+            first_band += n_bands
+        keys = np.concatenate(band_keys) if band_keys else np.empty(0, np.int64)
+        order = np.argsort(keys, kind="stable")
+        self.band_edges = (
+            np.concatenate(band_edges)[order] if band_edges else np.empty((0, 4))
+        )
+        self.band_offsets = np.searchsorted(keys[order], np.arange(first_band + 1))
+
+    @classmethod
+    def from_rings(
+        cls, labels: Sequence[str], rings: Sequence[List[np.ndarray]]
+    ) -> "PolygonIndex":
+        # rings[i] holds every (n, 2) ring, exterior or hole, of labels[i]
+        edges, offsets, bounds = [], [0], []
+        for label_rings in rings:
+            label_edges = [
+                np.concatenate((ring[:-1], ring[1:]), axis=1)
+                for ring in (np.asarray(ring, dtype=np.float64) for ring in label_rings)
+                if len(ring) > 1
+            ]
+            label_edges = (
+                np.concatenate(label_edges) if label_edges else np.empty((0, 4))
+            )
+            edges.append(label_edges)
+            offsets.append(offsets[-1] + len(label_edges))
+            if len(label_edges):
+                points = label_edges[:, :2]
+                bounds.append((*points.min(axis=0), *points.max(axis=0)))
+            else:
+                bounds.append((np.inf, np.inf, -np.inf, -np.inf))
+        return cls(
+            labels=np.asarray(labels, dtype=object),
+            edges=np.concatenate(edges) if edges else np.empty((0, 4)),
+            offsets=np.array(offsets, dtype=np.int64),
+            bounds=np.array(bounds, dtype=np.float64).reshape(-1, 4),
+        )
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                labels=self.labels.astype(str),
+                edges=self.edges,
+                offsets=self.offsets,
+                bounds=self.bounds,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "PolygonIndex":
+        with np.load(path) as arrays:
+            return cls(
+                labels=arrays["labels"].astype(object),
+                edges=arrays["edges"],
+                offsets=arrays["offsets"],
+                bounds=arrays["bounds"],
+            )
+
+    def label_index(self, labels: np.ndarray) -> np.ndarray:
+        # Position of each label in the index, -1 where it has no polygon
+        lookup = {label: i for i, label in enumerate(self.labels.tolist())}
+        return np.array(
+            [lookup.get(label, -1) for label in np.asarray(labels).tolist()],
+            dtype=np.int64,
+        )
+
+    def _label_chunks(self, label_index):
+        # (label, rows, edges) of each label's points, chunked so rows x edges
+        # stays under CHUNK_CELLS
+        for label in np.unique(label_index[label_index >= 0]).tolist():
+            rows = np.flatnonzero(label_index == label)
+            edges = self.edges[self.offsets[label] : self.offsets[label + 1]]
+            step = max(1, CHUNK_CELLS // max(len(edges), 1))
+            for first in range(0, len(rows), step):
+                yield label, rows[first : first + step], edges
+
+    def contains(self, label_index, x, y) -> np.ndarray:
+        # Whether each point is inside the polygon of its label (even-odd
+        # rule, so holes and multipolygons come out right)
+        label_index = np.asarray(label_index)
+        inside = np.zeros(len(x), dtype=bool)
+        band = np.full(len(x), -1, dtype=np.int64)
+        for label in np.unique(label_index[label_index >= 0]).tolist():
+            rows = np.flatnonzero(label_index == label)
+            xmin, ymin, xmax, ymax = self.bounds[label]
+            px, py = x[rows], y[rows]
+            in_box = (px >= xmin) & (px <= xmax) & (py >= ymin) & (py <= ymax)
+            first_band, n_bands, band_ymin, height = self.bands[label]
+            band[rows[in_box]] = first_band + np.clip(
+                ((py[in_box] - band_ymin) // height).astype(np.int64), 0, n_bands - 1
+            )
+        order = np.argsort(band, kind="stable")
+        bands, starts = np.unique(band[order], return_index=True)
+        for band_id, rows in zip(bands.tolist(), np.split(order, starts[1:])):
+            if band_id < 0:
+                continue
+            edges = self.band_edges[
+                self.band_offsets[band_id] : self.band_offsets[band_id + 1]
+            ]
+            px, py = x[rows, None], y[rows, None]
+            x0, y0, x1, y1 = edges.T
+            straddles = (y0 > py) != (y1 > py)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                crossing_x = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+            crossings = np.count_nonzero(straddles & (px < crossing_x), axis=1)
+            inside[rows] = crossings % 2 == 1
+        return inside
+
+    def distance(self, label_index, x, y) -> np.ndarray:
+        # Distance from each point to the nearest edge of its label's
+        # polygon, inf where the label has none
+        distance = np.full(len(x), np.inf)
+        for _, rows, edges in self._label_chunks(np.asarray(label_index)):
+            px, py = x[rows, None], y[rows, None]
+            x0, y0, x1, y1 = edges.T
+            dx, dy = x1 - x0, y1 - y0
+            length2 = dx**2 + dy**2
+            with np.errstate(invalid="ignore", divide="ignore"):
+                t = np.clip(((px - x0) * dx + (py - y0) * dy) / length2, 0, 1)
+            t = np.where(length2 > 0, t, 0)
+            distance[rows] = np.sqrt(
+                (px - x0 - t * dx) ** 2 + (py - y0 - t * dy) ** 2
+            ).min(axis=1)
+        return distance
+
+
+def validate_points(
+    points: GeneratorPoints,
+    grid: HexGrid,
+    state_index: Optional[PolygonIndex] = None,
+    state_field: str = "Plant State",
+    state_tolerance: float = 5000,
+    max_cell_distance: Optional[float] = None,
+) -> np.ndarray:
+    # Reason code of every row, 0 for rows that pass. Points may sit up to
+    # state_tolerance metres outside their state (coastal and border plants
+    # against generalized outlines), and no further than max_cell_distance
+    # from the centre of the cell they're binned into. That defaults to the
+    # hexagon's circumradius, the furthest any point inside it can be, so a
+    # point only fails it if grid.cell_ids put it in the wrong cell.
+    reasons = np.zeros(len(points), dtype=np.uint8)
+    x, y = points.x, points.y
+
+    finite = np.isfinite(x) & np.isfinite(y)
+    if "Latitude" in points.columns and "Longitude" in points.columns:
+        latitude, longitude = points.numeric("Latitude"), points.numeric("Longitude")
+        finite &= (np.abs(latitude) <= 90) & (np.abs(longitude) <= 180)
+    reasons[~finite] |= OUT_OF_RANGE
+
+    if state_index is not None and state_field in points.columns:
+        states = points.categorical(state_field)
+        # Labels are few, so look them up once and spread them over the rows
+        label_index = np.where(
+            finite, state_index.label_index(states.labels)[states.codes], -1
+        )
+        unknown = finite & (label_index < 0) & (states.decode() != "")
+        reasons[unknown] |= UNKNOWN_STATE
+        outside = (label_index >= 0) & ~state_index.contains(label_index, x, y)
+        if outside.any():
+            # Only the misses need the (slower) distance to the boundary
+            near = np.zeros(len(points), dtype=bool)
+            rows = np.flatnonzero(outside)
+            near[rows] = (
+                state_index.distance(label_index[rows], x[rows], y[rows])
+                <= state_tolerance
+            )
+            reasons[outside & ~near] |= OUTSIDE_STATE
+
+    cell_ids = np.where(finite, grid.cell_ids(np.nan_to_num(x), np.nan_to_num(y)), -1)
+    reasons[finite & (cell_ids < 0)] |= OUTSIDE_GRID
+    assigned = cell_ids >= 0
+    cx, cy = grid.cell_centers(*grid.column_row(np.where(assigned, cell_ids, 1)))
+    if max_cell_distance is None:
+        max_cell_distance = grid.x_vertex_hi
+    far = np.hypot(x - cx, y - cy) > max_cell_distance * (1 + 1e-9)
+    reasons[assigned & far] |= FAR_FROM_CELL
+    # Workbook rows with no capacity were always left out of the outputs
+    # (tidy-data.Rmd filters them, as the workbook reader once did), so this
+    # only names them. A layer read counts an empty capacity as 0 MW and
+    # never has NaN here.
+    reasons[np.isnan(points.capacity)] |= MISSING_CAPACITY
+    return reasons
+
+
+def reason_text(reasons: np.ndarray) -> List[str]:
+    # "; "-joined reason names of each code
+    return [
+        "; ".join(name for bit, name in reason_names.items() if code & bit)
+        for code in np.asarray(reasons).tolist()
+    ]
+
+
+quarantine_fields = [
+    ("plant_id", "INTEGER"),
+    ("generator_id", "TEXT"),
+    ("plant_name", "TEXT"),
+    ("plant_state", "TEXT"),
+    ("latitude", "REAL"),
+    ("longitude", "REAL"),
+    ("capacity_mw", "REAL"),
+    ("reasons", "TEXT"),
+]
+
+
+def quarantine_rows(points: GeneratorPoints, reasons: np.ndarray):
+    # Attribute rows, point geometries (where the coordinates allow one) and
+    # their envelopes of the rows that failed, in quarantine_fields order
+    rows = np.flatnonzero(reasons)
+
+    def column(name, numeric=False):
+        if name not in points.columns:
+            return [None] * len(rows)
+        if numeric:
+            values = points.numeric(name)[rows]
+            return [None if np.isnan(v) else float(v) for v in values.tolist()]
+        return points.text(name)[rows].tolist()
+
+    plant_id = [None if v is None else int(v) for v in column("Plant ID", True)]
+    attributes = zip(
+        plant_id,
+        column("Generator ID"),
+        column("Plant Name"),
+        column("Plant State"),
+        column("Latitude", True),
+        column("Longitude", True),
+        points.capacity[rows].tolist(),
+        reason_text(reasons[rows]),
+    )
+    x, y = points.x[rows].tolist(), points.y[rows].tolist()
+    geometries = [
+        point_wkb(x, y) if np.isfinite(x) and np.isfinite(y) else None
+        for x, y in zip(x, y)
+    ]
+    return attributes, geometries, zip(x, x, y, y)
+
+
+@traced
+def quarantine_points(
+    points: GeneratorPoints,
+    state_index: Optional[PolygonIndex] = None,
+    quarantine_path: str = QUARANTINE_GPKG,
+    grid: HexGrid = conus_grid,
+) -> GeneratorPoints:
+    # Drops the points that fail validate_points, and writes them with their
+    # reasons to the quarantine layer. The state check runs when there's a
+    # state index.
+    return points.take(quarantine_rows_kept(points, state_index, quarantine_path, grid))
+
+
+def quarantine_rows_kept(
+    points: GeneratorPoints,
+    state_index: Optional[PolygonIndex] = None,
+    quarantine_path: str = QUARANTINE_GPKG,
+    grid: HexGrid = conus_grid,
+) -> np.ndarray:
+    # quarantine_points, returning the rows that pass instead
+    if state_index is None:
+        print("No state polygons: generators aren't checked against Plant State")
+    elif "Plant State" not in points.columns:
+        print("No Plant State field: generators aren't checked against their state")
+    reasons = validate_points(points, grid, state_index)
+    failed = np.flatnonzero(reasons)
+    with GpkgWriter(quarantine_path) as writer:
+        rows, geometries, envelopes = quarantine_rows(points, reasons)
+        writer.write_layer(
+            "quarantined_generators",
+            quarantine_fields,
+            rows,
+            geometries,
+            geometry_type="POINT",
+            envelopes=envelopes,
+        )
+    if len(failed):
+        counts = {}
+        for reason in reason_text(reasons[failed]):
+            counts[reason] = counts.get(reason, 0) + 1
+        print(
+            f"{len(failed)} generators quarantined in {quarantine_path}: "
+            + ", ".join(f"{count} {reason}" for reason, count in counts.items())
+        )
+    return np.flatnonzero(reasons == 0)